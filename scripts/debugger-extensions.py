@@ -21,8 +21,16 @@ CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE."""
 
+import os
+import threading
+import Queue
 import wingapi
 
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
 # Scripts can be internationalize with gettext.  Strings to be translated
 # are sent to _() as in the code below.
 import gettext
@@ -32,32 +40,292 @@ _ = gettext.translation('scripts_debugger_extensions', fallback = 1).ugettext
 # also docstrings for the commands found here
 _i18n_module = 'scripts_debugger_extensions'
 
-def set_breaks_from_markers(app=wingapi.kArgApplication):
-  """Scan current file for markers in the form %BP% and places breakpoints on
-  all lines where those markers are found. A conditional breakpoint can be set
-  if a condition follows the marker, for example %BP%:x > 10. Removes all old
-  breakpoints first."""
+######################################################################
+# Breakpoints from markers in the source
 
-  kTagFormat = '%BP%'
-  
-  editor = app.GetActiveEditor()
-  doc = editor.GetDocument()
-  filename = doc.GetFilename()
-  
-  debug = app.GetDebugger()
-  runstate = debug.GetCurrentRunState()
+kMarker = '%BP%'
+
+# Number of threads used to read files when scanning for markers, and the
+# largest file that is scanned
+kScanThreads = 4
+kMaxScanFileSize = 4 * 1024 * 1024
+
+# Change this when the format of the saved marker index changes
+kMarkerIndexVersion = 1
+
+# Seconds to wait after the marker index changes before saving it, so
+# that a series of changes is written at once
+kMarkerIndexSaveDelay = 2.0
+
+def _find_markers(txt):
+  """Find the markers in the given text.  Returns a list of (lineno, cond)
+  with 1-based line numbers and the condition that follows the marker, or
+  None if there is none."""
   
-  runstate.ClearAllBreaks()
-  txt = doc.GetText()
-  lines = txt.splitlines()
-  for i, line in enumerate(lines):
-    pos = line.find(kTagFormat)
+  if kMarker not in txt:
+    return []
+  markers = []
+  for i, line in enumerate(txt.splitlines()):
+    pos = line.find(kMarker)
     if pos >= 0:
-      pos += len(kTagFormat)
+      pos += len(kMarker)
       if len(line) > pos and line[pos] == ':':
         cond = line[pos+1:].strip()
       else:
         cond = None
-      runstate.SetBreak(filename, i + 1, cond=cond)
+      markers.append((i + 1, cond))
+  return markers
+
+def _scan_files(filenames):
+  """Read the given files in worker threads and find the markers in each.
+  Returns a dict from filename to (mtime, size, markers).  Files that can't
+  be read are left out."""
+  
+  queue = Queue.Queue()
+  for filename in filenames:
+    queue.put(filename)
+  results = {}
+
+  def worker():
+    while True:
+      try:
+        filename = queue.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        st = os.stat(filename)
+        markers = []
+        if st.st_size <= kMaxScanFileSize:
+          f = open(filename, 'rb')
+          try:
+            markers = _find_markers(f.read())
+          finally:
+            f.close()
+      except (IOError, OSError):
+        continue
+      results[filename] = (st.st_mtime, st.st_size, markers)
+
+  threads = [threading.Thread(target=worker)
+             for i in range(min(kScanThreads, len(filenames)))]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return results
+
+class _CMarkerIndex:
+  """Index of the breakpoint markers in files, saved across sessions.
+  Files are scanned again only when their modification time or size
+  changes.  The index also remembers which breakpoints were set from
+  markers, so they can be updated without touching other breakpoints.
+  The lines of those breakpoints are moved along with edits to the file,
+  as the debugger moves the breakpoints themselves."""
+  
+  def __init__(self, filename):
+    self.fFilename = filename
+    self.fFiles = {}
+    self.fSynced = {}
+    self.fDirty = False
+    self.fSaveTimeoutId = None
+    data = self.__Load()
+    if data is not None:
+      self.fFiles, self.fSynced = data
+
+  def __Load(self):
+    try:
+      f = open(self.fFilename, 'rb')
+      try:
+        version, data = pickle.load(f)
+      finally:
+        f.close()
+    except Exception:
+      return None
+    if version != kMarkerIndexVersion:
+      return None
+    return data
+  
+  def Save(self):
+    """Write the index to disk if it changed.  Errors are ignored since the
+    index is only an optimization."""
+    
+    if not self.fDirty:
+      return
+    self.fDirty = False
+    tmpname = '%s.%i.tmp' % (self.fFilename, os.getpid())
+    try:
+      f = open(tmpname, 'wb')
+      try:
+        pickle.dump((kMarkerIndexVersion, (self.fFiles, self.fSynced)), f, 2)
+      finally:
+        f.close()
+      if os.name == 'nt' and os.path.exists(self.fFilename):
+        os.remove(self.fFilename)
+      os.rename(tmpname, self.fFilename)
+    except (IOError, OSError, pickle.PicklingError):
+      try:
+        os.remove(tmpname)
+      except OSError:
+        pass
+
+  def SaveLater(self):
+    """Save the index once no more changes are made for a while"""
+    
+    if self.fDirty and self.fSaveTimeoutId is None:
+      self.fSaveTimeoutId = wingapi.gApplication.InstallTimeout(
+        int(kMarkerIndexSaveDelay * 1000), self.__CB_Save)
+
+  def __CB_Save(self):
+    self.fSaveTimeoutId = None
+    self.Save()
+    return False
+
+  def Update(self, filenames):
+    """Scan those of the given files that have changed since they were
+    last scanned, and forget files that no longer exist"""
+    
+    stale = []
+    for filename in filenames:
+      try:
+        st = os.stat(filename)
+      except OSError:
+        if self.fFiles.pop(filename, None) is not None:
+          self.fDirty = True
+        continue
+      entry = self.fFiles.get(filename)
+      if entry is None or entry[:2] != (st.st_mtime, st.st_size):
+        stale.append(filename)
+    if stale:
+      self.fFiles.update(_scan_files(stale))
+      self.fDirty = True
       
-      
\ No newline at end of file
+  def GetMarkers(self, filename, doc=None):
+    """Get the markers in the given file as a list of (lineno, cond).  If
+    the file is open in a modified document, its markers are found in the
+    document's text instead."""
+    
+    if doc is not None and not doc.IsSavePoint():
+      return _find_markers(doc.GetText())
+    entry = self.fFiles.get(filename)
+    if entry is None:
+      return []
+    return entry[2]
+  
+  def GetFilenames(self):
+    """Get the files with markers or with breakpoints set from markers"""
+    
+    filenames = set(self.fSynced)
+    for filename, (mtime, size, markers) in self.fFiles.items():
+      if markers:
+        filenames.add(filename)
+    return filenames
+  
+  def IsSynced(self, filename):
+    return filename in self.fSynced
+    
+  def Sync(self, runstate, filename, markers):
+    """Replace the breakpoints set from markers in the given file with
+    breakpoints for the given markers"""
+    
+    if self.fSynced.get(filename, []) == markers:
+      return
+    for lineno, cond in self.fSynced.pop(filename, []):
+      runstate.ClearBreak(filename, lineno)
+    if markers:
+      for lineno, cond in markers:
+        runstate.SetBreak(filename, lineno, cond=cond)
+      self.fSynced[filename] = list(markers)
+    self.fDirty = True
+
+  def MoveLines(self, filename, edit_line, delta):
+    """Move the breakpoints set from markers in the given file after delta
+    lines were inserted (or removed if delta is negative) after the given
+    0-based line.  Breakpoints on removed lines are forgotten rather than
+    cleared later, since another breakpoint may be there by then."""
+    
+    synced = self.fSynced.get(filename)
+    if not synced:
+      return
+    moved = []
+    for lineno, cond in synced:
+      if lineno - 1 <= edit_line:
+        moved.append((lineno, cond))
+      elif lineno - 1 > edit_line - delta:
+        moved.append((lineno + delta, cond))
+    self.fSynced[filename] = moved
+    self.fDirty = True
+
+_gMarkerIndex = None
+
+def _get_marker_index():
+  global _gMarkerIndex
+  if _gMarkerIndex is None:
+    app = wingapi.gApplication
+    filename = os.path.join(app.GetUserSettingsDir(), 'breakpoint-markers')
+    _gMarkerIndex = _CMarkerIndex(filename)
+  return _gMarkerIndex
+
+def set_breaks_from_markers(app=wingapi.kArgApplication):
+  """Scan the project files and open files for markers in the form %BP% and
+  place breakpoints on all lines where those markers are found. A conditional
+  breakpoint can be set if a condition follows the marker, for example
+  %BP%:x > 10. Breakpoints set from markers that have since been removed
+  are cleared; other breakpoints are left alone."""
+
+  index = _get_marker_index()
+  docs = {}
+  for doc in app.GetOpenDocuments():
+    filename = doc.GetFilename()
+    if filename is not None:
+      docs[filename] = doc
+  
+  project_files = app.GetProject().GetAllFiles()
+  index.Update(set(project_files) | set(docs) | index.GetFilenames())
+
+  runstate = app.GetDebugger().GetCurrentRunState()
+  for filename in index.GetFilenames() | set(docs):
+    index.Sync(runstate, filename, index.GetMarkers(filename, docs.get(filename)))
+  index.Save()
+
+def _update_markers_after_save(filename):
+  """Scan a saved file again and update its breakpoints if they were set
+  from markers before"""
+  
+  index = _get_marker_index()
+  index.Update([filename])
+  if index.IsSynced(filename):
+    runstate = wingapi.gApplication.GetDebugger().GetCurrentRunState()
+    index.Sync(runstate, filename, index.GetMarkers(filename))
+  index.SaveLater()
+
+def _connect_document(doc):
+  def _on_modified(insert, pos, length, text, lines):
+    filename = doc.GetFilename()
+    if text is None or '\n' not in text or filename is None:
+      return
+    index = _get_marker_index()
+    if not index.IsSynced(filename):
+      return
+    delta = text.count('\n')
+    if not insert:
+      delta = -delta
+    index.MoveLines(filename, doc.GetLineNumberFromPosition(pos), delta)
+    index.SaveLater()
+  doc.Connect('modified', _on_modified)
+  
+  def _on_presave(filename, encoding):
+    # Ignore saving a copy to another location
+    if filename is not None or doc.GetFilename() is None:
+      return
+    # The file is written after this is called
+    saved_filename = doc.GetFilename()
+    def update():
+      _update_markers_after_save(saved_filename)
+    wingapi.gApplication.InstallTimeout(0, update)
+  doc.Connect('presave', _on_presave)
+
+def _init():
+  wingapi.gApplication.Connect('document-open', _connect_document)
+  for doc in wingapi.gApplication.GetOpenDocuments():
+    _connect_document(doc)
+
+_init()
@@ -34,6 +34,7 @@ Notes:
 """
 
 import os
+import sys
 import stat
 import wingapi
 
@@ -46,12 +47,134 @@ _ = gettext.translation('scripts_editor_extensions', fallback = 1).ugettext
 # also docstrings for the commands found here
 _i18n_module = 'scripts_editor_extensions'
 
+# Support code lives next to this script but is not a script itself
+_kScriptDir = os.path.dirname(os.path.abspath(__file__))
+if _kScriptDir not in sys.path:
+  sys.path.append(_kScriptDir)
+import sortsupport
+
 def _active_editor_exists():
   app = wingapi.gApplication
   editor = app.GetActiveEditor()
   return editor is not None
 
 
+########################################################################
+# Applying changes with minimal edits
+
+# Changed lines are matched up with difflib when there are no more than
+# this many of them; otherwise they are replaced as one block
+kMaxDiffLines = 5000
+
+def _common_prefix_len(a, b):
+  """Get the length of the common prefix of a and b"""
+  
+  lo = 0
+  hi = min(len(a), len(b))
+  while lo < hi:
+    mid = (lo + hi + 1) // 2
+    if a[:mid] == b[:mid]:
+      lo = mid
+    else:
+      hi = mid - 1
+  return lo
+
+def _common_suffix_len(a, b):
+  """Get the length of the common suffix of a and b"""
+  
+  lo = 0
+  hi = min(len(a), len(b))
+  while lo < hi:
+    mid = (lo + hi + 1) // 2
+    if a[len(a)-mid:] == b[len(b)-mid:]:
+      lo = mid
+    else:
+      hi = mid - 1
+  return lo
+
+def _trimmed_edit(start, old_txt, new_txt):
+  """Get the edit (start, end, txt) that changes old_txt at offset start to
+  new_txt, without the characters they have in common at either end"""
+  
+  prefix = _common_prefix_len(old_txt, new_txt)
+  suffix = _common_suffix_len(old_txt[prefix:], new_txt[prefix:])
+  return (start + prefix, start + len(old_txt) - suffix,
+          new_txt[prefix:len(new_txt)-suffix])
+
+def _find_edits(old_txt, new_txt):
+  """Find the edits that change old_txt to new_txt, as a list of (start,
+  end, txt) in increasing order where start and end are offsets in old_txt.
+  Unchanged lines are not touched and changed lines are trimmed to the
+  characters that differ."""
+  
+  if old_txt == new_txt:
+    return []
+  
+  old_lines = old_txt.splitlines(True)
+  new_lines = new_txt.splitlines(True)
+  offsets = [0]
+  for line in old_lines:
+    offsets.append(offsets[-1] + len(line))
+
+  # Pairs of (old_first, old_last, new_first, new_last) line ranges to change
+  if len(old_lines) == len(new_lines):
+    blocks = [(i, i+1, i, i+1) for i in range(len(old_lines))
+              if old_lines[i] != new_lines[i]]
+  else:
+    first = 0
+    while (first < min(len(old_lines), len(new_lines)) and
+           old_lines[first] == new_lines[first]):
+      first += 1
+    old_last = len(old_lines)
+    new_last = len(new_lines)
+    while (old_last > first and new_last > first and
+           old_lines[old_last-1] == new_lines[new_last-1]):
+      old_last -= 1
+      new_last -= 1
+    if old_last - first + new_last - first <= kMaxDiffLines:
+      import difflib
+      matcher = difflib.SequenceMatcher(None, old_lines[first:old_last],
+                                        new_lines[first:new_last], False)
+      blocks = []
+      for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+          continue
+        if i2 - i1 == j2 - j1:
+          blocks.extend([(first+i1+k, first+i1+k+1, first+j1+k, first+j1+k+1)
+                         for k in range(i2 - i1)])
+        else:
+          blocks.append((first+i1, first+i2, first+j1, first+j2))
+    else:
+      blocks = [(first, old_last, first, new_last)]
+
+  edits = []
+  for old_first, old_last, new_first, new_last in blocks:
+    edits.append(_trimmed_edit(offsets[old_first],
+                               ''.join(old_lines[old_first:old_last]),
+                               ''.join(new_lines[new_first:new_last])))
+  return edits
+
+def _apply_changes(doc, start, old_txt, new_txt):
+  """Change the text old_txt at start in the document to new_txt as one
+  undo action, editing only the parts that differ so that markers, folds
+  and breakpoints elsewhere are kept.  Returns the number of edits."""
+  
+  edits = _find_edits(old_txt, new_txt)
+  if not edits:
+    return 0
+  doc.BeginUndoAction()
+  try:
+    # Edit from the end so the positions of earlier edits are unchanged
+    for edit_start, edit_end, txt in reversed(edits):
+      if edit_end > edit_start:
+        doc.DeleteChars(start + edit_start, start + edit_end - 1)
+      if txt:
+        doc.InsertChars(start + edit_start, txt)
+  finally:
+    doc.EndUndoAction()
+  return len(edits)
+
+
 ########################################################################
 # Editing commands
 
@@ -93,6 +216,7 @@ def comment_block_toggle():
   line_end = min(line_end, doc.GetLength() - len(eol))
 
   txt = doc.GetCharRange(line_start, line_end)
+  old_txt = doc.GetCharRange(line_start, line_end + 1)
   txt2 = []
   if txt.startswith('##'):
     for line in txt.split(eol):
@@ -106,12 +230,7 @@ def comment_block_toggle():
       txt2.append(line)
   txt2 = eol.join(txt2) + eol
 
-  doc.BeginUndoAction()
-  try:
-    doc.DeleteChars(line_start, line_end)
-    doc.InsertChars(line_start, txt2)
-  finally:
-    doc.EndUndoAction()
+  _apply_changes(doc, line_start, old_txt, txt2)
 
 comment_block_toggle.available = _active_editor_exists
 
@@ -135,9 +254,8 @@ def _transform_selection(editor, xform):
       end, dummy = editor.GetSelection()
     txt = doc.GetCharRange(start, end)
     new_txt = xform(txt)
-    if new_txt != txt:
-        doc.DeleteChars(start, end-1)
-        doc.InsertChars(start, new_txt)
+    _apply_changes(doc, start, txt, new_txt)
+    end = start + len(new_txt)
   finally:
     doc.EndUndoAction()
   if with_selection:
@@ -178,30 +296,45 @@ def under_to_hyphen(editor=wingapi.kArgEditor):
     return x.replace('_', '-')
   _transform_selection(editor, xform)
 
-def sort_selected(app=wingapi.kArgApplication):
-  """Sort selected lines of text alphabetically"""
+def sort_selected(app=wingapi.kArgApplication, mode='plain', field=0,
+                  separator=None, column=0, unique=False, reverse=False):
+  """Sort the selected lines of text.  The mode is 'plain' to sort
+  alphabetically, 'natural' to compare runs of digits as numbers, or
+  'nocase' to ignore case.  Lines are compared by the given 1-based field,
+  split on separator or on whitespace, or by the whole line if field is 0,
+  ignoring characters before column.  Set unique to keep only the first of
+  the lines that compare equal and reverse to sort in descending order."""
 
   editor = app.GetActiveEditor()
   doc = editor.GetDocument()
   eol = editor.GetEol()
   start, end = editor.GetSelection()
 
+  # Sort whole lines, not including the line the selection ends at the
+  # start of
   start_lineno = doc.GetLineNumberFromPosition(start)
   end_lineno = doc.GetLineNumberFromPosition(end)
-
-  line_start = doc.GetLineStart(start_lineno)
-  line_end = doc.GetLineEnd(end_lineno)
-
-  text = doc.GetCharRange(start, end).split(eol)
-  text.sort()
-
-  doc.BeginUndoAction()
-  try:
-    doc.DeleteChars(start, end-1)
-    doc.InsertChars(start, eol.join(text))
-  finally:
-    doc.EndUndoAction()
-  editor.SetSelection(start, end)
+  if end > start and end_lineno > start_lineno and end == doc.GetLineStart(end_lineno):
+    end_lineno -= 1
+  start = doc.GetLineStart(start_lineno)
+  if end_lineno + 1 < doc.GetLineCount():
+    end = doc.GetLineStart(end_lineno + 1)
+  else:
+    end = doc.GetLength()
+
+  old_txt = doc.GetCharRange(start, end)
+  lines = _kLineEndExpr.split(old_txt)
+  trailing_eol = len(lines) > 1 and lines[-1] == ''
+  if trailing_eol:
+    lines.pop()
+  key = sortsupport.make_key(mode, int(field), separator or None, int(column))
+  lines = sortsupport.sort_lines(lines, key, reverse, unique)
+  new_txt = eol.join(lines)
+  if trailing_eol:
+    new_txt += eol
+
+  _apply_changes(doc, start, old_txt, new_txt)
+  editor.SetSelection(start, start + len(new_txt))
 
 def copy_filename_to_clipboard(fn=wingapi.kArgFilename):
   if fn:
@@ -248,75 +381,488 @@ vs_tab.available = _vs_tab_available
 ########################################################################
 # Line ending conversion commands
 
-def _buffer_convert(app, filter):
-  editor = app.GetActiveEditor()
-  doc = editor.GetDocument()
-  txt = doc.GetText()
-  txt = filter(txt)
-  state = editor.GetVisualState()
-  doc.BeginUndoAction()
+import re
+
+# Documents are scanned this many characters at a time, so large
+# documents don't need several copies of their text in memory.  Each
+# range of line endings converted is at most about this long, so no
+# single change copies much of the document.  All the changes are made in
+# one undo action so the conversion is undone at once.
+kConvertChunkSize = 1024 * 1024
+
+# Nearby line endings that need converting are converted together if
+# they are no further apart than this
+kConvertMergeGap = 4096
+
+# Unmodified files larger than this are converted on disk and reloaded,
+# which can't be undone in the editor
+kConvertOnDiskSize = 32 * 1024 * 1024
+
+_kLineEndExpr = re.compile('\r\n|\r|\n')
+
+# Matches the line endings that differ from the given line ending
+_kOtherLineEndExprs = {
+  '\r\n': re.compile('\r(?!\n)|(?<!\r)\n'),
+  '\n': re.compile('\r\n?'),
+  '\r': re.compile('\r?\n'),
+}
+
+_kLineEndNames = {
+  '\r\n': 'CR + LF',
+  '\n': 'LF',
+  '\r': 'CR',
+}
+
+def _count_line_ends(txt, counts):
+  """Add the number of each kind of line ending in txt to counts"""
+  
+  crlf = txt.count('\r\n')
+  counts['\r\n'] += crlf
+  counts['\r'] += txt.count('\r') - crlf
+  counts['\n'] += txt.count('\n') - crlf
+
+def _find_line_ends_to_convert(doc, eol):
+  """Find the parts of the document with line endings other than eol.
+  Returns (counts, ranges) where counts is the number of each kind of
+  line ending in the document and ranges is a list of (start, end) of the
+  parts to convert, each at most about one chunk long."""
+  
+  counts = {'\r\n': 0, '\r': 0, '\n': 0}
+  ranges = []
+  other_expr = _kOtherLineEndExprs[eol]
+  length = doc.GetLength()
+  pos = 0
+  while pos < length:
+    end = min(length, pos + kConvertChunkSize)
+    chunk = doc.GetCharRange(pos, end)
+    # Don't split a CR + LF between chunks
+    if (chunk.endswith('\r') and end < length and
+        doc.GetCharRange(end, end + 1) == '\n'):
+      end += 1
+      chunk += '\n'
+    chunk_counts = {'\r\n': 0, '\r': 0, '\n': 0}
+    _count_line_ends(chunk, chunk_counts)
+    for kind, count in chunk_counts.items():
+      counts[kind] += count
+    if sum(chunk_counts.values()) > chunk_counts[eol]:
+      for m in other_expr.finditer(chunk):
+        start = pos + m.start()
+        stop = pos + m.end()
+        if (ranges and start - ranges[-1][1] <= kConvertMergeGap and
+            stop - ranges[-1][0] <= kConvertChunkSize):
+          ranges[-1] = (ranges[-1][0], stop)
+        else:
+          ranges.append((start, stop))
+    pos = end
+  return counts, ranges
+
+def _convert_file_line_ends(filename, eol, counts):
+  """Convert the line endings in the given file on disk, reading and
+  writing one chunk at a time.  Adds the number of each kind of line
+  ending found to counts.  Returns False if the file can't be converted
+  this way because it doesn't use an ASCII-compatible encoding."""
+  
+  tmpname = '%s.%i.tmp' % (filename, os.getpid())
+  converted = False
+  infile = open(filename, 'rb')
   try:
-    doc.SetText(txt)
-    editor.SetVisualState(state)
+    outfile = open(tmpname, 'wb')
+    try:
+      pending = ''
+      while True:
+        chunk = infile.read(kConvertChunkSize)
+        if not chunk:
+          converted = True
+          break
+        if '\0' in chunk:
+          break
+        chunk = pending + chunk
+        pending = ''
+        if chunk.endswith('\r'):
+          pending = '\r'
+          chunk = chunk[:-1]
+        _count_line_ends(chunk, counts)
+        outfile.write(_kLineEndExpr.sub(eol, chunk))
+      if converted and pending:
+        _count_line_ends(pending, counts)
+        outfile.write(eol)
+    finally:
+      outfile.close()
+      if not converted:
+        os.remove(tmpname)
   finally:
-    doc.EndUndoAction()
+    infile.close()
+  if not converted:
+    return False
+  
+  import shutil
+  shutil.copymode(filename, tmpname)
+  if os.name == 'nt':
+    os.remove(filename)
+  os.rename(tmpname, filename)
+  return True
+
+def _buffer_convert(app, eol):
+  """Convert the line endings in the current editor to eol.  Only the
+  parts of the document with other line endings are changed, and the
+  number of each kind of line ending found is shown in the status area."""
+  
+  editor = app.GetActiveEditor()
+  doc = editor.GetDocument()
+  counts = {'\r\n': 0, '\r': 0, '\n': 0}
+  
+  # Convert large unmodified files on disk and reload them
+  filename = doc.GetFilename()
+  converted = False
+  if (filename is not None and doc.IsSavePoint() and os.path.isfile(filename) and
+      os.path.getsize(filename) > kConvertOnDiskSize):
+    converted = _convert_file_line_ends(filename, eol, counts)
+    if converted:
+      app.ExecuteCommand('revert-to-disk')
+      
+  if not converted:
+    counts, ranges = _find_line_ends_to_convert(doc, eol)
+    if ranges:
+      state = editor.GetVisualState()
+      doc.BeginUndoAction()
+      try:
+        # Convert from the end so the positions of earlier ranges are
+        # unchanged
+        for start, end in reversed(ranges):
+          txt = _kLineEndExpr.sub(eol, doc.GetCharRange(start, end))
+          doc.DeleteChars(start, end - 1)
+          doc.InsertChars(start, txt)
+        editor.SetVisualState(state)
+      finally:
+        doc.EndUndoAction()
+  
+  total = counts['\r\n'] + counts['\r'] + counts['\n']
+  if converted:
+    msg = _("Converted %i of %i line endings to %s on disk, which cannot be undone "
+            "(found %i CR + LF, %i LF, %i CR)")
+  else:
+    msg = _("Converted %i of %i line endings to %s (found %i CR + LF, %i LF, %i CR)")
+  app.SetStatusMessage(msg % (total - counts[eol], total, _kLineEndNames[eol],
+                              counts['\r\n'], counts['\n'], counts['\r']))
 
 def convert_to_crlf_lineends(app=wingapi.kArgApplication):
   """Convert the current editor to use CR + LF style line endings"""
 
-  def filter(txt):
-    return '\r\n'.join(txt.splitlines())
-  _buffer_convert(app, filter)
+  _buffer_convert(app, '\r\n')
 
 def convert_to_cr_lineends(app=wingapi.kArgApplication):
   """Convert the current editor to use CR style line endings"""
 
-  def filter(txt):
-    return '\r'.join(txt.splitlines())
-  _buffer_convert(app, filter)
+  _buffer_convert(app, '\r')
 
 def convert_to_lf_lineends(app=wingapi.kArgApplication):
   """Convert the current editor to use LF style line endings"""
 
-  def filter(txt):
-    return '\n'.join(txt.splitlines())
-  _buffer_convert(app, filter)
+  _buffer_convert(app, '\n')
 
 ######################################################################
 # Code folding utilities
 
+import bisect
+import tokenize
+from StringIO import StringIO
+
+# Rebuild the outline from scratch rather than updating it when more than
+# this many edits were made since it was last used
+kMaxOutlineEdits = 50
+
+def _parse_outline(txt, first_line=0, partial=False):
+  """Find the classes and defs in the given Python code with the tokenizer.
+  Returns (entries, toplevel) where entries is a list of (start, header,
+  end, kind, in_class) for each class or def, with the line numbers of
+  its first decorator (or header), its header, and its last line, kind
+  'class' or 'def', and whether it is inside a class.  toplevel is the
+  list of lines on which top level statements start.  Line numbers are
+  0-based and offset by first_line.  Raises tokenize.TokenError or
+  IndentationError if the code is incomplete, which for partial code
+  includes ending with a decorator."""
+  
+  entries = []
+  toplevel = []
+  # Open entries as [start, header, end, kind, in_class, depth]
+  stack = []
+  pending = None
+  depth = 0
+  last_line = first_line
+  new_statement = True
+  decorator_start = None
+  
+  readline = StringIO(txt).readline
+  for toktype, tokstr, (srow, scol), (erow, ecol), line in tokenize.generate_tokens(readline):
+    if toktype == tokenize.INDENT:
+      depth += 1
+      if pending is not None:
+        stack.append(pending)
+        pending = None
+      continue
+    if toktype == tokenize.DEDENT:
+      depth -= 1
+      while stack and stack[-1][5] >= depth:
+        entry = stack.pop()
+        entry[2] = last_line
+        entries.append(tuple(entry[:5]))
+      continue
+    if toktype in (tokenize.NL, tokenize.COMMENT):
+      continue
+    if toktype == tokenize.NEWLINE:
+      new_statement = True
+      last_line = first_line + erow - 1
+      continue
+    if toktype == tokenize.ENDMARKER:
+      if partial and decorator_start is not None:
+        raise tokenize.TokenError("EOF in decorated definition", (srow, scol))
+      break
+    
+    if not new_statement:
+      continue
+    new_statement = False
+    if pending is not None:
+      # A class or def whose body is on the same line
+      pending[2] = last_line
+      entries.append(tuple(pending[:5]))
+      pending = None
+    row = first_line + srow - 1
+    if depth == 0 and decorator_start is None:
+      toplevel.append(row)
+    if toktype == tokenize.OP and tokstr == '@':
+      if decorator_start is None:
+        decorator_start = row
+    elif toktype == tokenize.NAME and tokstr in ('class', 'def'):
+      in_class = len([e for e in stack if e[3] == 'class']) > 0
+      start = row
+      if decorator_start is not None:
+        start = decorator_start
+      pending = [start, row, row, tokstr, in_class, depth]
+      decorator_start = None
+    else:
+      decorator_start = None
+      
+  if pending is not None:
+    pending[2] = last_line
+    entries.append(tuple(pending[:5]))
+  for entry in stack:
+    entry[2] = last_line
+    entries.append(tuple(entry[:5]))
+  entries.sort()
+  return entries, toplevel
+
+_kDefExpr = re.compile(r'(class|def)\b')
+
+def _outline_from_indents(txt):
+  """Find the classes and defs in the given Python code from the indents
+  of its lines, for code that can't be tokenized, as often happens while
+  typing.  Returns entries as for _parse_outline, which can be wrong if
+  multi-line strings or bracketed expressions are indented less than the
+  code around them."""
+  
+  entries = []
+  # Open entries as [start, header, end, kind, in_class, indent]
+  stack = []
+  last_line = 0
+  decorator_start = None
+  for row, line in enumerate(txt.split('\n')):
+    stripped = line.lstrip()
+    if not stripped.strip() or stripped[0] == '#':
+      continue
+    indent = len(line[:len(line) - len(stripped)].expandtabs())
+    while stack and stack[-1][5] >= indent:
+      entry = stack.pop()
+      entry[2] = last_line
+      entries.append(tuple(entry[:5]))
+    m = _kDefExpr.match(stripped)
+    if stripped[0] == '@':
+      if decorator_start is None:
+        decorator_start = row
+    elif m is not None:
+      in_class = len([e for e in stack if e[3] == 'class']) > 0
+      start = row
+      if decorator_start is not None:
+        start = decorator_start
+      stack.append([start, row, row, m.group(1), in_class, indent])
+      decorator_start = None
+    else:
+      decorator_start = None
+    last_line = row
+    
+  for entry in stack:
+    entry[2] = last_line
+    entries.append(tuple(entry[:5]))
+  entries.sort()
+  return entries
+
+def _shift_line(line, edit_line, delta):
+  """Get the new number of the given line after delta lines were inserted
+  (or removed if delta is negative) after edit_line"""
+  
+  if line <= edit_line:
+    return line
+  return max(edit_line, line + delta)
+
+class _CPythonOutline:
+  """The classes and defs in a Python document, with their spans.  Edits
+  are recorded as they are made, and when the outline is next used only
+  the top level statements that changed are tokenized again."""
+  
+  def __init__(self, doc):
+    self.fDoc = doc
+    self.fEntries = None
+    self.fTopLevel = None
+    self.fEdits = []
+    doc.Connect('modified', self.__CB_Modified)
+    
+  def __CB_Modified(self, insert, pos, length, text, lines):
+    if self.fEntries is None:
+      return
+    if text is None or len(self.fEdits) >= kMaxOutlineEdits:
+      self.fEntries = None
+      return
+    line = self.fDoc.GetLineNumberFromPosition(pos)
+    count = text.count('\n')
+    if not insert:
+      count = -count
+    self.fEdits.append((line, count))
+
+  def __Rebuild(self):
+    """Find the classes and defs in the whole document.  Returns the
+    entries.  If the code is incomplete, they are found from the indents
+    instead and not kept, so the next use tokenizes the code again."""
+    
+    self.fEdits = []
+    txt = self.fDoc.GetText()
+    try:
+      self.fEntries, self.fTopLevel = _parse_outline(txt)
+    except (tokenize.TokenError, IndentationError):
+      self.fEntries = self.fTopLevel = None
+      return _outline_from_indents(txt)
+    return self.fEntries
+  
+  def __Update(self):
+    """Bring the outline up to date with the recorded edits.  Returns False
+    if it can't be updated incrementally."""
+    
+    entries = self.fEntries
+    toplevel = self.fTopLevel
+    first = None
+    last = None
+    for edit_line, delta in self.fEdits:
+      entries = [(_shift_line(start, edit_line, delta), _shift_line(header, edit_line, delta),
+                  _shift_line(end, edit_line, delta), kind, in_class)
+                 for start, header, end, kind, in_class in entries]
+      # Statements on removed lines no longer start there
+      toplevel = [_shift_line(line, edit_line, delta) for line in toplevel
+                  if not edit_line < line <= edit_line - delta]
+      if first is None:
+        first = last = edit_line
+      else:
+        first = min(first, edit_line)
+        last = _shift_line(last, edit_line, delta)
+      last = max(last, edit_line + max(delta, 0))
+    self.fEdits = []
+    
+    # Tokenize the top level statements from the one before the one
+    # containing the first changed line, whose end may have changed, up
+    # to the one after the last changed line
+    doc = self.fDoc
+    line_count = doc.GetLineCount()
+    i = bisect.bisect_right(toplevel, first) - 2
+    if i < 0:
+      region_start = 0
+    else:
+      region_start = toplevel[i]
+    j = bisect.bisect_right(toplevel, last)
+    if j < len(toplevel) and toplevel[j] < line_count:
+      region_end = toplevel[j]
+      end_pos = doc.GetLineStart(region_end)
+      line = doc.GetCharRange(end_pos, doc.GetLineEnd(region_end))
+      if not line[:1].strip() or line[:1] == '#':
+        return False
+    else:
+      region_end = line_count
+      end_pos = doc.GetLength()
+    txt = doc.GetCharRange(doc.GetLineStart(region_start), end_pos)
+    try:
+      new_entries, new_toplevel = _parse_outline(txt, region_start, partial=True)
+    except (tokenize.TokenError, IndentationError):
+      return False
+    
+    # Splice the new entries in place of those in the region
+    self.fEntries = ([e for e in entries if e[0] < region_start] + new_entries +
+                     [e for e in entries if e[0] >= region_end])
+    self.fTopLevel = ([l for l in toplevel if l < region_start] + new_toplevel +
+                      [l for l in toplevel if l >= region_end])
+    return True
+    
+  def GetEntries(self):
+    """Get (start, header, end, kind, in_class) for each class and def,
+    sorted by line.  See _parse_outline."""
+    
+    if self.fEntries is None or (self.fEdits and not self.__Update()):
+      return self.__Rebuild()
+    return self.fEntries
+  
+  def GetFoldCallback(self, action_cb):
+    """Get a callback for editor.FoldUnfold that returns action_cb(entry)
+    for the header line of each class or def and -1 for all other fold
+    points"""
+    
+    actions = {}
+    headers = {}
+    for entry in self.GetEntries():
+      start, header, end, kind, in_class = entry
+      if end > header:
+        actions[header] = action_cb(entry)
+    lines = actions.keys()
+    lines.sort()
+    for line in lines:
+      txt = self.fDoc.GetCharRange(self.fDoc.GetLineStart(line),
+                                   self.fDoc.GetLineEnd(line)).strip()
+      headers.setdefault(txt, []).append(line)
+    
+    # Fold points are visited in order, so the text of a header line
+    # identifies it if the callback isn't given the line number
+    state = [-1]
+    def callback(line):
+      if isinstance(line, int):
+        return actions.get(line, -1)
+      for header in headers.get(line.strip(), ()):
+        if header > state[0]:
+          state[0] = header
+          return actions[header]
+      return -1
+    return callback
+
+_gOutlines = {}
+
+def _get_outline(editor):
+  """Get the outline for the given editor's document"""
+  
+  doc = editor.GetDocument()
+  outline = _gOutlines.get(doc)
+  if outline is None:
+    outline = _gOutlines[doc] = _CPythonOutline(doc)
+    def destroy(*args):
+      _gOutlines.pop(doc, None)
+    doc.Connect('destroy', destroy)
+  return outline
+
 def fold_python_methods():
   """Fold up all Python methods, expand all classes, and leave other fold
   points alone"""
 
   editor = wingapi.gApplication.GetActiveEditor()
 
-  def _leading_space(line):
-    return line[:len(line)-len(line.lstrip())]
-  def _indent_size(line):
-    indent = _leading_space(line)
-    indent = indent.replace('\t', ' ' * 8)
-    return len(indent)
-
-  class_indents = []
-  def _fold_methods(line):
-    lstrip = line.lstrip()
-    if len(lstrip) > 0 and not lstrip.startswith('#'):
-      isize = _indent_size(line)
-      while len(class_indents) > 0 and class_indents[-1] >= isize:
-        class_indents.pop()
-    if lstrip.startswith('class '):
-      class_indents.append(isize)
-      return 1
-    elif lstrip.startswith('def '):
-      if len(class_indents) == 0:
-        return 1
-      else:
-        return 0
-    else:
-      return -1
+  def _fold_methods(entry):
+    start, header, end, kind, in_class = entry
+    if kind == 'def' and in_class:
+      return 0
+    return 1
 
-  folded, expanded = editor.FoldUnfold(_fold_methods)
+  folded, expanded = editor.FoldUnfold(_get_outline(editor).GetFoldCallback(_fold_methods))
   return folded, expanded
 
 def _folding_available():
@@ -330,14 +876,13 @@ def fold_python_classes():
 
   editor = wingapi.gApplication.GetActiveEditor()
 
-  def _fold_classes(line):
-    lstrip = line.lstrip()
-    if lstrip.startswith('class '):
+  def _fold_classes(entry):
+    start, header, end, kind, in_class = entry
+    if kind == 'class':
       return 0
-    else:
-      return -1
+    return -1
 
-  folded, expanded = editor.FoldUnfold(_fold_classes)
+  folded, expanded = editor.FoldUnfold(_get_outline(editor).GetFoldCallback(_fold_classes))
   return folded, expanded
 
 fold_python_classes.available = _folding_available
@@ -348,14 +893,10 @@ def fold_python_classes_and_defs():
 
   editor = wingapi.gApplication.GetActiveEditor()
 
-  def _fold_classes(line):
-    lstrip = line.lstrip()
-    if lstrip.startswith('class ') or lstrip.startswith('def '):
-      return 0
-    else:
-      return -1
+  def _fold_classes(entry):
+    return 0
 
-  folded, expanded = editor.FoldUnfold(_fold_classes)
+  folded, expanded = editor.FoldUnfold(_get_outline(editor).GetFoldCallback(_fold_classes))
   return folded, expanded
 
 fold_python_classes_and_defs.available = _folding_available
@@ -602,13 +1143,279 @@ def _init2():
 #_init2()
 
 # Example of using arginfo to provide word list driven autocompletion
-# via a script
+# via a script.  The words are kept in an index that is updated as
+# documents change, so completing doesn't need to scan the document.
+
+# Set this to True to also complete words found in the project's files
+kIndexProjectFiles = False
+
+# Maximum size of project files to index, and the number of project files
+# indexed per idle callback
+kMaxIndexedFileSize = 1024 * 1024
+kIndexFilesPerCallback = 10
+
+# Words within this many characters of the cursor are offered first,
+# nearest first
+kNearbyChars = 10000
+
+# Maximum number of words offered as completions
+kMaxCompletions = 500
+
+# Characters that make up a word
+_kWordChars = re.escape(unicode(string.letters + string.digits + '_'))
+_kWordExpr = re.compile(u'[%s]+' % _kWordChars)
+_kLeadingWordExpr = re.compile(u'[%s]*' % _kWordChars)
+_kTrailingWordExpr = re.compile(u'[%s]*\\Z' % _kWordChars)
+
+def _count_words(txt, counts, sign=1):
+  """Add the number of occurrences of each word in txt to counts, or
+  subtract them if sign is -1"""
+  
+  for word in _kWordExpr.findall(txt):
+    counts[word] = counts.get(word, 0) + sign
+
+def _extend_to_words(doc, start, end):
+  """Extend the given range of the document to the start and end of the
+  words at its ends"""
+  
+  chunk_size = 64
+  while start > 0:
+    chunk_start = max(0, start - chunk_size)
+    chunk = doc.GetCharRange(chunk_start, start)
+    word_start = _kTrailingWordExpr.search(chunk).start()
+    start = chunk_start + word_start
+    if word_start > 0:
+      break
+  length = doc.GetLength()
+  while end < length:
+    chunk_end = min(length, end + chunk_size)
+    chunk = doc.GetCharRange(end, chunk_end)
+    word_end = _kLeadingWordExpr.match(chunk).end()
+    end += word_end
+    if word_end < len(chunk):
+      break
+  return start, end
+
+class _CWordIndex:
+  """Counts of the words in all open documents and optionally the project's
+  files.  Documents are counted in full once and then kept up to date by
+  recounting only the words around each change.  All the words are also
+  kept in a sorted list, so words with a given prefix can be found with
+  a binary search."""
+  
+  def __init__(self):
+    # Key is a document, or a filename for project files that aren't open
+    self.fCounts = {}
+    self.fTotals = {}
+    # Sorted words, including some that no longer occur
+    self.fSorted = []
+    self.fUnused = 0
+    self.fUnindexed = []
+    self.fPendingFiles = []
+    self.fFilesScheduled = False
+    
+    app = wingapi.gApplication
+    app.Connect('document-open', self.__CB_DocumentOpen)
+    for doc in app.GetOpenDocuments():
+      self.__CB_DocumentOpen(doc)
+    if kIndexProjectFiles:
+      self.fPendingFiles = list(app.GetProject().GetAllFiles())
+      self.__ScheduleFiles()
+
+  def __CB_DocumentOpen(self, doc):
+    self.fUnindexed.append(doc)
+    def modified(insert, pos, length, text, lines):
+      self.__CB_Modified(doc, insert, pos, length, text)
+    def destroy(*args):
+      self.__CB_Destroy(doc)
+    doc.Connect('modified', modified)
+    doc.Connect('destroy', destroy)
+    
+  def __CB_Modified(self, doc, insert, pos, length, text):
+    counts = self.fCounts.get(doc)
+    if counts is None:
+      return
+    if text is None:
+      self.__Remove(doc)
+      self.fUnindexed.append(doc)
+      return
+    
+    # Recount the words overlapping the change, before and after it
+    if insert:
+      start, end = _extend_to_words(doc, pos, pos + length)
+      new_txt = doc.GetCharRange(start, end)
+      old_txt = new_txt[:pos-start] + new_txt[pos+length-start:]
+    else:
+      start, end = _extend_to_words(doc, pos, pos)
+      new_txt = doc.GetCharRange(start, end)
+      old_txt = new_txt[:pos-start] + text + new_txt[pos-start:]
+    delta = {}
+    _count_words(old_txt, delta, -1)
+    _count_words(new_txt, delta)
+    self.__Apply(counts, delta)
+    
+  def __CB_Destroy(self, doc):
+    if doc in self.fUnindexed:
+      self.fUnindexed.remove(doc)
+    self.__Remove(doc)
+    filename = doc.GetFilename()
+    if kIndexProjectFiles and filename is not None and os.path.isfile(filename):
+      self.fPendingFiles.append(filename)
+      self.__ScheduleFiles()
+    
+  def __Apply(self, counts, delta):
+    totals = self.fTotals
+    new_words = []
+    for word, count in delta.items():
+      if count == 0:
+        continue
+      counts[word] = counts.get(word, 0) + count
+      if counts[word] <= 0:
+        del counts[word]
+      total = totals.get(word)
+      if total is None:
+        new_words.append(word)
+        total = 0
+      elif total == 0:
+        self.fUnused -= 1
+      totals[word] = total = total + count
+      if total <= 0:
+        totals[word] = 0
+        self.fUnused += 1
+        
+    # Sort all at once when many words are added, as when a document is
+    # first indexed
+    if len(new_words) > 100:
+      self.fSorted.extend(new_words)
+      self.fSorted.sort()
+    else:
+      for word in new_words:
+        bisect.insort(self.fSorted, word)
+    
+    # Drop words that no longer occur once there are many of them
+    if self.fUnused > 1000 and self.fUnused > len(self.fSorted) // 2:
+      for word in [w for w, c in totals.items() if c <= 0]:
+        del totals[word]
+      self.fSorted = sorted(totals.keys())
+      self.fUnused = 0
+    
+  def __Add(self, key, txt):
+    self.__Remove(key)
+    counts = self.fCounts[key] = {}
+    delta = {}
+    _count_words(txt, delta)
+    self.__Apply(counts, delta)
+    
+  def __Remove(self, key):
+    counts = self.fCounts.pop(key, None)
+    if counts:
+      delta = {}
+      for word, count in counts.items():
+        delta[word] = -count
+      self.__Apply({}, delta)
+    
+  def __ScheduleFiles(self):
+    if not self.fFilesScheduled and self.fPendingFiles:
+      self.fFilesScheduled = True
+      wingapi.gApplication.InstallTimeout(10, self.__CB_IndexFiles)
+    
+  def __CB_IndexFiles(self):
+    """Index some of the pending project files.  Files that are open are
+    counted from their documents instead."""
+    
+    open_files = {}
+    for doc in wingapi.gApplication.GetOpenDocuments():
+      open_files[doc.GetFilename()] = 1
+    for i in range(kIndexFilesPerCallback):
+      if not self.fPendingFiles:
+        break
+      filename = self.fPendingFiles.pop()
+      if filename in open_files:
+        continue
+      try:
+        if os.stat(filename).st_size > kMaxIndexedFileSize:
+          continue
+        f = open(filename, 'rb')
+        try:
+          txt = f.read()
+        finally:
+          f.close()
+      except (IOError, OSError):
+        continue
+      if '\0' in txt:
+        continue
+      self.__Add(filename, unicode(txt, 'utf-8', 'replace'))
+    self.fFilesScheduled = len(self.fPendingFiles) > 0
+    return self.fFilesScheduled
+    
+  def __IndexDocuments(self):
+    while self.fUnindexed:
+      doc = self.fUnindexed.pop()
+      self.__Remove(doc.GetFilename())
+      self.__Add(doc, doc.GetText())
+    
+  def Complete(self, prefix, doc=None, pos=None):
+    """Get the words starting with the given prefix, other than the prefix
+    itself.  Words near the given position in the given document are
+    first, nearest first, followed by other words, most frequent first."""
+    
+    self.__IndexDocuments()
+    sorted_words = self.fSorted
+    totals = self.fTotals
+    start = bisect.bisect_left(sorted_words, prefix)
+    end = start
+    matches = []
+    while end < len(sorted_words) and sorted_words[end].startswith(prefix):
+      word = sorted_words[end]
+      if totals[word] > 0 and word != prefix:
+        matches.append(word)
+      end += 1
+    
+    # Find the distance of nearby words from the cursor
+    distances = {}
+    if doc is not None and matches:
+      near_start = max(0, pos - kNearbyChars)
+      near_txt = doc.GetCharRange(near_start, min(doc.GetLength(), pos + kNearbyChars))
+      for m in _kWordExpr.finditer(near_txt):
+        distance = abs(near_start + m.start() - pos)
+        word = m.group()
+        if distance < distances.get(word, kNearbyChars + 1):
+          distances[word] = distance
+          
+    ranked = [(distances.get(word, kNearbyChars + 1), -totals[word], word)
+              for word in matches]
+    ranked.sort()
+    return [word for distance, count, word in ranked[:kMaxCompletions]]
+
+_gWordIndex = None
+
+def _get_word_index():
+  global _gWordIndex
+  if _gWordIndex is None:
+    _gWordIndex = _CWordIndex()
+  return _gWordIndex
+
+def _get_word_prefix(ed):
+  """Get the start of the word before the start of the selection, and the
+  part of it that is before the selection"""
+  
+  doc = ed.GetDocument()
+  start, end = ed.GetSelection()
+  line_start = doc.GetLineStart(doc.GetLineNumberFromPosition(start))
+  before = doc.GetCharRange(line_start, start)
+  word_start = _kTrailingWordExpr.search(before).start()
+  return line_start + word_start, before[word_start:]
   
 def word_list_completion(word):
-  """Provide simple word-list driven auto-completion on the current editor"""
+  """Provide simple word-list driven auto-completion on the current editor.
+  The selection and any part of the word before it that the given word
+  starts with are replaced."""
   ed = wingapi.gApplication.GetActiveEditor()
   start, end = ed.GetSelection()
   doc = wingapi.gApplication.GetActiveDocument()
+  word_start, prefix = _get_word_prefix(ed)
+  if prefix and word.startswith(prefix):
+    start = word_start
   doc.DeleteChars(start, end-1)
   doc.InsertChars(start, word)
   ed.SetSelection(start + len(word), start + len(word))
@@ -618,30 +1425,16 @@ def _ArgInfo_word_list_completion():
   from guiutils import formbuilder
   from command import commandmgr
 
-  doc = wingapi.gApplication.GetActiveDocument()
-  txt = doc.GetText()
-  
-  class CWordMap:
-    def __init__(self, chars):
-      self.chars = set(chars)
-    def __getitem__(self, char):
-      if unichr(char) in self.chars:
-        return char
-      else:
-        return u' '
-      
-  trans = CWordMap(unicode(string.letters + string.digits + '_'))
-  txt = txt.translate(trans)
-  
-  words = txt.split()
-  choices = set()
-  for word in words:
-    choices.add(word)
+  ed = wingapi.gApplication.GetActiveEditor()
+  choices = []
+  if ed is not None:
+    word_start, prefix = _get_word_prefix(ed)
+    choices = _get_word_index().Complete(prefix, ed.GetDocument(), word_start)
 
   arginfo = {
     'word': commandmgr.CArgInfo(
       _("Word"), datatype.CType(''),
-      formbuilder.CSmallTextGui(choices=list(choices)),
+      formbuilder.CSmallTextGui(choices=choices),
       _("Word:"), 'internal'
     )
   }
@@ -0,0 +1,571 @@
+"""Support code shared by the PyLint and PEP 8 panels.
+
+This module is imported by pylintpanel.py and pep8panel.py and does not
+define any commands itself.
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE."""
+
+# Not a script: Wing should not try to find commands in this module
+_ignore_scripts = 1
+
+import os
+import time
+import zlib
+
+######################################################################
+# Utilities
+
+def expand_python_files(filenames):
+  """Expand any package directories in the given list into the Python
+  files that they contain, including those in sub-packages"""
+  
+  python_files = []
+  for filename in filenames:
+    if not os.path.isdir(filename):
+      python_files.append(filename)
+      continue
+    for dirname, subdirs, fnames in os.walk(filename):
+      subdirs[:] = [d for d in subdirs 
+                    if os.path.exists(os.path.join(dirname, d, '__init__.py'))]
+      subdirs.sort()
+      fnames.sort()
+      for fname in fnames:
+        if fname.endswith('.py'):
+          python_files.append(os.path.join(dirname, fname))
+  return python_files
+
+def default_job_count():
+  """Get the number of jobs to run in parallel by default: one per CPU"""
+  
+  try:
+    import multiprocessing
+    return multiprocessing.cpu_count()
+  except (ImportError, NotImplementedError):
+    return 1
+
+######################################################################
+# Lint on save
+
+class CSaveLintScheduler:
+  """Runs a lint function on files after they are saved.  Saves that arrive
+  within the given delay (in seconds) of each other are collected into a
+  single run on only the saved files.  When a file is saved again while a
+  run that includes it is still in progress, that run is cancelled and its
+  files are linted again with the next batch.
+
+  The run_cb is called with a list of filenames and returns an object with
+  Cancel() and IsFinished() methods, or None if nothing was started."""
+
+  def __init__(self, run_cb, delay=0.5):
+    self.fRunCB = run_cb
+    self.fDelay = delay
+    self.fPending = []
+    self.fRunning = []
+    self.fDeadline = 0
+    self.fTimeoutId = None
+    self.fConnected = False
+
+  def Connect(self):
+    """Watch all open and subsequently opened documents for saves"""
+
+    import wingapi
+    if self.fConnected:
+      return
+    self.fConnected = True
+    app = wingapi.gApplication
+    app.Connect('document-open', self.__ConnectDocument)
+    for doc in app.GetOpenDocuments():
+      self.__ConnectDocument(doc)
+
+  def __ConnectDocument(self, doc):
+    def _on_presave(filename, encoding):
+      # Avoid operation when saving a copy to another location
+      if filename is not None:
+        return
+      self.FileSaved(doc.GetFilename())
+    doc.Connect('presave', _on_presave)
+
+  def FileSaved(self, filename):
+    """Note that the given file was saved and schedule linting it"""
+
+    # Cancel any running lint that is now out of date for this file
+    for filenames, run in list(self.fRunning):
+      if run.IsFinished():
+        self.fRunning.remove((filenames, run))
+      elif filename in filenames:
+        run.Cancel()
+        self.fRunning.remove((filenames, run))
+        self.__AddPending(filenames)
+
+    self.__AddPending([filename])
+    self.__Schedule()
+
+  def __AddPending(self, filenames):
+    for filename in filenames:
+      if filename not in self.fPending:
+        self.fPending.append(filename)
+
+  def __Schedule(self):
+    import wingapi
+    self.fDeadline = time.time() + self.fDelay
+    if self.fTimeoutId is None:
+      self.fTimeoutId = wingapi.gApplication.InstallTimeout(
+        int(self.fDelay * 1000), self.__CB_Timeout)
+
+  def __CB_Timeout(self):
+    import wingapi
+    remaining = self.fDeadline - time.time()
+    if remaining > 0:
+      # Another save arrived since the timeout was installed
+      self.fTimeoutId = wingapi.gApplication.InstallTimeout(
+        max(1, int(remaining * 1000)), self.__CB_Timeout)
+      return False
+
+    self.fTimeoutId = None
+    filenames = self.fPending
+    self.fPending = []
+    if filenames:
+      run = self.fRunCB(filenames)
+      if run is not None:
+        self.fRunning.append((filenames, run))
+    return False
+
+######################################################################
+# Message storage
+
+import array
+
+class CMessageStore:
+  """Compact storage for lint messages.  Each message is a row made of
+  integer columns: the file, line, column, message id and description are
+  stored as indices into tables of unique values, so repeated paths and
+  message texts are kept only once.  Display strings are formatted only
+  when a row is drawn.  Rows in each category are listed separately so
+  each category can be shown in its own tree.
+
+  Messages are also indexed by (file, message id, anchor), where the
+  anchor is a hash of the source line the message is on, so the same
+  message can be found in a later run even if its line number changed.
+  The rows for each file and the number of messages with each message id
+  are kept up to date as rows are added and removed."""
+
+  def __init__(self, category_count):
+    self.fCategoryCount = category_count
+    self.Clear()
+
+  def Clear(self):
+    """Remove all messages.  The row lists of the old contents are left
+    alone, so views still showing them are not affected."""
+
+    self.fPaths = []
+    self.fPathIndex = {}
+    self.fMsgIds = []
+    self.fMsgIdIndex = {}
+    self.fDescrs = []
+    self.fDescrIndex = {}
+
+    self.fPathCol = array.array('i')
+    self.fLineCol = array.array('i')
+    self.fColumnCol = array.array('i')
+    self.fMsgIdCol = array.array('i')
+    self.fDescrCol = array.array('i')
+    self.fCategoryCol = array.array('b')
+
+    self.fAnchorCol = array.array('i')
+
+    self.fCategoryRows = [array.array('i') for i in range(self.fCategoryCount)]
+    self.fKeyIndex = {}
+    self.fPathRows = {}
+    self.fMsgIdCounts = {}
+    self.fMsgIdDescrs = {}
+    self.fRemovedCount = 0
+    self.fHasColumns = False
+
+  def __Intern(self, value, values, index):
+    pos = index.get(value)
+    if pos is None:
+      pos = len(values)
+      values.append(value)
+      index[value] = pos
+    return pos
+
+  def Add(self, category, path, line, column, msgid, descr, anchor=0):
+    """Add a message and return its row number"""
+
+    row = len(self.fLineCol)
+    path_id = self.__Intern(path, self.fPaths, self.fPathIndex)
+    msgid_id = self.__Intern(msgid, self.fMsgIds, self.fMsgIdIndex)
+    self.fPathCol.append(path_id)
+    self.fLineCol.append(line)
+    self.fColumnCol.append(column)
+    self.fMsgIdCol.append(msgid_id)
+    descr_id = self.__Intern(descr, self.fDescrs, self.fDescrIndex)
+    self.fDescrCol.append(descr_id)
+    self.fCategoryCol.append(category)
+    self.fAnchorCol.append(anchor)
+    self.fCategoryRows[category].append(row)
+    self.fKeyIndex.setdefault((path_id, msgid_id, anchor), []).append(row)
+    self.fPathRows.setdefault(path_id, set()).add(row)
+    self.fMsgIdCounts[msgid_id] = self.fMsgIdCounts.get(msgid_id, 0) + 1
+    self.fMsgIdDescrs.setdefault(msgid_id, descr_id)
+    if column:
+      self.fHasColumns = True
+    return row
+
+  def FindRows(self, path, msgid, anchor):
+    """Get the rows for messages with given file, message id and anchor"""
+
+    path_id = self.fPathIndex.get(path)
+    msgid_id = self.fMsgIdIndex.get(msgid)
+    if path_id is None or msgid_id is None:
+      return []
+    return self.fKeyIndex.get((path_id, msgid_id, anchor), [])
+
+  def GetPathRows(self, path):
+    """Get the rows for messages in the given file, in row order"""
+
+    path_id = self.fPathIndex.get(path)
+    if path_id is None:
+      return []
+    return sorted(self.fPathRows.get(path_id, ()))
+
+  def GetMsgIdCounts(self):
+    """Get the number of messages with each message id and the text of
+    the first of them, as two dicts keyed by message id"""
+
+    counts = {}
+    descrs = {}
+    for msgid_id, count in self.fMsgIdCounts.items():
+      msgid = self.fMsgIds[msgid_id]
+      counts[msgid] = count
+      descrs[msgid] = self.fDescrs[self.fMsgIdDescrs[msgid_id]]
+    return counts, descrs
+
+  def Remove(self, rows, deleted_cb=None):
+    """Remove the given rows from their categories.  The deleted_cb is
+    called with (category, position) for each row removed, from the last
+    position to the first, right after the row is removed.  This takes
+    time proportional to the number of rows times the number removed, so
+    callers should only pass deleted_cb for a limited number of rows."""
+
+    by_category = {}
+    for row in rows:
+      by_category.setdefault(self.fCategoryCol[row], set()).add(row)
+      key = (self.fPathCol[row], self.fMsgIdCol[row], self.fAnchorCol[row])
+      self.fKeyIndex[key].remove(row)
+      if not self.fKeyIndex[key]:
+        del self.fKeyIndex[key]
+      path_rows = self.fPathRows[self.fPathCol[row]]
+      path_rows.remove(row)
+      if not path_rows:
+        del self.fPathRows[self.fPathCol[row]]
+      msgid_id = self.fMsgIdCol[row]
+      self.fMsgIdCounts[msgid_id] -= 1
+      if not self.fMsgIdCounts[msgid_id]:
+        del self.fMsgIdCounts[msgid_id]
+        del self.fMsgIdDescrs[msgid_id]
+    self.fRemovedCount += len(rows)
+
+    for category, removed in by_category.items():
+      category_rows = self.fCategoryRows[category]
+      if deleted_cb is None:
+        # Rebuild in place, since views may hold on to the array
+        category_rows[:] = array.array(
+          'i', [row for row in category_rows if row not in removed])
+        continue
+      for pos in range(len(category_rows) - 1, -1, -1):
+        if category_rows[pos] in removed:
+          del category_rows[pos]
+          deleted_cb(category, pos)
+
+  def NeedsCompacting(self):
+    """Check whether enough rows were removed to make compacting worthwhile"""
+    return self.fRemovedCount > 10000 and self.fRemovedCount > len(self) / 2
+
+  def Compact(self):
+    """Drop the storage for removed rows.  This renumbers all rows and
+    replaces the category row lists."""
+
+    rows = []
+    for category_rows in self.fCategoryRows:
+      rows.extend(category_rows)
+    rows.sort()
+    old = [(self.fCategoryCol[row], self.GetPath(row), self.fLineCol[row],
+            self.fColumnCol[row], self.GetMsgId(row), self.GetDescr(row),
+            self.fAnchorCol[row]) for row in rows]
+    self.Clear()
+    for values in old:
+      self.Add(*values)
+
+  def __len__(self):
+    return len(self.fLineCol)
+
+  def GetCount(self, category):
+    return len(self.fCategoryRows[category])
+
+  def GetCategoryRows(self, category):
+    """Get the array of row numbers for messages in the given category"""
+    return self.fCategoryRows[category]
+
+  def GetCategory(self, row):
+    return self.fCategoryCol[row]
+
+  def GetPath(self, row):
+    return self.fPaths[self.fPathCol[row]]
+
+  def GetLine(self, row):
+    return self.fLineCol[row]
+
+  def GetColumn(self, row):
+    return self.fColumnCol[row]
+
+  def GetMsgId(self, row):
+    return self.fMsgIds[self.fMsgIdCol[row]]
+
+  def GetDescr(self, row):
+    return self.fDescrs[self.fDescrCol[row]]
+
+  def SetLine(self, row, line):
+    self.fLineCol[row] = line
+
+  def SetColumn(self, row, column):
+    self.fColumnCol[row] = column
+    if column:
+      self.fHasColumns = True
+
+  def SetDescr(self, row, descr):
+    self.fDescrCol[row] = self.__Intern(descr, self.fDescrs, self.fDescrIndex)
+
+  def GetPosition(self, row):
+    """Get the position of the given row within its category"""
+
+    import bisect
+    category_rows = self.fCategoryRows[self.fCategoryCol[row]]
+    pos = bisect.bisect_left(category_rows, row)
+    if pos < len(category_rows) and category_rows[pos] == row:
+      return pos
+    return None
+
+class CMessageDiff:
+  """Compares the messages of a new lint run with those already in a message
+  store.  Each message from the new run is matched against the store by
+  file, message id and the content of the source line it is on.  Messages
+  that are found are left in place (their line, column and text are
+  updated if they changed); the rest are added as new.  Once the run is
+  complete the stored messages for the linted files that were not seen
+  again are the resolved ones.
+
+  The linted paths are the files and directories the run covered, or
+  None if it covered everything in the store."""
+
+  def __init__(self, store, linted_paths=None):
+    self.fStore = store
+    self.fMatched = set()
+    self.fNewCount = 0
+    self.fNewCounts = [0] * store.fCategoryCount
+    self.fResolvedCounts = [0] * store.fCategoryCount
+    self.fChangedRows = []
+    self.fFileLines = {}
+    if linted_paths is None:
+      self.fLintedFiles = None
+    else:
+      paths = [os.path.normcase(os.path.abspath(path)) for path in linted_paths]
+      self.fLintedFiles = set(paths)
+      self.fLintedDirs = tuple([path.rstrip(os.sep) + os.sep for path in paths])
+
+  def GetAnchor(self, path, line):
+    """Get the hash of the text of the given line in given file"""
+
+    lines = self.fFileLines.get(path)
+    if lines is None:
+      try:
+        f = open(path, 'rU')
+        try:
+          lines = f.readlines()
+        finally:
+          f.close()
+      except (IOError, OSError):
+        lines = []
+      self.fFileLines[path] = lines
+    if 0 < line <= len(lines):
+      text = lines[line-1].strip()
+    else:
+      text = ''
+    return zlib.crc32(text) & 0x7fffffff
+
+  def Add(self, category, path, line, column, msgid, descr):
+    """Add a message from the new run.  Returns its row and whether it
+    is new."""
+
+    store = self.fStore
+    anchor = self.GetAnchor(path, line)
+    for row in store.FindRows(path, msgid, anchor):
+      if row not in self.fMatched:
+        self.fMatched.add(row)
+        changed = False
+        if store.GetLine(row) != line:
+          store.SetLine(row, line)
+          changed = True
+        if store.GetColumn(row) != column:
+          store.SetColumn(row, column)
+          changed = True
+        if store.GetDescr(row) != descr:
+          store.SetDescr(row, descr)
+          changed = True
+        if changed:
+          self.fChangedRows.append(row)
+        return row, False
+    self.fNewCount += 1
+    self.fNewCounts[category] += 1
+    row = store.Add(category, path, line, column, msgid, descr, anchor)
+    self.fMatched.add(row)
+    return row, True
+
+  def GetUnchangedCount(self):
+    return len(self.fMatched) - self.fNewCount
+
+  def PopChangedRows(self):
+    """Get rows whose line, column or text changed since the last call"""
+
+    rows = self.fChangedRows
+    self.fChangedRows = []
+    return rows
+
+  def __IsLinted(self, path):
+    if self.fLintedFiles is None:
+      return True
+    path = os.path.normcase(os.path.abspath(path))
+    return path in self.fLintedFiles or path.startswith(self.fLintedDirs)
+
+  def GetResolvedRows(self):
+    """Get the stored rows for the linted paths that were not seen in the
+    new run"""
+
+    store = self.fStore
+    linted = [self.__IsLinted(path) for path in store.fPaths]
+    path_col = store.fPathCol
+    resolved = []
+    for category, category_rows in enumerate(store.fCategoryRows):
+      for row in category_rows:
+        if row not in self.fMatched and linted[path_col[row]]:
+          resolved.append(row)
+          self.fResolvedCounts[category] += 1
+    return resolved
+
+  def GetResolvedCount(self):
+    return sum(self.fResolvedCounts)
+
+######################################################################
+# Tree model that displays rows from a message store
+
+try:
+  from guiutils import wgtk
+except ImportError:
+  # Not running inside the IDE
+  wgtk = None
+
+if wgtk is not None:
+
+  class CMessageListModel(wgtk.GenericTreeModel):
+    """A list model over a message store category.  Values are obtained
+    from get_value(row, column) when the tree asks for them, so no row
+    data is copied into the model."""
+
+    def __init__(self, rows, column_count, get_value):
+      wgtk.GenericTreeModel.__init__(self)
+      self.fRows = rows
+      self.fColumnCount = column_count
+      self.fGetValue = get_value
+      self.fShownCount = 0
+
+    def GetRow(self, path):
+      """Get store row number for the given tree path"""
+      return self.fRows[path[0]]
+
+    def NotifyAppended(self):
+      """Tell the tree about rows added to the store since the last call"""
+
+      count = len(self.fRows)
+      while self.fShownCount < count:
+        path = (self.fShownCount,)
+        self.fShownCount += 1
+        self.row_inserted(path, self.get_iter(path))
+
+    def NotifyChanged(self, pos):
+      """Tell the tree that the row at given position changed"""
+
+      if pos < self.fShownCount:
+        path = (pos,)
+        self.row_changed(path, self.get_iter(path))
+
+    def NotifyDeleted(self, pos):
+      """Tell the tree that the row at given position was removed"""
+
+      if pos < self.fShownCount:
+        self.fShownCount -= 1
+        self.row_deleted((pos,))
+
+    def on_get_flags(self):
+      # Iters hold positions, which change when rows are removed, so they
+      # must not be kept across changes
+      return wgtk.TREE_MODEL_LIST_ONLY
+
+    def on_get_n_columns(self):
+      return self.fColumnCount
+
+    def on_get_column_type(self, index):
+      return wgtk.gobject.TYPE_STRING
+
+    def on_get_iter(self, path):
+      if path[0] < self.fShownCount:
+        return path[0]
+      return None
+
+    def on_get_path(self, rowref):
+      return (rowref,)
+
+    def on_get_value(self, rowref, column):
+      return self.fGetValue(self.fRows[rowref], column)
+
+    def on_iter_next(self, rowref):
+      if rowref + 1 < self.fShownCount:
+        return rowref + 1
+      return None
+
+    def on_iter_children(self, parent):
+      if parent is None and self.fShownCount > 0:
+        return 0
+      return None
+
+    def on_iter_has_child(self, rowref):
+      return False
+
+    def on_iter_n_children(self, rowref):
+      if rowref is None:
+        return self.fShownCount
+      return 0
+
+    def on_iter_nth_child(self, parent, n):
+      if parent is None and n < self.fShownCount:
+        return n
+      return None
+
+    def on_iter_parent(self, child):
+      return None
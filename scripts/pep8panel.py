@@ -46,6 +46,25 @@ Version 0.4 (2009-10-22)
 Version 0.4.1 (2010-02-23)
 
 * Got my hands on a Windows 7 box. Adjusted the configuration section.
+
+Version 0.5
+
+* Autoload checks are debounced and batched across saved files, and a
+  check still running on a file that is saved again is cancelled.
+* Keep messages in a compact store and show them through tree models
+  that format rows only when they are drawn.
+* Check files inside Wing with the pycodestyle or pep8 module when it
+  can be imported, on several threads and one file at a time, showing
+  messages as each file is done and reusing the results for unchanged
+  files.  The timeout now applies to each file (PEP8_FILE_TIMEOUT).
+* Don't add --filename=*.py to PEP8_ARGS on every package check.  Each
+  run uses its own config, which can add a project config file and
+  per file type arguments (PEP8_FILETYPE_ARGS).  An update that would
+  repeat a check still in progress reuses it and any other check in
+  progress is cancelled.
+* Optionally check Python editors as they are changed, without saving
+  (CHECK_BUFFERS).  Only the statements touched by each change are
+  checked again.
 """
 # ------------------------------ CONFIGURATION -----------------------------------------------------
 #
@@ -61,16 +80,42 @@ Version 0.4.1 (2010-02-23)
 PEP8_COMMAND = 'J:/_utils/pep8/pep8.exe'
 PEP8_ARGS = ['--repeat', '--statistics'] # add args but don't remove those two!
 AUTORELOAD = False # Set to True to activate autoreloading
+CHECK_BUFFERS = False # Set to True to check Python editors as they are changed
+
+# How to check files: 'module' checks them inside Wing with the pycodestyle
+# (or pep8) module, 'command' runs PEP8_COMMAND, and 'auto' uses the module
+# if Wing can import it
+PEP8_ENGINE = 'auto'
+PEP8_JOBS = 0 # Threads used to check files with the module, 0=one per CPU
+PEP8_FILE_TIMEOUT = 10 # Seconds allowed for checking each file
+
+# Extra arguments for files with the given extensions, for example
+#
+#    PEP8_FILETYPE_ARGS = {'.pyw': ['--max-line-length=100']}
+#
+# These are not used when PEP8_COMMAND checks a package or several files.
+# A setup.cfg, tox.ini or .pep8 file with a [pycodestyle] or [pep8] section
+# next to the project file is also passed to pep8 with --config
+PEP8_FILETYPE_ARGS = {}
 
 # ------------------------------ /CONFIGURATION ----------------------------------------------------
 
-PEP08PANEL_VERSION = "0.4.1"
+PEP08PANEL_VERSION = "0.5"
 
 import os
 import sys
 import wingapi
 import time
 import re
+import threading
+import Queue
+import bisect
+import tokenize
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+from cStringIO import StringIO
 _AI = wingapi.CArgInfo
 
 # Scripts can be internationalized with gettext.    Strings to be translated
@@ -93,6 +138,16 @@ gMessageCategories = [
 
 gTheView = None # Will be set later
 
+# Replacing the messages for a file removes its rows from the trees one by
+# one when there are at most this many, and otherwise rebuilds the trees
+kMaxNotifyRows = 200
+
+# Shared support code lives next to this script but is not a script itself
+_kScriptDir = os.path.dirname(os.path.abspath(__file__))
+if _kScriptDir not in sys.path:
+    sys.path.append(_kScriptDir)
+import lintsupport
+
 ######################################################################
 # Configuration file support
 
@@ -141,6 +196,7 @@ from guiutils import winmgr
 
 from command import commandmgr
 import guimgr.menus
+import config
 
 
 def pep8_show_docs():
@@ -175,17 +231,757 @@ def _get_selected_python_files():
     return python_files
 
 
+class _CPep8Run:
+    """A running pep8 process, which can be cancelled"""
+
+    def __init__(self, key, handler):
+        self.fKey = key
+        self.fHandler = handler
+        self.fFinished = False
+
+    def IsFinished(self):
+        return self.fFinished
+
+    def Cancel(self):
+        if self.fFinished:
+            return
+        self.fHandler.Terminate(kill=True)
+        self.fFinished = True
+        if gTheView is not None:
+            gTheView._ShowStatusMessage('')
+
+
+######################################################################
+# Run configuration
+
+class _CPep8Config:
+    """The pep8 arguments for a run, which can't be changed once created.
+    Get configs from _get_pep8_config so that equal configs are shared.
+    The digest identifies the arguments and the project config file
+    contents, for use as a key for cached results."""
+
+    def __init__(self, args, stamp):
+        self.__fArgs = tuple(args)
+        self.__fDigest = md5(repr((self.__fArgs, stamp))).hexdigest()
+
+    def GetArgs(self):
+        return self.__fArgs
+
+    def GetDigest(self):
+        return self.__fDigest
+
+    def __hash__(self):
+        return hash(self.__fDigest)
+
+    def __eq__(self, other):
+        return (isinstance(other, _CPep8Config) and
+                self.__fDigest == other.GetDigest())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<_CPep8Config %s>' % ' '.join(self.__fArgs)
+
+kProjectConfigFiles = ('setup.cfg', 'tox.ini', '.pep8')
+kProjectConfigSectionExpr = re.compile(r"^\[(pycodestyle|pep8)\]", re.MULTILINE)
+gProjectConfigSections = {}
+gConfigs = {}
+
+def _find_project_config():
+    """Find the pep8 config file next to the project file.  Returns its
+    path and a stamp that changes when it does, or (None, None)."""
+
+    proj = wingapi.gApplication.GetProject()
+    if proj is None or proj.GetFilename() is None:
+        # No project or it was never saved
+        return None, None
+    proj_dir = os.path.dirname(proj.GetFilename())
+    for name in kProjectConfigFiles:
+        path = os.path.join(proj_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamp = (path, st.st_mtime, st.st_size)
+        has_section = gProjectConfigSections.get(stamp)
+        if has_section is None:
+            try:
+                f = open(path)
+                try:
+                    has_section = kProjectConfigSectionExpr.search(f.read()) is not None
+                finally:
+                    f.close()
+            except (IOError, OSError):
+                has_section = False
+            gProjectConfigSections[stamp] = has_section
+        if has_section:
+            return path, stamp
+    return None, None
+
+
+def _get_pep8_config(filename=None, is_dir=False, cache=None):
+    """Get the config for checking the given file, or for checking
+    packages when is_dir is set.  File type overrides are only used when
+    a filename is given.  A run that checks many files passes the same
+    cache dict for each of them, so the project config file is only
+    looked up once per file type rather than once per file."""
+
+    if cache is not None:
+        ext = None
+        if filename is not None:
+            ext = os.path.splitext(filename)[1].lower()
+        config = cache.get((ext, is_dir))
+        if config is None:
+            config = cache[(ext, is_dir)] = _get_pep8_config(filename, is_dir)
+        return config
+
+    args = list(PEP8_ARGS)
+    path, stamp = _find_project_config()
+    if path is not None:
+        args.append('--config=%s' % path)
+    if is_dir:
+        args.append('--filename=*.py')
+    if filename is not None:
+        ext = os.path.splitext(filename)[1].lower()
+        args.extend(PEP8_FILETYPE_ARGS.get(ext, ()))
+
+    key = (tuple(args), stamp)
+    config = gConfigs.get(key)
+    if config is None:
+        config = gConfigs[key] = _CPep8Config(args, stamp)
+    return config
+
+######################################################################
+# Checking files inside Wing with the pycodestyle or pep8 module
+
+# Tokens that don't start a logical line
+kSkipTokens = frozenset([tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+                         tokenize.DEDENT, tokenize.COMMENT])
+
+class _CCheckAborted(Exception):
+    """Raised to stop checking a file that is taking too long or whose
+    run was cancelled"""
+
+
+def _get_pep8_module():
+    """Get the pycodestyle or pep8 module to check files with, or None if
+    neither can be imported (or it is too old to have StyleGuide)"""
+
+    if PEP8_ENGINE == 'command':
+        return None
+    for name in ('pycodestyle', 'pep8'):
+        try:
+            module = __import__(name)
+        except ImportError:
+            continue
+        if hasattr(module, 'StyleGuide'):
+            return module
+    return None
+
+
+class _CPep8Engine:
+    """Checks files with the pycodestyle (or pep8) module on a pool of
+    worker threads.  Each file is checked on its own, so its messages can
+    be shown as soon as it is done, and the messages for files whose
+    content is unchanged since they were last checked are reused."""
+
+    kMaxCacheEntries = 10000
+
+    def __init__(self, module, thread_count):
+        self.fModule = module
+        self.fTasks = Queue.Queue()
+        self.fStyles = {}
+        self.fCache = {}
+        self.fCacheLock = threading.Lock()
+        self.__CreateClasses()
+        for i in range(thread_count):
+            thread = threading.Thread(target=self.__Work)
+            thread.setDaemon(True)
+            thread.start()
+
+    def __CreateClasses(self):
+        module = self.fModule
+
+        class _CChecker(module.Checker):
+            """Checker that gives up once past its deadline or when its
+            run is cancelled"""
+
+            fDeadline = None
+            fRun = None
+            fLogicalStarts = None
+
+            def readline(self):
+                if time.time() > self.fDeadline or self.fRun.fCancelled:
+                    raise _CCheckAborted()
+                return module.Checker.readline(self)
+
+            def check_logical(self):
+                # Record where each logical line starts and its indent
+                if self.fLogicalStarts is None:
+                    return module.Checker.check_logical(self)
+                rows = [tok[2][0] for tok in self.tokens
+                        if tok[0] not in kSkipTokens]
+                module.Checker.check_logical(self)
+                if rows:
+                    self.fLogicalStarts.append((rows[0], self.indent_level))
+
+        class _CReport(module.BaseReport):
+            """Report that collects the messages for one file"""
+
+            def __init__(self, options):
+                module.BaseReport.__init__(self, options)
+                self.fRepeat = getattr(options, 'repeat', True)
+                self.fMessages = []
+
+            def error(self, line_number, offset, text, check):
+                if not self.fRepeat and text[:4] in self.counters:
+                    return None
+                code = module.BaseReport.error(self, line_number, offset,
+                                               text, check)
+                if code:
+                    self.fMessages.append((line_number, offset + 1, code,
+                                           text[5:]))
+                return code
+
+        self.fCheckerClass = _CChecker
+        self.fReportClass = _CReport
+
+    def GetOptions(self, config):
+        """Get the checker options for the given config"""
+
+        style = self.fStyles.get(config)
+        if style is None:
+            style = self.fModule.StyleGuide(paths=list(config.GetArgs()))
+            self.fStyles[config] = style
+        return style.options
+
+    def Check(self, run, filename, config, lines=None):
+        """Queue the given file to be checked with the given config as part
+        of the given run.  The given lines are checked instead of the file's
+        contents on disk, if any."""
+
+        self.fTasks.put((run, filename, config, self.GetOptions(config), lines))
+
+    def CheckFile(self, run, filename, config, options):
+        """Check the given file.  Returns a list of (line, column, code,
+        text) tuples, or None if the check was aborted."""
+
+        try:
+            f = open(filename, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        except (IOError, OSError), e:
+            return [(1, 1, 'E902', str(e))]
+
+        key = (config.GetDigest(), md5(data).digest())
+        messages = self.fCache.get(key)
+        if messages is not None:
+            return messages
+
+        text = data.replace('\r\n', '\n').replace('\r', '\n')
+        messages = self.CheckLines(run, filename, options,
+                                   StringIO(text).readlines())
+        if messages is not None:
+            self.fCacheLock.acquire()
+            try:
+                if len(self.fCache) >= self.kMaxCacheEntries:
+                    self.fCache.clear()
+                self.fCache[key] = messages
+            finally:
+                self.fCacheLock.release()
+        return messages
+
+    def CheckLines(self, run, filename, options, lines, logical_starts=None):
+        """Check the given lines of a file.  Returns a list of (line,
+        column, code, text) tuples, or None if the check was aborted.  The
+        (line, indent level) of each logical line is appended to the given
+        logical_starts list, if any."""
+
+        report = self.fReportClass(options)
+        checker = self.fCheckerClass(filename, lines=lines,
+                                     options=options, report=report)
+        checker.fLogicalStarts = logical_starts
+        checker.fRun = run
+        checker.fDeadline = time.time() + run.fFileTimeout
+        try:
+            checker.check_all()
+        except _CCheckAborted:
+            return None
+        return report.fMessages
+
+    def __Work(self):
+        while True:
+            run, filename, config, options, lines = self.fTasks.get()
+            if run.fCancelled:
+                continue
+            logical_starts = []
+            try:
+                if lines is None:
+                    messages = self.CheckFile(run, filename, config, options)
+                else:
+                    messages = self.CheckLines(run, filename, options, lines,
+                                               logical_starts)
+            except Exception, e:
+                messages = [(1, 1, 'E902', '%s: %s' % (e.__class__.__name__, e))]
+            run.fResults.put((filename, messages, logical_starts))
+
+gEngine = None
+
+def _get_pep8_engine():
+    """Get the engine for checking files inside Wing, or None if the
+    pycodestyle or pep8 module isn't available"""
+
+    global gEngine
+    if gEngine is None:
+        module = _get_pep8_module()
+        if module is None:
+            return None
+        jobs = PEP8_JOBS
+        if jobs <= 0:
+            jobs = lintsupport.default_job_count()
+        gEngine = _CPep8Engine(module, jobs)
+    return gEngine
+
+
+class _CPep8EngineRun:
+    """Checks a set of files with the engine, showing the messages for
+    each file as it is done"""
+
+    def __init__(self, key, engine, view, filenames, show_filenames,
+                 base_msg):
+        self.fKey = key
+        self.fEngine = engine
+        self.fView = view
+        self.fFileTimeout = PEP8_FILE_TIMEOUT
+        self.fFileNames = filenames
+        self.fShowFilenames = show_filenames
+        self.fBaseMsg = base_msg
+        self.fResults = Queue.Queue()
+        self.fCancelled = False
+        self.fFinished = False
+        self.fDoneCount = 0
+        self.fTimedOut = []
+        self.fCounts = {}
+        self.fTexts = {}
+        self.fDots = ''
+        self.fLastDot = 0
+
+    def Start(self):
+        self.fView.clear_tree_contents(self.fShowFilenames)
+        self.fView._ShowStatusMessage(self.fBaseMsg)
+        self.fLastDot = int(time.time())
+        configs = {}
+        for filename in self.fFileNames:
+            self.fEngine.Check(self, filename,
+                               _get_pep8_config(filename, cache=configs))
+        wingapi.gApplication.InstallTimeout(100, self.__Poll)
+
+    def IsFinished(self):
+        return self.fFinished
+
+    def Cancel(self):
+        if self.fFinished:
+            return
+        self.fCancelled = True
+        self.fFinished = True
+        self.fView._ShowStatusMessage('')
+
+    def __Poll(self):
+        if self.fCancelled:
+            return False
+
+        store = self.fView.fStore
+        added = False
+        while True:
+            try:
+                filename, messages, logical_starts = self.fResults.get_nowait()
+            except Queue.Empty:
+                break
+            self.fDoneCount += 1
+            added = True
+            if messages is None:
+                self.fTimedOut.append(filename)
+                continue
+            for line, col, code, text in messages:
+                if code[:1] == 'E':
+                    msg_index = 0
+                else:
+                    msg_index = 1
+                store.Add(msg_index, filename, line, col, code, text)
+                self.fCounts[code] = self.fCounts.get(code, 0) + 1
+                self.fTexts.setdefault(code, text)
+
+        if added:
+            self.fView.update_tree_contents(
+                _get_statistics(self.fCounts, self.fTexts))
+
+        if self.fDoneCount < len(self.fFileNames):
+            if int(time.time()) > self.fLastDot:
+                self.fDots += '.'
+                if len(self.fDots) > 3:
+                    self.fDots = ''
+                msg = self.fBaseMsg
+                if len(self.fFileNames) > 1:
+                    msg = _("%s (%i of %i done)") % (msg, self.fDoneCount,
+                                                     len(self.fFileNames))
+                self.fView._ShowStatusMessage(msg + self.fDots)
+                self.fLastDot = int(time.time())
+            return True
+
+        self.fFinished = True
+        self.fView._ShowStatusMessage('')
+        if self.fTimedOut:
+            wingapi.gApplication.ShowMessageDialog(_("PEP8 Timed Out"), _(
+                "PEP8 timed out:    Checking these files did not complete "
+                "within the timeout of %i seconds per file, set with "
+                "PEP8_FILE_TIMEOUT:\n\n%s") % (
+                    self.fFileTimeout, '\n'.join(self.fTimedOut)))
+        return False
+
+
+def _get_statistics(counts, texts):
+    """Get the rows for the statistics tab from the number of messages
+    with each code and the text of the first of them"""
+
+    if '--statistics' not in PEP8_ARGS:
+        return []
+    codes = counts.keys()
+    codes.sort()
+    return [((str(counts[code]), '%s %s' % (code, texts[code]), None, None), )
+            for code in codes]
+
+######################################################################
+# Checking editors as they are changed
+
+# Seconds to wait after a change before checking
+kBufferCheckDelay = 0.5
+
+# Checks of more lines than this are done on a worker thread
+kMaxRegionLines = 500
+
+class _CPep8BufferCheck:
+    """Checks the text of a document as it is changed, without saving it.
+    The first check covers all the text.  After that only the top-level
+    statements touched by changes are checked again, along with the
+    statement before them for context, and their messages replace the
+    old ones.  A change that can't be checked on its own, such as an
+    unclosed bracket or string, leads to a full check."""
+
+    def __init__(self, engine, doc):
+        self.fEngine = engine
+        self.fDoc = doc
+        self.fFileName = doc.GetFilename()
+        self.fFileTimeout = PEP8_FILE_TIMEOUT
+        self.fCancelled = False
+        self.fResults = Queue.Queue()
+
+        # Messages as (line, col, code, text) and the line and indent
+        # level of each logical line, as of the last check but with line
+        # numbers adjusted for changes since then
+        self.fMessages = []
+        self.fStarts = []
+        self.fIndents = []
+
+        # First and last line changed since the last check, or None
+        self.fDirty = None
+        self.fChecked = False
+        self.fFullPending = False
+        self.fEditLog = []
+        self.fDeadline = 0
+        self.fTimeoutId = None
+
+        doc.Connect('modified', self.__CB_Modified)
+
+    def __CB_Modified(self, insert, pos, length, text, lines):
+        row = self.fDoc.GetLineNumberFromPosition(pos) + 1
+        count = text.count('\n')
+        if insert:
+            delta = count
+            self.__Shift(row, delta)
+            self.__MarkDirty(row, row + count)
+        else:
+            delta = -count
+            self.__Shift(row, delta)
+            self.__MarkDirty(row, row)
+        if self.fFullPending:
+            self.fEditLog.append((row, delta))
+        self.__Schedule()
+
+    def __Shift(self, row, delta):
+        """Adjust line numbers after the given line for lines inserted
+        (delta > 0) or deleted (delta < 0) after it"""
+
+        if delta == 0:
+            return
+        last_deleted = row - min(delta, 0)
+
+        messages = []
+        for message in self.fMessages:
+            line = message[0]
+            if line > last_deleted:
+                messages.append((line + delta, ) + message[1:])
+            elif line <= row:
+                messages.append(message)
+        self.fMessages = messages
+
+        lo = bisect.bisect_right(self.fStarts, row)
+        hi = bisect.bisect_right(self.fStarts, last_deleted)
+        del self.fStarts[lo:hi]
+        del self.fIndents[lo:hi]
+        for i in range(lo, len(self.fStarts)):
+            self.fStarts[i] += delta
+
+        if self.fDirty is not None:
+            first, last = self.fDirty
+            if first > last_deleted:
+                first += delta
+            elif first > row:
+                first = row
+            if last > last_deleted:
+                last += delta
+            elif last > row:
+                last = row
+            self.fDirty = (first, last)
+
+    def __MarkDirty(self, first, last):
+        if self.fDirty is not None:
+            first = min(first, self.fDirty[0])
+            last = max(last, self.fDirty[1])
+        self.fDirty = (first, last)
+
+    def __Schedule(self):
+        self.fDeadline = time.time() + kBufferCheckDelay
+        if self.fTimeoutId is None:
+            self.fTimeoutId = wingapi.gApplication.InstallTimeout(
+                int(kBufferCheckDelay * 1000), self.__CB_Timeout)
+
+    def __CB_Timeout(self):
+        remaining = self.fDeadline - time.time()
+        if remaining > 0:
+            # Another change arrived since the timeout was installed
+            self.fTimeoutId = wingapi.gApplication.InstallTimeout(
+                max(1, int(remaining * 1000)), self.__CB_Timeout)
+            return False
+        self.fTimeoutId = None
+        if not self.fCancelled:
+            self.Check()
+        return False
+
+    def Cancel(self):
+        self.fCancelled = True
+
+    def Check(self):
+        """Check the parts of the document changed since the last check"""
+
+        if self.fFullPending:
+            # Changed parts are checked once the full check is done
+            return
+        text = self.fDoc.GetText()
+        lines = StringIO(text.replace('\r\n', '\n').replace('\r', '\n')).readlines()
+        if not self.fChecked:
+            self.__StartFullCheck(lines)
+            return
+        if self.fDirty is None:
+            return
+
+        check_from, replace_from, check_to = self.__GetRegion(len(lines))
+        if check_to - check_from > kMaxRegionLines:
+            self.__StartFullCheck(lines)
+            return
+
+        logical_starts = []
+        options = self.fEngine.GetOptions(_get_pep8_config(self.fFileName))
+        messages = self.fEngine.CheckLines(self, self.fFileName, options,
+                                           lines[check_from-1:check_to],
+                                           logical_starts)
+        if messages is None:
+            # Timed out; try again after the next change
+            return
+        offset = check_from - 1
+        new_messages = []
+        for line, col, code, msg_text in messages:
+            if code[:2] == 'E9':
+                # Syntax or tokenizer error: the change extends beyond
+                # the statements checked
+                self.__StartFullCheck(lines)
+                return
+            if check_to < len(lines) and code in ('W391', 'W292'):
+                # End of checked lines is not the end of the file
+                continue
+            if line + offset >= replace_from:
+                new_messages.append((line + offset, col, code, msg_text))
+
+        # Whether an import is at the top of the module depends on all the
+        # code before it
+        if check_from > 1:
+            for line, indent in logical_starts:
+                if indent == 0 and lines[line + offset - 1].startswith(('import ', 'from ')):
+                    self.__StartFullCheck(lines)
+                    return
+
+        self.fMessages = [m for m in self.fMessages if m[0] < replace_from] + \
+                         new_messages + \
+                         [m for m in self.fMessages if m[0] > check_to]
+        self.fMessages.sort()
+        lo = bisect.bisect_left(self.fStarts, check_from)
+        hi = bisect.bisect_right(self.fStarts, check_to)
+        self.fStarts[lo:hi] = [line + offset for line, indent in logical_starts]
+        self.fIndents[lo:hi] = [indent for line, indent in logical_starts]
+        self.fDirty = None
+        self.__Show()
+
+    def __GetRegion(self, line_count):
+        """Get the first line to check, the first line whose messages are
+        replaced, and the last line to check, to cover the changed lines"""
+
+        first, last = self.fDirty
+        starts = self.fStarts
+        indents = self.fIndents
+
+        # The top-level statement containing the first changed line, and
+        # the one before it as context for the blank line checks
+        i = bisect.bisect_left(starts, first) - 1
+        while i >= 0 and indents[i] != 0:
+            i -= 1
+        if i < 0:
+            return 1, 1, self.__GetRegionEnd(last, line_count)
+        j = i - 1
+        while j >= 0 and indents[j] != 0:
+            j -= 1
+        if j < 0:
+            check_from = 1
+        else:
+            check_from = starts[j]
+        return check_from, starts[i], self.__GetRegionEnd(last, line_count)
+
+    def __GetRegionEnd(self, last, line_count):
+        # The first logical line of the next top-level statement is
+        # included, since the blank line checks report on it
+        starts = self.fStarts
+        indents = self.fIndents
+        k = bisect.bisect_right(starts, last)
+        while k < len(starts) and indents[k] != 0:
+            k += 1
+        if k + 1 >= len(starts):
+            return line_count
+        return starts[k + 1] - 1
+
+    def __StartFullCheck(self, lines):
+        self.fFullPending = True
+        self.fEditLog = []
+        self.fDirty = None
+        self.fEngine.Check(self, self.fFileName, _get_pep8_config(self.fFileName),
+                           lines)
+        wingapi.gApplication.InstallTimeout(50, self.__CB_PollFullCheck)
+
+    def __CB_PollFullCheck(self):
+        if self.fCancelled:
+            return False
+        try:
+            filename, messages, logical_starts = self.fResults.get_nowait()
+        except Queue.Empty:
+            return True
+        self.fFullPending = False
+        if messages is None:
+            # Timed out; try again after the next change
+            return False
+
+        # Bring the results up to date with changes made during the check
+        self.fMessages = sorted(messages)
+        self.fStarts = [line for line, indent in logical_starts]
+        self.fIndents = [indent for line, indent in logical_starts]
+        self.fChecked = True
+        dirty = self.fDirty
+        self.fDirty = None
+        for row, delta in self.fEditLog:
+            self.__Shift(row, delta)
+        self.fEditLog = []
+        self.fDirty = dirty
+
+        self.__Show()
+        if self.fDirty is not None:
+            self.__Schedule()
+        return False
+
+    def __Show(self):
+        """Show the messages in the panel if this is the active document"""
+
+        editor = wingapi.gApplication.GetActiveEditor()
+        if gTheView is None or editor is None or editor.GetDocument() != self.fDoc:
+            return
+        gTheView.show_file_messages(self.fFileName, self.fMessages)
+
+gBufferChecks = {}
+
+def _check_document(doc):
+    """Start checking the given document as it is changed, if it is a
+    Python file"""
+
+    filename = doc.GetFilename()
+    if filename in gBufferChecks or _GetMimeType(filename) != 'text/x-python':
+        return
+    engine = _get_pep8_engine()
+    if engine is None:
+        return
+    gBufferChecks[filename] = _CPep8BufferCheck(engine, doc)
+
+    def _on_destroy(*args):
+        check = gBufferChecks.pop(filename, None)
+        if check is not None:
+            check.Cancel()
+    doc.Connect('destroy', _on_destroy)
+
+def _init_buffer_checks():
+    app = wingapi.gApplication
+    app.Connect('document-open', _check_document)
+    for doc in app.GetOpenDocuments():
+        _check_document(doc)
+
+
+######################################################################
+# Running checks
+
+gActiveRun = None
+
+def _get_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
 def _pep8_execute(filenames):
-    if gTheView is None or not os.path.exists(PEP8_COMMAND):
+    """Run pep8 on the given files and show the results in the panel.
+    Returns the run object, or None if pep8 could not be started."""
+
+    engine = _get_pep8_engine()
+    if gTheView is None or (engine is None and not os.path.exists(PEP8_COMMAND)):
         # Panel is not visible or PEP8 isn't available.
-        return
+        return None
 
+    global gActiveRun
     view = gTheView
     app = wingapi.gApplication
 
     is_dir = os.path.isdir(filenames[0])
-    if is_dir and '--filename=*.py' not in PEP8_ARGS:
-        PEP8_ARGS.append("--filename=*.py")
+    python_files = lintsupport.expand_python_files(filenames)
+    if len(filenames) == 1 and not is_dir:
+        pep8_config = _get_pep8_config(filenames[0])
+    else:
+        pep8_config = _get_pep8_config(is_dir=is_dir)
+
+    # Reuse a run that is still checking the same unchanged files with the
+    # same config, as when a save and an update are requested together
+    key = (pep8_config, engine is not None, tuple(filenames),
+           tuple(_get_mtime(fn) for fn in python_files))
+    if gActiveRun is not None and not gActiveRun.IsFinished():
+        if gActiveRun.fKey == key:
+            return gActiveRun
+        gActiveRun.Cancel()
+    gActiveRun = None
 
     # Guess at run directory
     rundir = os.path.dirname(filenames[0])
@@ -197,10 +993,21 @@ def _pep8_execute(filenames):
     else:
         base_msg = _("Updating for %i items") % len(filenames)
 
+    show_filenames = is_dir or len(filenames) > 1
+
+    if engine is not None:
+        run = _CPep8EngineRun(key, engine, view, python_files, show_filenames,
+                              base_msg)
+        run.Start()
+        gActiveRun = run
+        return run
+
     # Completion routine that updates the tree when pep8 is finished running
     def _update_tree(result):
         resultLines = result.split('\n')
-        tree_contents = [[], [], []]
+        view.clear_tree_contents(show_filenames)
+        store = view.fStore
+        statistics = []
         for line in resultLines:
             if 'win32' in sys.platform:
                 parts = line.rsplit(':', 2)
@@ -212,26 +1019,24 @@ def _pep8_execute(filenames):
                 if matchobj is not None:
                     msg_descr = matchobj.group(4).strip()
                     msg_type = msg_descr[0]
-                    line = os.path.basename(matchobj.group(2)).strip()
-                    msg_filename = os.path.basename(matchobj.group(1).strip())
-                    msg_line = msg_filename + ": " + line if is_dir else line
+                    msg_id, msg_text = (msg_descr.split(None, 1) + [''])[:2]
                     if msg_type == 'E':
                         msg_index = 0
                     else:
                         msg_index = 1
                     fullpath = matchobj.group(1).strip()
-                    tree_contents[msg_index].append(
-                        ((msg_line, msg_descr, fullpath, line), ))
+                    store.Add(msg_index, fullpath, int(matchobj.group(2)),
+                              int(matchobj.group(3)), msg_id, msg_text)
             else:
                 # statistic output
                 matchobj = kStatisticParseExpr.match(line)
                 if matchobj is not None:
                     msg_count = matchobj.group(1).strip()
                     msg_text = matchobj.group(2).strip()
-                    tree_contents[2].append(
+                    statistics.append(
                         ((msg_count, msg_text, None, None), ))
 
-        view.set_tree_contents(tree_contents)
+        view.update_tree_contents(statistics)
 
     # Show pending execution message in tree column title
     view._ShowStatusMessage(base_msg)
@@ -263,20 +1068,25 @@ def _pep8_execute(filenames):
     # Execute pep8 asyncronously
     cmd = PEP8_COMMAND
     args = []
-    args.extend(arg_split(' '.join(PEP8_ARGS), ' '))
-    import config
+    args.extend(arg_split(' '.join(pep8_config.GetArgs()), ' '))
     for filename in filenames:
         args.append(filename.encode(config.kFileSystemEncoding))
     args = tuple(args)
     env = app.GetProject().GetEnvironment(filenames[0], set_pypath=True)
     start_time = time.time()
-    timeout = 10
+    timeout = PEP8_FILE_TIMEOUT * max(len(python_files), 1)
     handler = app.AsyncExecuteCommandLineE(cmd, rundir, env, *args)
+    run = _CPep8Run(key, handler)
+    gActiveRun = run
     last_dot = [int(start_time)]
     dots = []
 
     def poll():
+        if run.fFinished:
+            # Cancelled
+            return False
         if handler.Iterate():
+            run.fFinished = True
             view._ShowStatusMessage('')
             stdout, stderr, err, status = handler.Terminate()
             if err:
@@ -289,11 +1099,13 @@ def _pep8_execute(filenames):
                 _update_tree(stdout)
             return False
         elif time.time() > start_time + timeout:
+            run.fFinished = True
             view._ShowStatusMessage('')
             stdout, stderr, err, status = handler.Terminate()
             app.ShowMessageDialog(_("PEP8 Timed Out"), _("PEP8 timed out:    "\
                 "Command did not complete within timeout of %i seconds.    "\
-                "Right click on the PEP8 tool to configure this value.    "\
+                "Set PEP8_FILE_TIMEOUT in pep8panel.py to change the "\
+                "timeout for each file.    "\
                 "Output from PEP8:\n\n%s") % (timeout, stderr + stdout))
             return False
         else:
@@ -307,24 +1119,22 @@ def _pep8_execute(filenames):
             return True
 
     wingapi.gApplication.InstallTimeout(100, poll)
+    return run
 
 
-# Do an automatical run on document save.
-def _connect_to_presave(doc):
-    def _on_presave(filename, encoding):
-        # Avoid operation when saving a copy to another location
-        if filename is not None:
-            return
-        # Get editor and do action
-        ed = wingapi.gApplication.OpenEditor(doc.GetFilename())
-        if ed is not None:
-            _pep8_execute([doc.GetFilename()])
-    connect_id = doc.Connect('presave', _on_presave)
+# Do an automatical run on document save.  Saves in quick succession are
+# checked together and a check still running on a file that is saved
+# again is cancelled.
+def _check_saved_files(filenames):
+    python_files = [fn for fn in filenames if _GetMimeType(fn) == 'text/x-python']
+    if not python_files:
+        return None
+    return _pep8_execute(python_files)
+
+gSaveScheduler = lintsupport.CSaveLintScheduler(_check_saved_files)
 
 def _init():
-    wingapi.gApplication.Connect('document-open', _connect_to_presave)
-    for doc in wingapi.gApplication.GetOpenDocuments():
-        _connect_to_presave(doc)
+    gSaveScheduler.Connect()
 
 if AUTORELOAD:
     _init()
@@ -397,8 +1207,12 @@ class _CPep8View(wingview.CViewController):
 
         self.fTrees = {}
         self.fLabels = {}
+        self.fModels = {}
+        self.fStore = lintsupport.CMessageStore(2)
+        self.fShowFilenames = True
 
         self.__CreateGui()
+        self.clear_tree_contents()
 
         # Remember that this is the default view now
         gTheView = self
@@ -407,14 +1221,100 @@ class _CPep8View(wingview.CViewController):
         for tree, sview in self.fTrees.values():
             sview.destroy()
 
-    def set_tree_contents(self, tree_contents):
-        idx = 0
-        for catkey, labeltext, tooltip in gMessageCategories:
-            label = gTheView.fLabels[catkey]
-            label.set_text('%s (%i)' % (labeltext, len(tree_contents[idx])))
-            tree, sview = gTheView.fTrees[catkey]
-            tree.set_contents(tree_contents[idx])
-            idx += 1
+    def clear_tree_contents(self, show_filenames=True):
+        """Remove all messages.  When show_filenames is set the messages
+        that are added next are labeled with their file name as well as
+        line."""
+
+        self.fStore.Clear()
+        self.fShowFilenames = show_filenames
+        for idx, (catkey, labeltext, tooltip) in enumerate(gMessageCategories):
+            self.fLabels[catkey].set_text('%s (%i)' % (labeltext, 0))
+            if catkey == 'statistics':
+                self.fTrees[catkey][0].set_contents([])
+        self.__ResetModels()
+
+    def __ResetModels(self):
+        """Show the message store rows in new models, as after rows were
+        renumbered or many were removed"""
+
+        for idx, (catkey, labeltext, tooltip) in enumerate(gMessageCategories):
+            if catkey == 'statistics':
+                continue
+            tree, sview = self.fTrees[catkey]
+            model = lintsupport.CMessageListModel(
+                self.fStore.GetCategoryRows(idx), 4, self.__GetValue)
+            # Rows already in the store are shown when the model is set,
+            # which is much faster than inserting them one at a time
+            model.fShownCount = len(model.fRows)
+            tree.set_model(model)
+            self.fModels[catkey] = model
+
+    def update_tree_contents(self, statistics):
+        """Show messages added to the message store since the last update
+        and the given statistics rows"""
+
+        for idx, (catkey, labeltext, tooltip) in enumerate(gMessageCategories):
+            tree, sview = self.fTrees[catkey]
+            if catkey == 'statistics':
+                tree.set_contents(statistics)
+                count = len(statistics)
+            else:
+                self.fModels[catkey].NotifyAppended()
+                count = self.fStore.GetCount(idx)
+            self.fLabels[catkey].set_text('%s (%i)' % (labeltext, count))
+
+    def show_file_messages(self, filename, messages):
+        """Show the given messages, as (line, col, code, text) tuples, for
+        the given file in place of the messages currently shown for it.
+        Messages for other files, as from checking a package, are kept."""
+
+        store = self.fStore
+        rows = store.GetPathRows(filename)
+        total = 0
+        for idx in range(len(gMessageCategories) - 1):
+            total += store.GetCount(idx)
+
+        if len(rows) == total:
+            self.clear_tree_contents(False)
+        elif len(rows) <= kMaxNotifyRows:
+            def _deleted(category, pos):
+                self.fModels[gMessageCategories[category][0]].NotifyDeleted(pos)
+            store.Remove(rows, _deleted)
+        else:
+            store.Remove(rows)
+            self.__ResetModels()
+        if store.NeedsCompacting():
+            store.Compact()
+            self.__ResetModels()
+
+        for line, col, code, text in messages:
+            if code[:1] == 'E':
+                msg_index = 0
+            else:
+                msg_index = 1
+            store.Add(msg_index, filename, line, col, code, text)
+
+        # Statistics cover all the messages shown
+        counts, texts = store.GetMsgIdCounts()
+        self.update_tree_contents(_get_statistics(counts, texts))
+
+    def __GetValue(self, row, column):
+        """Format the value shown in given column for given message store
+        row"""
+
+        store = self.fStore
+        if column == 0:
+            if self.fShowFilenames:
+                return '%s: %i' % (os.path.basename(store.GetPath(row)),
+                                   store.GetLine(row))
+            return str(store.GetLine(row))
+        elif column == 1:
+            return '%s %s' % (store.GetMsgId(row), store.GetDescr(row))
+        elif column == 2:
+            return store.GetPath(row)
+        else:
+            return str(store.GetLine(row))
 
     ##########################################################################
     # Inherited calls from wingview.CViewController
@@ -513,7 +1413,7 @@ class _CPep8View(wingview.CViewController):
         pos = self.__fNotebook.get_current_page()
         catkey, label, tdir = gMessageCategories[pos]
         tree, sview = self.fTrees[catkey]
-        rows = tree.GetSelectedContent()
+        paths = tree.GetSelectedPaths()
 
     def __CB_ButtonPress(self, tree, event):
         app = wingapi.gApplication
@@ -533,10 +1433,12 @@ class _CPep8View(wingview.CViewController):
             self.__PopupMenu(event, (event.x_root, event.y_root))
             return 1
 
-        selected = tree.GetSelectedContent()
-        if selected is not None and len(selected) != 0:
-            filename = selected[0][2]
-            line = int(selected[0][3])
+        model = tree.get_model()
+        selected_paths = tree.GetSelectedPaths()
+        if selected_paths and isinstance(model, lintsupport.CMessageListModel):
+            row = model.GetRow(selected_paths[0])
+            filename = self.fStore.GetPath(row)
+            line = self.fStore.GetLine(row)
             if event.button == 1 and event.type == wgtk.gdk.BUTTON_PRESS:
                 doc = app.OpenEditor(filename)
                 doc.ScrollToLine(lineno=line-1, pos='center', select=1)
@@ -558,4 +1460,9 @@ class _CPep8View(wingview.CViewController):
 # Register this panel type:    Note that this needs to be at the
 # very end of the module so that all the classes defined here
 # are already available
-_CPep8PanelDefn(wingapi.gApplication.fSingletons)
\ No newline at end of file
+_CPep8PanelDefn(wingapi.gApplication.fSingletons)
+
+# Checking editors connects to documents whose checks use the panel and
+# the functions above, so it is started once the module is loaded
+if CHECK_BUFFERS:
+    _init_buffer_checks()
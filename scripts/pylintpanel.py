@@ -63,15 +63,35 @@ Version 1.5 (2011-09-07)  Modifications by Ronan Le Gallic and Wingware:
 * Don't assume scope names are in all pylint messages (Wingware)
 * Better handle multiple pylint views (Wingware)
 
+Version 1.6 (2026-10-19)
+
+* Optionally run pylint in several processes in parallel on multiple
+  files or packages (set jobs in pylintpanel.cfg)
+* Parse pylint output as it arrives and append new messages to the
+  panel in batches instead of rebuilding all the trees when done
+* Optionally keep pylint loaded in persistent worker processes between
+  runs (set engine = worker in pylintpanel.cfg), so that interpreter
+  startup and inference on unchanged modules are not repeated
+* Optionally run pylint on files as they are saved (set lintonsave in
+  pylintpanel.cfg).  Saves in quick succession are linted in one run
+  and a run is cancelled if one of its files is saved again.
+* Keep messages in a compact store and show them through tree models
+  that format rows only when they are drawn
+* Compare each run with the messages already shown: unchanged messages
+  stay in place, and the number of new and resolved messages is shown
+* Parse output with a single precompiled expression that also handles the
+  text format of newer pylint versions, and optionally read pylint's JSON
+  output (set output = json in pylintpanel.cfg)
+
 """
 
 import os
+import sys
 import wingapi
 import time
 
-PYLINTPANEL_VERSION = "1.5"
+PYLINTPANEL_VERSION = "1.6"
 
-import re
 _AI = wingapi.CArgInfo
 
 # Scripts can be internationalized with gettext.  Strings to be translated
@@ -94,6 +114,13 @@ gMessageCategories = [
 
 gTheView = None # Will be set later
 
+# Shared support code lives next to this script but is not a script itself
+_kScriptDir = os.path.dirname(os.path.abspath(__file__))
+if _kScriptDir not in sys.path:
+  sys.path.append(_kScriptDir)
+import lintsupport
+import pylintparser
+
 ######################################################################
 # Configuration file support
 
@@ -146,7 +173,27 @@ class PylintConfig:
         'timeout = 30\n',
         '\n',
         '# Save files before running PyLint (0=no, 1=current file only, 2=save all files)\n',
-        'autosave = 1\n'
+        'autosave = 1\n',
+        '\n',
+        '# Number of PyLint processes to run in parallel on multiple files or\n',
+        '# packages (1=run a single process, 0=one process per CPU)\n',
+        'jobs = 1\n',
+        '\n',
+        '# How to run PyLint: process starts the PyLint command for each run and\n',
+        '# worker keeps PyLint loaded in a separate Python process between runs\n',
+        'engine = process\n',
+        '\n',
+        '# Python with PyLint installed, used to run the worker (engine = worker)\n',
+        'python = \n',
+        '#python = /usr/bin/python\n',
+        '\n',
+        '# Run PyLint on files when they are saved (0=no, 1=yes)\n',
+        'lintonsave = 0\n',
+        '\n',
+        '# PyLint output format to read: text shows messages as they arrive and\n',
+        '# json (pylint 1.7+) gives column numbers for all files but shows\n',
+        '# messages only once each PyLint process is done\n',
+        'output = text\n'
         ])
     cfgfile.close()
     
@@ -170,9 +217,6 @@ class PylintConfig:
 
 gTheConfig = PylintConfig()
 
-kResultParseExpr = re.compile("(?P<type>[^:]+):[ ]*(?P<line>[0-9,]+):[ ]*(?P<descr>.*)")
-kParseableResultParseExpr = re.compile("(?P<path>[^:]+):(?P<line>[0-9,]+):[ ]*\[(?P<type>.*)\][ ]*(?P<descr>.*)")
-
 ######################################################################
 # Commands
 
@@ -244,6 +288,162 @@ def _get_selected_python_files():
       python_files.append(filename)
   return python_files
   
+######################################################################
+# Persistent pylint worker processes (used when engine = worker)
+
+kWorkerMarker = '\0'
+
+# Worker processes by index; worker N runs the Nth chunk of each run
+gWorkers = []
+
+class _CPylintWorker:
+  """A pylint worker process (see pylintworker.py) that keeps pylint and its
+  inference caches loaded across runs and accepts requests over a pipe"""
+  
+  def __init__(self, python, env):
+    import subprocess
+    import threading
+    import Queue
+    
+    self.fPython = python
+    self.fEnv = env
+    self.fVersion = None
+    self.fHandler = None
+    self.fQueue = Queue.Queue()
+    self.fExited = False
+    
+    worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pylintworker.py')
+    print 'starting pylint worker', python, worker
+    self.fProcess = subprocess.Popen([python, '-u', worker], 
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, env=env)
+    
+    # Pipes can't be polled portably so a thread reads the output
+    reader = threading.Thread(target=self.__ReadOutput)
+    reader.setDaemon(True)
+    reader.start()
+    
+  def __ReadOutput(self):
+    for line in iter(self.fProcess.stdout.readline, ''):
+      self.fQueue.put(line)
+    self.fQueue.put(None)
+    
+  def Matches(self, python, env):
+    return self.IsAlive() and python == self.fPython and env == self.fEnv
+    
+  def IsAlive(self):
+    return not self.fExited and self.fProcess.poll() is None
+  
+  def IsBusy(self):
+    return self.fHandler is not None and self.fHandler.fStatus is None
+  
+  def ReadLines(self):
+    """Get the lines of output received so far, handling any version
+    announcement made by the worker"""
+    
+    import Queue
+    
+    global kPyLintVersion
+    lines = []
+    while True:
+      try:
+        line = self.fQueue.get_nowait()
+      except Queue.Empty:
+        break
+      if line is None:
+        self.fExited = True
+        break
+      if line.startswith(kWorkerMarker + 'VERSION '):
+        self.fVersion = line.split(None, 1)[1].strip()
+        kPyLintVersion = self.fVersion
+        print 'set pylint version=', self.fVersion
+      else:
+        lines.append(line)
+    return lines
+  
+  def Execute(self, rundir, args):
+    """Send a request to the worker. Returns a handler with the same
+    interface as the one returned by AsyncExecuteCommandLineE."""
+    
+    request = ['RUN %i' % (len(args) + 1), rundir] + list(args)
+    self.fProcess.stdin.write('\n'.join(request) + '\n')
+    self.fProcess.stdin.flush()
+    self.fHandler = _CPylintWorkerHandler(self)
+    return self.fHandler
+  
+  def Kill(self):
+    self.fExited = True
+    try:
+      self.fProcess.kill()
+    except (AttributeError, OSError):
+      # Python 2.5 has no Popen.kill(); closing stdin makes the worker
+      # exit once it finishes the current request
+      try:
+        self.fProcess.stdin.close()
+      except (IOError, OSError):
+        pass
+    
+class _CPylintWorkerHandler:
+  """A single request running in a pylint worker"""
+  
+  def __init__(self, worker):
+    self.fWorker = worker
+    self.fStatus = None
+    self.fErr = None
+    self.stdout = []
+    self.stderr = []
+    self.terminated = False
+    
+  def Iterate(self):
+    """Collect output received so far.  Returns True when done."""
+    
+    if self.fStatus is not None:
+      return True
+    for line in self.fWorker.ReadLines():
+      if line.startswith(kWorkerMarker + 'DONE '):
+        try:
+          self.fStatus = int(line.split()[1])
+        except ValueError:
+          self.fStatus = 1
+        return True
+      self.stdout.append(line)
+    if not self.fWorker.IsAlive():
+      self.fStatus = -1
+      self.fErr = _("PyLint worker process exited")
+    return self.fStatus is not None
+  
+  def Terminate(self, kill=False):
+    if self.fStatus is None:
+      # A request cannot be interrupted, so the worker is discarded
+      self.fWorker.Kill()
+      self.fStatus = -1
+      self.fErr = _("Terminated")
+    self.terminated = True
+    return ''.join(self.stdout), ''.join(self.stderr), self.fErr, self.fStatus
+  
+def _get_worker(index, python, env):
+  """Get a running idle worker for the given chunk index, starting one if
+  needed.  Workers are replaced if their environment changed or they are
+  still busy with a previous run."""
+  
+  while len(gWorkers) <= index:
+    gWorkers.append(None)
+  worker = gWorkers[index]
+  if worker is not None and (worker.IsBusy() or not worker.Matches(python, env)):
+    worker.Kill()
+    worker = None
+  if worker is None:
+    worker = _CPylintWorker(python, env)
+    gWorkers[index] = worker
+  return worker
+
+def _get_worker_python():
+  """Get the Python to run workers with, or None if workers aren't used"""
+  
+  if gTheConfig.get("engine", "process").strip().lower() != 'worker':
+    return None
+  return gTheConfig.get("python", "") or 'python'
+
 kPyLintVersion = None
 def _init_pylint_version():
 
@@ -255,6 +455,22 @@ def _init_pylint_version():
   pylint_command = gTheConfig.get("command", None)
   if pylint_command is None:
     return None
+
+  # Start a worker now so it is warm by the time it is first used; the
+  # worker announces the pylint version when it starts
+  python = _get_worker_python()
+  if python is not None:
+    env = app.GetProject().GetEnvironment(None, set_pypath=True)
+    worker = _get_worker(0, python, env)
+    def poll_worker():
+      # Once a run owns the worker it reads the output, including the
+      # version line, so reading here would lose that run's output
+      if worker.fHandler is not None:
+        return False
+      worker.ReadLines()
+      return worker.fVersion is None and worker.IsAlive()
+    wingapi.gApplication.InstallTimeout(100, poll_worker)
+    return None
   
   # Execute PyLint asyncronously
   cmd = pylint_command
@@ -294,10 +510,14 @@ def _init_pylint_version():
     
   wingapi.gApplication.InstallTimeout(100, poll)
  
-def _pylint_execute(filenames):
+def _pylint_execute(filenames, save=True):
+  """Run pylint on the given files and show the results in the panel.
+  Returns the run object, or None if pylint could not be started.  Set
+  save to False to skip the configured autosave."""
+  
   if gTheView is None:
     # Panel is not visible
-    return
+    return None
   
   view = gTheView
   app = wingapi.gApplication
@@ -307,6 +527,8 @@ def _pylint_execute(filenames):
   pylint_args = gTheConfig.get("args", "")
   pylint_timeout = gTheConfig.get("timeout", "10000")
   pylint_autosave = gTheConfig.get("autosave", "1")
+  pylint_jobs = gTheConfig.get("jobs", "1")
+  pylint_output = gTheConfig.get("output", "text").strip().lower()
   
   # Look for project-specific .pylintrc file
   if '--rcfile=' not in pylint_args:
@@ -326,6 +548,7 @@ def _pylint_execute(filenames):
   try:
     timeout = int(pylint_timeout)
     autosave = int(pylint_autosave)
+    jobs = int(pylint_jobs)
   except ValueError:
     app.ShowMessageDialog(_("Error"), _("Invalid values specified in configuration file"))
     return
@@ -341,77 +564,27 @@ def _pylint_execute(filenames):
     base_msg = _("Updating for %i items") % len(filenames)
 
   # Save active document before executing PyLint
-  if autosave == 1 and app.CommandAvailable("save"):
+  if not save:
+    pass
+  elif autosave == 1 and app.CommandAvailable("save"):
     app.ExecuteCommand("save")
   elif autosave == 2 and app.CommandAvailable("save-all"):
     app.ExecuteCommand("save-all")
-  
-  # Completion routine that updates the tree when pylint is finished running
-  def _update_tree(result):
-    resultLines = result.split('\n')
-
-    tree_contents = [ [], [], [], [] ]
-
-    for line in resultLines:
-
-      parts = line.split(':')
-      # Form output with --output-format=parseable (used w/ >1 file or package name)
-      if len(parts) >= 3 and parts[2].strip().startswith('['):
-        matchobj = kParseableResultParseExpr.match(line)
-        if matchobj is not None:
-
-          msg_type  = matchobj.group('type').strip()
-          msg_line, msg_col = (matchobj.group('line') + ',0').split(',')[0:2]
-          msg_descr = matchobj.group('descr').strip()
-
-          if ',' in msg_type:
-            type_parts = msg_type.split(',', 1)
-            msg_type = type_parts[0].strip()
-            msg_descr = type_parts[1].strip() + ': ' + msg_descr
-
-          if msg_type[0] == 'F' or msg_type[0] == 'E':
-            msg_index = 0
-          elif msg_type[0] == 'W':
-            msg_index = 1
-          else:
-            msg_index = 2
-          fullpath = os.path.join(rundir, matchobj.group('path'))
-          tree_contents[msg_index].append(
-            ((os.path.basename(fullpath) + ':' + msg_line,
-              msg_col,
-              msg_type + ": " + msg_descr,
-              fullpath,
-              msg_line),))
-          
-      # Default output format (only used w/ one file in filenames list)
-      else:
-        matchobj = kResultParseExpr.match(line)
-        if matchobj is not None:
-
-          msg_type = matchobj.group('type').strip()
-          msg_line, msg_col = (matchobj.group('line') + ',0').split(',')[0:2]
-          msg_descr = matchobj.group('descr').strip()
-
-          if msg_type[0] == 'F' or msg_type[0] == 'E':
-            msg_index = 0
-          elif msg_type[0] == 'W':
-            msg_index = 1
-          else:
-            msg_index = 2
-          tree_contents[msg_index].append(
-            ((msg_line,
-              msg_col,
-              msg_type + ": " + msg_descr,
-              filenames[0],
-              msg_line),))
-
-    view.set_tree_contents(tree_contents)
+
+  if jobs <= 0:
+    jobs = lintsupport.default_job_count()
+
+  # Expand packages into their files and split into balanced chunks
+  # when running several pylint processes in parallel
+  if jobs > 1:
+    chunks = _split_into_chunks(lintsupport.expand_python_files(filenames), jobs)
+  else:
+    chunks = [filenames]
 
   # Show pending execution message in tree column title
   view._ShowStatusMessage(base_msg)
     
   from wingutils import spawn
-  import config
    
   # Execute PyLint asyncronously
   cmd = pylint_command
@@ -419,57 +592,299 @@ def _pylint_execute(filenames):
     args = []
   else:
     args = ['--reports=n', '--include-ids=yes']
-  # Column info (and possibly other things) is not available w/ parseable 
-  # output so only use it where we need to get the file name b/c we're
-  # scanning multiple files or a package directory
-  if len(filenames) > 1:
-    args.append('--output-format=parseable')
-  elif os.path.isdir(filenames[0]):
-    args.append('--output-format=parseable')
   args.extend(spawn.ParseCmdArgs(pylint_args, ' '))
-  for filename in filenames:
-    args.append(filename.encode(config.kFileSystemEncoding))
-  args = tuple(args)
   env = app.GetProject().GetEnvironment(filenames[0], set_pypath=True)
-  start_time = time.time()
   print '-' * 60
   print 'pylint exec in directory', rundir
   print 'env=', env
-  print cmd, ' '.join(args)
-  handler = app.AsyncExecuteCommandLineE(cmd, rundir, env, *args)
-  last_dot = [int(start_time)]
-  dots = []
+
+  json_output = (pylint_output == 'json' and
+                 pylintparser.supports_json(kPyLintVersion))
+  run = _CPylintRun(view, cmd, rundir, env, args, chunks, timeout, base_msg,
+                    _get_worker_python(), json_output)
+  run.Start()
+  return run
+
+def _lint_saved_files(filenames):
+  """Run pylint on the Python files among those just saved"""
   
-  def poll():
-    if handler.Iterate():
-      view._ShowStatusMessage('')
-      stdout, stderr, err, status = handler.Terminate()
-      if err or (not stdout and kPyLintVersion < '0.24'):
-        app.ShowMessageDialog(_("PyLint Failed"), _("Error executing PyLint:  Command failed with error=%s, status=%s; stderr:\n%s") % (err, status, stderr))
+  python_files = [fn for fn in filenames if _GetMimeType(fn) == 'text/x-python']
+  if not python_files:
+    return None
+  return _pylint_execute(python_files, save=False)
+
+gSaveScheduler = lintsupport.CSaveLintScheduler(_lint_saved_files)
+
+def _init_lint_on_save():
+  """Start linting files as they are saved if enabled in the configuration"""
+  
+  try:
+    enabled = int(gTheConfig.get("lintonsave", "0"))
+  except ValueError:
+    enabled = 0
+  if enabled:
+    gSaveScheduler.Connect()
+
+# Time in seconds that pylint spent on each file in earlier runs, used
+# to balance the work given to parallel pylint processes
+gLintTimes = {}
+kDefaultSecondsPerByte = 1.0 / 20000
+
+def _estimate_lint_time(filename):
+  """Estimate how long pylint will take on the given file, from its
+  history if known or else from its size"""
+  
+  if gLintTimes.has_key(filename):
+    return gLintTimes[filename]
+  try:
+    size = os.path.getsize(filename)
+  except OSError:
+    size = 0
+  return size * kDefaultSecondsPerByte
+
+def _record_lint_time(filenames, elapsed):
+  """Distribute time spent running pylint on the given files among them
+  in proportion to their size"""
+
+  sizes = []
+  for filename in filenames:
+    try:
+      sizes.append(max(1, os.path.getsize(filename)))
+    except OSError:
+      sizes.append(1)
+  total = float(sum(sizes))
+  for filename, size in zip(filenames, sizes):
+    gLintTimes[filename] = elapsed * size / total
+
+def _split_into_chunks(filenames, count):
+  """Split the given files into at most count chunks with roughly equal
+  estimated lint time.  The most expensive files are placed first, each
+  into the chunk with the least work so far."""
+  
+  import heapq
+  
+  count = max(1, min(count, len(filenames)))
+  weighted = [(_estimate_lint_time(fn), fn) for fn in filenames]
+  weighted.sort(reverse=True)
+  bins = [(0.0, i, []) for i in range(count)]
+  for weight, filename in weighted:
+    total, i, chunk = heapq.heappop(bins)
+    chunk.append(filename)
+    heapq.heappush(bins, (total + weight, i, chunk))
+  return [chunk for total, i, chunk in sorted(bins, reverse=True) if chunk]
+
+# Minimum time in seconds between updates of the trees while pylint is
+# still producing output
+kStreamUpdateInterval = 0.25
+
+# Maximum number of resolved messages to remove from the trees one by one;
+# above this the trees are rebuilt instead
+kMaxIncrementalRemove = 1000
+
+class _CPylintProcess:
+  """A single pylint process and the part of its output parsed so far"""
+  
+  def __init__(self, handler, chunk, parser):
+    self.fHandler = handler
+    self.fChunk = chunk
+    self.fParser = parser
+    self.fStartTime = time.time()
+    # Number of items and characters consumed from handler.stdout
+    self.fConsumedItems = 0
+    self.fConsumedChars = 0
+    self.fPartialLine = ''
+    
+  def ReadLines(self):
+    """Get the complete lines of output received since the last call"""
+    
+    stdout = self.fHandler.stdout
+    new_items = stdout[self.fConsumedItems:]
+    if not new_items:
+      return []
+    self.fConsumedItems += len(new_items)
+    data = ''.join(new_items)
+    self.fConsumedChars += len(data)
+    lines = (self.fPartialLine + data).split('\n')
+    self.fPartialLine = lines.pop()
+    return lines
+  
+  def ReadFinalLines(self, stdout):
+    """Get any lines not yet consumed, given the full output returned
+    when the process is terminated"""
+    
+    data = self.fPartialLine + stdout[self.fConsumedChars:]
+    self.fPartialLine = ''
+    self.fConsumedChars = len(stdout)
+    return data.split('\n')
+  
+class _CPylintRun:
+  """A single execution of pylint, split into one pylint process per chunk
+  of files.  Output is parsed as it arrives and new messages are appended
+  to the view in batches."""
+  
+  def __init__(self, view, cmd, rundir, env, args, chunks, timeout, base_msg,
+               worker_python=None, json_output=False):
+    self.fView = view
+    self.fJSONOutput = json_output
+    self.fCmd = cmd
+    self.fWorkerPython = worker_python
+    self.fRunDir = rundir
+    self.fEnv = env
+    self.fArgs = args
+    self.fChunks = chunks
+    self.fTimeout = timeout
+    self.fBaseMsg = base_msg
+    
+    self.fRunning = []
+    self.fFinished = False
+    self.fPendingCount = 0
+    self.fFinishedCount = 0
+    self.fStartTime = None
+    self.fLastUpdate = 0
+    self.fLastDot = 0
+    self.fDots = ''
+    
+  def GetLintedPaths(self):
+    """Get the files and directories linted by this run"""
+    
+    paths = []
+    for chunk in self.fChunks:
+      paths.extend(chunk)
+    return paths
+    
+  def Start(self):
+    """Start all the pylint processes and poll them until done"""
+    
+    import config
+    
+    app = wingapi.gApplication
+    self.fStartTime = time.time()
+    self.fLastDot = int(self.fStartTime)
+    show_filenames = (len(self.fChunks) > 1 or len(self.fChunks[0]) > 1 or
+                      os.path.isdir(self.fChunks[0][0]))
+    self.fView.begin_update(self, show_filenames)
+    for i, chunk in enumerate(self.fChunks):
+      args = list(self.fArgs)
+      # Column info (and possibly other things) is not available w/ parseable 
+      # output so only use it where we need to get the file name b/c we're
+      # scanning multiple files or a package directory
+      if self.fJSONOutput:
+        args.append('--output-format=json')
+      elif len(self.fChunks) > 1 or len(chunk) > 1 or os.path.isdir(chunk[0]):
+        args.append('--output-format=parseable')
+      parser = pylintparser.create_parser(self.fJSONOutput, self.fRunDir, chunk[0])
+      for filename in chunk:
+        args.append(filename.encode(config.kFileSystemEncoding))
+      args = tuple(args)
+      if self.fWorkerPython is not None:
+        print 'pylint worker %i:' % i, ' '.join(args)
+        worker = _get_worker(i, self.fWorkerPython, self.fEnv)
+        handler = worker.Execute(self.fRunDir, args)
       else:
-        if len(stderr.strip()) > 0:
-          print "pylint stderr:\n", stderr.rstrip()
-        print "pylint stdout:\n", stdout.rstrip()
-        _update_tree(stdout)
+        print self.fCmd, ' '.join(args)
+        handler = app.AsyncExecuteCommandLineE(self.fCmd, self.fRunDir, self.fEnv, *args)
+      self.fRunning.append(_CPylintProcess(handler, chunk, parser))
+      
+    app.InstallTimeout(100, self.__Poll)
+    
+  def IsFinished(self):
+    return self.fFinished
+  
+  def Cancel(self):
+    """Stop all pylint processes that are still running, keeping the
+    results shown so far"""
+    
+    if self.fFinished:
+      return
+    for process in self.fRunning:
+      process.fHandler.Terminate(kill=True)
+    self.fRunning = []
+    self.fFinished = True
+    self.fView.end_update(self, complete=False)
+    self.fView._ShowStatusMessage('')
+    
+  def __Poll(self):
+    app = wingapi.gApplication
+    view = self.fView
+    
+    if self.fFinished:
+      # Cancelled
+      return False
+    
+    for process in list(self.fRunning):
+      if process.fHandler.Iterate():
+        self.fRunning.remove(process)
+        self.fFinishedCount += 1
+        stdout, stderr, err, status = process.fHandler.Terminate()
+        _record_lint_time(lintsupport.expand_python_files(process.fChunk), 
+                          time.time() - process.fStartTime)
+        if err or (not stdout and kPyLintVersion < '0.24'):
+          app.ShowMessageDialog(_("PyLint Failed"), _("Error executing PyLint:  Command failed with error=%s, status=%s; stderr:\n%s") % (err, status, stderr))
+        else:
+          if len(stderr.strip()) > 0:
+            print "pylint stderr:\n", stderr.rstrip()
+          print "pylint stdout:\n", stdout.rstrip()
+          self.__AddLines(process, process.ReadFinalLines(stdout))
+          self.__AddMessages(process.fParser.Finish())
+      else:
+        self.__AddLines(process, process.ReadLines())
+          
+    if not self.fRunning:
+      self.__Flush()
+      self.fFinished = True
+      view.end_update(self, complete=True)
+      view._ShowStatusMessage('')
       print '-' * 60
       return False
-    elif time.time() > start_time + timeout:
+    
+    elif time.time() > self.fStartTime + self.fTimeout:
+      self.__Flush()
+      view.end_update(self, complete=False)
       view._ShowStatusMessage('')
-      stdout, stderr, err, status = handler.Terminate()      
-      app.ShowMessageDialog(_("PyLint Timed Out"), _("PyLint timed out:  Command did not complete within timeout of %i seconds.  Right click on the PyLint tool to configure this value.  Output from PyLint:\n\n%s") % (timeout, stderr + stdout))
+      output = []
+      for process in self.fRunning:
+        stdout, stderr, err, status = process.fHandler.Terminate()
+        output.append(stderr + stdout)
+      self.fRunning = []
+      self.fFinished = True
+      app.ShowMessageDialog(_("PyLint Timed Out"), _("PyLint timed out:  Command did not complete within timeout of %i seconds.  Right click on the PyLint tool to configure this value.  Output from PyLint:\n\n%s") % (self.fTimeout, ''.join(output)))
       print '-' * 60
       return False
+    
     else:
-      if int(time.time()) > last_dot[0]:
-        dots.append('.')
-        if len(dots) > 3:
-          while dots:
-            dots.pop()
-        view._ShowStatusMessage(base_msg + ''.join(dots))
-        last_dot[0] = int(time.time())
+      if time.time() > self.fLastUpdate + kStreamUpdateInterval:
+        self.__Flush()
+      if int(time.time()) > self.fLastDot:
+        self.fDots += '.'
+        if len(self.fDots) > 3:
+          self.fDots = ''
+        msg = self.fBaseMsg
+        if len(self.fChunks) > 1:
+          msg = _("%s (%i of %i done)") % (msg, self.fFinishedCount, len(self.fChunks))
+        view._ShowStatusMessage(msg + self.fDots)
+        self.fLastDot = int(time.time())
       return True
     
-  wingapi.gApplication.InstallTimeout(100, poll)
+  def __AddLines(self, process, lines):
+    """Parse the given output lines and add any messages found to the
+    view"""
+    
+    self.__AddMessages(process.fParser.ParseLines(lines))
+
+  def __AddMessages(self, messages):
+    add_message = self.fView.add_message
+    for message in messages:
+      add_message(*message)
+    self.fPendingCount += len(messages)
+    
+  def __Flush(self):
+    """Show all messages added since the last flush"""
+    
+    self.fLastUpdate = time.time()
+    if self.fPendingCount == 0:
+      return
+    self.fView.update_tree_contents()
+    self.fPendingCount = 0
 
 def _GetMimeType(filename):
   loc = location.CreateFromName(filename)
@@ -535,10 +950,18 @@ class _CPylintView(wingview.CViewController):
 
     self.fTrees = {}
     self.fLabels = {}
+    self.fModels = {}
+    self.fStore = lintsupport.CMessageStore(len(gMessageCategories))
+    self.fDiff = lintsupport.CMessageDiff(self.fStore)
+    self.fActiveRun = None
+    self.fShowFilenames = True
+    self.fBaseNames = {}
     
     self.__CreateGui()
+    self.__CreateModels()
 
     _init_pylint_version()
+    _init_lint_on_save()
 
     # Remember that this is the default view now
     gTheView = self
@@ -547,23 +970,118 @@ class _CPylintView(wingview.CViewController):
     for tree, sview in self.fTrees.values():
       sview.destroy()
 
-  def set_tree_contents(self, tree_contents):
+  def begin_update(self, run, show_filenames):
+    """Start showing the results of the given run.  Its messages are
+    compared to those already shown for the files it lints, so only new
+    and resolved messages change the trees.  When show_filenames is set
+    messages are labeled with their file name as well as line."""
+    
+    if self.fActiveRun is not None and self.fActiveRun is not run:
+      self.fActiveRun.Cancel()
+    self.fActiveRun = run
+    
+    if self.fStore.NeedsCompacting():
+      self.fStore.Compact()
+      self.__CreateModels()
+    if show_filenames != self.fShowFilenames:
+      self.fShowFilenames = show_filenames
+      for tree, sview in self.fTrees.values():
+        tree.queue_draw()
+    self.fDiff = lintsupport.CMessageDiff(self.fStore, run.GetLintedPaths())
+
+  def add_message(self, category, path, line, col, msg_type, msg_descr):
+    """Add a message from the current run"""
+    
+    self.fDiff.Add(category, path, line, col, msg_type, msg_descr)
+
+  def end_update(self, run, complete):
+    """Finish showing the results of the given run.  If it completed, the
+    messages that it did not report are removed as resolved."""
+    
+    if run is not self.fActiveRun:
+      return
+    self.fActiveRun = None
+    diff = self.fDiff
+    if complete:
+      resolved = diff.GetResolvedRows()
+      if len(resolved) > kMaxIncrementalRemove:
+        self.fStore.Remove(resolved)
+        self.__CreateModels()
+      else:
+        self.fStore.Remove(resolved, self.__CB_RowDeleted)
+    self.update_tree_contents()
+    
+    if complete:
+      idx = 0
+      for catkey, labeltext, tooltip in gMessageCategories:
+        self.fLabels[catkey].set_text(_("%s (%i: %i new, %i resolved)") % (
+          labeltext, self.fStore.GetCount(idx), diff.fNewCounts[idx],
+          diff.fResolvedCounts[idx]))
+        idx += 1
+      wingapi.gApplication.SetStatusMessage(
+        _("PyLint: %i new, %i resolved, %i unchanged messages") % (
+          diff.fNewCount, diff.GetResolvedCount(), diff.GetUnchangedCount()))
+
+  def update_tree_contents(self):
+    """Show messages added or moved since the last update"""
+    
+    for row in self.fDiff.PopChangedRows():
+      pos = self.fStore.GetPosition(row)
+      if pos is not None:
+        catkey = gMessageCategories[self.fStore.GetCategory(row)][0]
+        self.fModels[catkey].NotifyChanged(pos)
+    
     idx = 0
     for catkey, labeltext, tooltip in gMessageCategories:
-      label = gTheView.fLabels[catkey]
-      label.set_text('%s (%i)' % (labeltext, len(tree_contents[idx])))
-      tree, sview = gTheView.fTrees[catkey]
-      tree.set_contents(tree_contents[idx])
-      cols = tree.get_columns()
+      self.fModels[catkey].NotifyAppended()
+      self.fLabels[catkey].set_text('%s (%i)' % (labeltext, self.fStore.GetCount(idx)))
+      idx += 1
+      
+      # Show 'col' column only if any column is > 0
+      if self.fStore.fHasColumns:
+        tree, sview = self.fTrees[catkey]
+        tree.get_columns()[1].set_visible(True)
 
-      cols[1].set_visible(False)
-      for row in tree_contents[idx]:
-        if row[0][1] != '0':
-          cols[1].set_visible(True)
-          break
-        
+  def __CreateModels(self):
+    """Create tree models for the current contents of the message store"""
+    
+    idx = 0
+    for catkey, labeltext, tooltip in gMessageCategories:
+      tree, sview = self.fTrees[catkey]
+      model = lintsupport.CMessageListModel(self.fStore.GetCategoryRows(idx), 5,
+                                            self.__GetValue)
+      model.NotifyAppended()
+      tree.set_model(model)
+      tree.get_columns()[1].set_visible(self.fStore.fHasColumns)
+      self.fModels[catkey] = model
+      self.fLabels[catkey].set_text('%s (%i)' % (labeltext, self.fStore.GetCount(idx)))
       idx += 1
 
+  def __CB_RowDeleted(self, category, pos):
+    catkey = gMessageCategories[category][0]
+    self.fModels[catkey].NotifyDeleted(pos)
+
+  def __GetValue(self, row, column):
+    """Format the value shown in given column for given message store row"""
+    
+    store = self.fStore
+    if column == 0:
+      if self.fShowFilenames:
+        path = store.GetPath(row)
+        basename = self.fBaseNames.get(path)
+        if basename is None:
+          basename = self.fBaseNames[path] = os.path.basename(path)
+        return '%s:%i' % (basename, store.GetLine(row))
+      return str(store.GetLine(row))
+    elif column == 1:
+      return str(store.GetColumn(row))
+    elif column == 2:
+      return store.GetMsgId(row) + ": " + store.GetDescr(row)
+    elif column == 3:
+      return store.GetPath(row)
+    else:
+      return str(store.GetLine(row))
+
   ##########################################################################
   # Inherited calls from wingview.CViewController 
   ##########################################################################
@@ -670,7 +1188,7 @@ class _CPylintView(wingview.CViewController):
     pos = self.__fNotebook.get_current_page()
     catkey, label, tdir = gMessageCategories[pos]
     tree, sview = self.fTrees[catkey]
-    rows = tree.GetSelectedContent()
+    paths = tree.GetSelectedPaths()
 
   def __CB_ButtonPress(self, tree, event):
     app = wingapi.gApplication
@@ -690,10 +1208,11 @@ class _CPylintView(wingview.CViewController):
       self.__PopupMenu(event, (event.x_root, event.y_root))
       return 1
   
-    selected = tree.GetSelectedContent()
-    if selected is not None and len(selected) != 0:
-      filename = selected[0][3]
-      line = int(selected[0][4])
+    selected_paths = tree.GetSelectedPaths()
+    if selected_paths:
+      row = tree.get_model().GetRow(selected_paths[0])
+      filename = self.fStore.GetPath(row)
+      line = self.fStore.GetLine(row)
       if event.button == 1 and event.type == wgtk.gdk.BUTTON_PRESS:
         doc = app.OpenEditor(filename)
         doc.ScrollToLine(lineno=line-1, pos='center', select=1)
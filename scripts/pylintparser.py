@@ -0,0 +1,232 @@
+"""
+Parsers for PyLint output, used by the PyLint panel.
+
+This is not a Wing IDE script.  It is imported by pylintpanel.py and can
+also be run directly to benchmark the parsers:
+
+  python pylintparser.py [lines]
+
+which parses a generated log with the given number of lines (1000000 by
+default) in each of the supported output formats and prints the
+throughput in lines per second.
+
+Copyright (c) 2006-2007 Markus Meyer <meyer@mesw.de>
+
+See pylintpanel.py for the license terms.
+"""
+
+# Not a script: Wing should not try to find commands in this module
+_ignore_scripts = 1
+
+import os
+import re
+
+try:
+  import json
+except ImportError:
+  json = None
+
+# All text output formats are matched by one expression, tried in order:
+#
+# * --output-format=parseable   a.py:12: [C0111(missing-docstring), f] Descr
+# * text (pylint 1.x and later) a.py:12:4: C0111: Descr
+# * text (older pylint)         C0111: 12,4: Descr   or   C: 12: Descr
+#
+# Lines that are not messages (module headers, reports) do not match
+kMessageExpr = re.compile(
+  r"(?:(?P<ppath>(?:[A-Za-z]:)?[^:]+):(?P<pline>[0-9]+)(?:,[0-9]+)?:[ ]*"
+  r"\[(?P<ptype>[^\]]*)\][ ]*(?P<pdescr>.*)"
+  r"|(?P<tpath>(?:[A-Za-z]:)?[^:]+):(?P<tline>[0-9]+):(?P<tcol>[0-9]+):[ ]*"
+  r"(?P<ttype>[A-Z][0-9]+):[ ]*(?P<tdescr>.*)"
+  r"|(?P<type>[A-Z][0-9]*):[ ]*(?P<line>[0-9]+)(?:,[ ]*(?P<col>[0-9]+))?:[ ]*"
+  r"(?P<descr>.*))")
+
+# Message category index by first letter of the message id
+kCategoryIndex = {'F': 0, 'E': 0, 'W': 1}
+kDefaultCategoryIndex = 2
+
+def _version_tuple(version):
+  parts = []
+  for part in version.split('.'):
+    digits = re.match('[0-9]*', part).group()
+    if not digits:
+      break
+    parts.append(int(digits))
+  return tuple(parts)
+
+def supports_json(version):
+  """Check whether the given pylint version has the JSON output format"""
+
+  return json is not None and version is not None and \
+         _version_tuple(version) >= (1, 7)
+
+class CTextParser:
+  """Parses pylint's text output line by line, so messages can be shown as
+  they arrive.  Paths in the output are resolved against the directory
+  pylint was run in once per module.  The filename is used for messages
+  in the older text format, which doesn't include the file name."""
+
+  def __init__(self, rundir, filename):
+    self.fRunDir = rundir
+    self.fFileName = filename
+    self.fPaths = {}
+
+  def ParseLines(self, lines):
+    """Parse the given complete lines of output.  Returns a list of
+    (msg_index, fullpath, line, col, msg_type, msg_descr) tuples with the
+    message category index and message details."""
+
+    match = kMessageExpr.match
+    paths = self.fPaths
+    categories = kCategoryIndex
+    messages = []
+    for line in lines:
+      m = match(line)
+      if m is None:
+        continue
+      ptype, ttype, msg_type = m.group('ptype', 'ttype', 'type')
+      if ptype is not None:
+        path, msg_line, msg_type, msg_descr = m.group('ppath', 'pline', 'ptype', 'pdescr')
+        msg_col = 0
+        if ',' in msg_type:
+          msg_type, obj = msg_type.split(',', 1)
+          obj = obj.strip()
+          if obj:
+            msg_descr = obj + ': ' + msg_descr
+        msg_type = msg_type.strip()
+      elif ttype is not None:
+        path, msg_line, msg_col, msg_type, msg_descr = m.group(
+          'tpath', 'tline', 'tcol', 'ttype', 'tdescr')
+      else:
+        path = None
+        msg_line, msg_col, msg_descr = m.group('line', 'col', 'descr')
+
+      if path is None:
+        fullpath = self.fFileName
+      else:
+        fullpath = paths.get(path)
+        if fullpath is None:
+          fullpath = paths[path] = os.path.join(self.fRunDir, path)
+      messages.append((categories.get(msg_type[:1], kDefaultCategoryIndex),
+                       fullpath, int(msg_line), int(msg_col or 0), msg_type,
+                       msg_descr.strip()))
+    return messages
+
+  def Finish(self):
+    """Get any messages that can only be parsed once all output has been
+    received"""
+
+    return []
+
+class CJSONParser:
+  """Parses pylint's --output-format=json output.  Pylint writes it all
+  at the end of the run, so the lines are collected and parsed when the
+  output is complete."""
+
+  def __init__(self, rundir, filename):
+    self.fRunDir = rundir
+    self.fFileName = filename
+    self.fLines = []
+
+  def ParseLines(self, lines):
+    self.fLines.extend(lines)
+    return []
+
+  def Finish(self):
+    text = '\n'.join(self.fLines)
+    self.fLines = []
+    # Skip anything written before the output, such as warnings
+    start = text.find('[')
+    if start < 0:
+      return []
+    try:
+      items = json.loads(text[start:])
+    except ValueError:
+      return []
+
+    paths = {}
+    messages = []
+    for item in items:
+      msg_type = item.get('message-id') or item.get('type', '?')[:1].upper()
+      symbol = item.get('symbol')
+      if symbol:
+        msg_type = '%s(%s)' % (msg_type, symbol)
+      msg_descr = item.get('message', '')
+      if item.get('obj'):
+        msg_descr = item['obj'] + ': ' + msg_descr
+      path = item.get('path')
+      if path:
+        fullpath = paths.get(path)
+        if fullpath is None:
+          fullpath = paths[path] = os.path.join(self.fRunDir, path)
+      else:
+        fullpath = self.fFileName
+      messages.append((kCategoryIndex.get(msg_type[:1], kDefaultCategoryIndex),
+                       fullpath, int(item.get('line') or 0),
+                       int(item.get('column') or 0), msg_type, msg_descr))
+    return messages
+
+def create_parser(json_output, rundir, filename):
+  """Create a parser for the output of one pylint process"""
+
+  if json_output:
+    return CJSONParser(rundir, filename)
+  return CTextParser(rundir, filename)
+
+######################################################################
+# Benchmark
+
+def _make_fixture(line_count, output_format):
+  """Generate pylint output with the given number of lines, spread over a
+  few hundred modules"""
+
+  import random
+  rand = random.Random(0)
+  types = [('C0111', 'missing-docstring', 'Missing docstring'),
+           ('W0611', 'unused-import', 'Unused import os'),
+           ('E1101', 'no-member', "Instance of 'A' has no 'b' member"),
+           ('R0913', 'too-many-arguments', 'Too many arguments (7/5)')]
+  if output_format == 'json':
+    items = []
+    for i in range(line_count // 13):
+      msgid, symbol, descr = rand.choice(types)
+      items.append({'type': 'convention', 'module': 'pkg.mod%i' % (i % 300),
+                    'obj': 'func%i' % (i % 50), 'line': rand.randint(1, 2000),
+                    'column': rand.randint(0, 40), 'path': 'pkg/mod%i.py' % (i % 300),
+                    'symbol': symbol, 'message': descr, 'message-id': msgid})
+    return json.dumps(items, indent=4).split('\n')
+
+  lines = []
+  for i in range(line_count):
+    msgid, symbol, descr = rand.choice(types)
+    path = 'pkg/mod%i.py' % ((i // 200) % 300)
+    if i % 200 == 0:
+      lines.append('************* Module pkg.mod%i' % ((i // 200) % 300))
+    elif output_format == 'parseable':
+      lines.append('%s:%i: [%s(%s), func%i] %s' % (path, rand.randint(1, 2000),
+                                                   msgid, symbol, i % 50, descr))
+    else:
+      lines.append('%s:%i:%i: %s: %s (%s)' % (path, rand.randint(1, 2000),
+                                              rand.randint(0, 40), msgid, descr, symbol))
+  return lines
+
+def _benchmark(line_count):
+  import time
+  formats = ['text', 'parseable']
+  if json is not None:
+    formats.append('json')
+  for output_format in formats:
+    lines = _make_fixture(line_count, output_format)
+    parser = create_parser(output_format == 'json', '/src', 'pkg/mod0.py')
+    start = time.time()
+    count = len(parser.ParseLines(lines)) + len(parser.Finish())
+    elapsed = max(time.time() - start, 1e-6)
+    print('%-10s %8i lines %8i messages %6.2fs %10i lines/sec' % (
+      output_format, len(lines), count, elapsed, len(lines) / elapsed))
+
+if __name__ == '__main__':
+  import sys
+  if len(sys.argv) > 1:
+    _benchmark(int(sys.argv[1]))
+  else:
+    _benchmark(1000000)
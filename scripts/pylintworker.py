@@ -0,0 +1,216 @@
+"""
+Persistent PyLint worker process for the PyLint panel.
+
+This is not a Wing IDE script.  It is run by pylintpanel.py under the
+Python that has pylint installed, when the panel is configured to use
+"engine = worker".  The worker keeps pylint and astroid (or logilab.astng
+for older pylint versions) imported across runs, so the inference cache for
+unchanged modules is reused and interpreter startup is paid only once.
+
+Protocol, over stdin and stdout:
+
+* On startup the worker writes a line "\\0VERSION <pylint version>"
+* Each request is a line "RUN <n>" followed by n lines: the directory to
+  run in and then the pylint command line arguments, one per line
+* The worker writes pylint's output as it is produced, followed by a line
+  "\\0DONE <status>"
+
+Copyright (c) 2006-2007 Markus Meyer <meyer@mesw.de>
+
+See pylintpanel.py for the license terms.
+"""
+
+# Not a script: Wing should not try to find commands in this module
+_ignore_scripts = 1
+
+import os
+import sys
+import time
+
+kMarker = '\0'
+
+class _CLineWriter:
+  """Stream that passes pylint's output through to the real stdout, one
+  complete line at a time so the IDE can show messages as they arrive"""
+
+  def __init__(self, stream):
+    self.fStream = stream
+    self.fPartial = ''
+
+  def write(self, txt):
+    txt = self.fPartial + txt
+    pos = txt.rfind('\n')
+    if pos < 0:
+      self.fPartial = txt
+      return
+    self.fPartial = txt[pos+1:]
+    self.fStream.write(txt[:pos+1])
+    self.fStream.flush()
+
+  def flush(self):
+    if self.fPartial:
+      self.fStream.write(self.fPartial + '\n')
+      self.fPartial = ''
+    self.fStream.flush()
+
+  def isatty(self):
+    return False
+
+def _get_pylint_version():
+  try:
+    import pylint
+    return pylint.__version__
+  except AttributeError:
+    from pylint import __pkginfo__
+    return __pkginfo__.version
+
+def _get_manager():
+  """Get the astroid manager that holds the cache of inferred modules"""
+
+  try:
+    from astroid import MANAGER
+  except ImportError:
+    from logilab.astng import MANAGER
+  return MANAGER
+
+class _CCacheValidator:
+  """Drops cached modules whose file has changed on disk since it was
+  parsed, keeping the inference results for all other modules.  The
+  modification time and size of each module are recorded after the run
+  that parsed it, and only if the file hasn't changed since that run
+  started.  Since modification times may only have a resolution of one
+  second, a file changed less than a second before the run started
+  counts as changed during the run."""
+
+  def __init__(self, manager):
+    self.fManager = manager
+    self.fStamps = {}
+
+  def __GetCache(self):
+    for name in ('astroid_cache', 'astng_cache'):
+      cache = getattr(self.fManager, name, None)
+      if cache is not None:
+        return cache
+    return {}
+
+  def __GetStamp(self, module):
+    """Get (mtime, size) of the file of the given module, or None"""
+
+    filename = getattr(module, 'file', None)
+    if not filename:
+      return None
+    try:
+      st = os.stat(filename)
+    except OSError:
+      return None
+    return st.st_mtime, st.st_size
+
+  def Validate(self):
+    """Remove stale modules from the cache before a run.  Returns the
+    number removed."""
+
+    cache = self.__GetCache()
+    removed = 0
+    for modname, module in list(cache.items()):
+      if not getattr(module, 'file', None):
+        continue
+      known = self.fStamps.get(modname)
+      if known is None or known != self.__GetStamp(module):
+        del cache[modname]
+        self.fStamps.pop(modname, None)
+        removed += 1
+    return removed
+
+  def Record(self, start_time):
+    """Remember the modification times and sizes of the modules parsed
+    during the run that started at start_time.  Modules whose file changed
+    during the run, or too close to its start to tell, may have been
+    parsed from the old text, so they are dropped."""
+
+    cache = self.__GetCache()
+    for modname, module in list(cache.items()):
+      if modname in self.fStamps or not getattr(module, 'file', None):
+        continue
+      stamp = self.__GetStamp(module)
+      if stamp is not None and stamp[0] < start_time - 1:
+        self.fStamps[modname] = stamp
+      else:
+        del cache[modname]
+
+def _run_accepts_exit():
+  """Check whether pylint's Run accepts exit=False, which older versions
+  don't"""
+
+  import inspect
+  from pylint import lint
+  init = lint.Run.__init__
+  if hasattr(inspect, 'signature'):
+    return 'exit' in inspect.signature(init).parameters
+  return 'exit' in inspect.getargspec(init)[0]
+
+def _run_pylint(args, out, accepts_exit):
+  from pylint import lint
+
+  saved_stdout = sys.stdout
+  sys.stdout = out
+  try:
+    try:
+      if accepts_exit:
+        lint.Run(args, exit=False)
+      else:
+        lint.Run(args)
+      status = 0
+    except SystemExit:
+      status = sys.exc_info()[1].code or 0
+  finally:
+    out.flush()
+    sys.stdout = saved_stdout
+  return status
+
+def _read_request(stdin):
+  line = stdin.readline()
+  if not line:
+    return None
+  words = line.split()
+  if len(words) != 2 or words[0] != 'RUN':
+    return []
+  count = int(words[1])
+  return [stdin.readline().rstrip('\r\n') for i in range(count)]
+
+def main():
+  stdin = sys.stdin
+  stdout = sys.stdout
+
+  stdout.write('%sVERSION %s\n' % (kMarker, _get_pylint_version()))
+  stdout.flush()
+
+  validator = _CCacheValidator(_get_manager())
+  accepts_exit = _run_accepts_exit()
+  out = _CLineWriter(stdout)
+  while True:
+    request = _read_request(stdin)
+    if request is None:
+      break
+    if len(request) < 1:
+      stdout.write('%sDONE 1\n' % kMarker)
+      stdout.flush()
+      continue
+    rundir, args = request[0], request[1:]
+    try:
+      os.chdir(rundir)
+      validator.Validate()
+      start_time = time.time()
+      try:
+        status = _run_pylint(args, out, accepts_exit)
+      finally:
+        validator.Record(start_time)
+    except Exception:
+      import traceback
+      out.write(''.join(traceback.format_exception(*sys.exc_info())))
+      out.flush()
+      status = 1
+    stdout.write('%sDONE %s\n' % (kMarker, status))
+    stdout.flush()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,235 @@
+"""Support code for sorting lines in editor-extensions.py.
+
+This is not a Wing IDE script.  It is imported by editor-extensions.py
+and does not define any commands itself.  It can also be run directly to
+benchmark the sort modes:
+
+  python sortsupport.py [lines]
+
+which sorts generated text with the given number of lines (1000000 by
+default) in each mode and prints the time taken.
+
+Copyright (c) 2005-2008, Wingware All rights reserved.
+
+See editor-extensions.py for the license terms.
+"""
+
+# Not a script: Wing should not try to find commands in this module
+_ignore_scripts = 1
+
+import re
+import heapq
+import tempfile
+import itertools
+
+# Sort modes: alphabetically, with runs of digits compared as numbers, or
+# ignoring case
+kSortModes = ('plain', 'natural', 'nocase')
+
+# More lines than this are sorted in runs of this many lines that are
+# written to temporary files and then merged, so the keys for all the
+# lines don't have to be held in memory at once
+kExternalSortLines = 1000000
+
+_kNumberExpr = re.compile(r'([0-9]+)')
+
+def _encode_number(m):
+  digits = m.group().lstrip('0') or '0'
+  if len(digits) < 999:
+    return '%03d' % len(digits) + digits
+  # Longer runs are rare enough for a longer prefix, which still sorts
+  # after all the shorter ones
+  return '999%09d' % len(digits) + digits
+
+def _natural_key(txt):
+  # Prefixing each number with its length makes numbers compare by value
+  # in a plain string comparison, which is much faster than comparing
+  # lists of strings and ints.  The prefix is made of digits only, so
+  # numbers still sort before letters and after spaces and punctuation
+  # that sort before digits, as in a plain sort.
+  return _kNumberExpr.sub(_encode_number, txt)
+
+def _nocase_key(txt):
+  return txt.lower()
+
+def make_key(mode='plain', field=0, separator=None, column=0):
+  """Create the function that computes the sort key for a line, or None to
+  compare whole lines.  The key is computed from the given 1-based field
+  of the line, split on separator or on whitespace if it is None, or from
+  the whole line if field is 0.  Characters before column in the line or
+  field are ignored."""
+
+  if mode not in kSortModes:
+    raise ValueError("Unknown sort mode %r" % mode)
+  if mode == 'plain' and field == 0 and column == 0:
+    return None
+
+  compare = {'natural': _natural_key, 'nocase': _nocase_key}.get(mode)
+  def key(line):
+    if field > 0:
+      parts = line.split(separator, field)
+      if len(parts) < field:
+        line = ''
+      else:
+        line = parts[field-1]
+    if column > 0:
+      line = line[column:]
+    if compare is not None:
+      return compare(line)
+    return line
+  return key
+
+class _CReversed:
+  """Wraps a sort key so that it compares in reverse order"""
+
+  def __init__(self, key):
+    self.fKey = key
+
+  def __lt__(self, other):
+    return other.fKey < self.fKey
+
+  def __eq__(self, other):
+    return self.fKey == other.fKey
+
+def _sort_in_memory(lines, key, reverse, unique):
+  if key is None:
+    lines = sorted(lines, reverse=reverse)
+    if unique:
+      lines = [line for i, line in enumerate(lines) if i == 0 or line != lines[i-1]]
+    return lines
+
+  # Compute each key once and sort indices, which keeps equal lines in
+  # their original order even when sorting in reverse
+  keys = [key(line) for line in lines]
+  order = sorted(range(len(lines)), key=keys.__getitem__, reverse=reverse)
+  if unique:
+    order = [index for i, index in enumerate(order)
+             if i == 0 or keys[index] != keys[order[i-1]]]
+  return [lines[index] for index in order]
+
+def _write_run(lines):
+  run = tempfile.TemporaryFile()
+  for line in lines:
+    if isinstance(line, unicode):
+      line = line.encode('utf-8')
+    run.write(line + '\n')
+  run.seek(0)
+  return run
+
+def _merge_runs(runs, key, reverse, unique, decode):
+  if key is None:
+    key = lambda line: line
+  if reverse:
+    wrap = _CReversed
+  else:
+    wrap = lambda k: k
+
+  def read(i):
+    line = runs[i].readline()
+    if not line:
+      return
+    line = line[:-1]
+    if decode:
+      line = line.decode('utf-8')
+    heapq.heappush(heap, (wrap(key(line)), i, line))
+
+  heap = []
+  for i in range(len(runs)):
+    read(i)
+  result = []
+  last_key = None
+  while heap:
+    line_key, i, line = heapq.heappop(heap)
+    if not unique or not result or not line_key == last_key:
+      result.append(line)
+      last_key = line_key
+    read(i)
+  return result
+
+def sort_lines(lines, key=None, reverse=False, unique=False):
+  """Sort the given iterable of lines, which must not contain newlines,
+  using the key function from make_key().  Sorting is stable, also in
+  reverse.  If unique is set, only the first of the lines with the same
+  key is kept.  Returns a new list of lines."""
+
+  lines = iter(lines)
+  first = list(itertools.islice(lines, kExternalSortLines))
+  rest = list(itertools.islice(lines, 1))
+  if not rest:
+    return _sort_in_memory(first, key, reverse, unique)
+
+  # Too many lines: sort runs of lines into temporary files and merge them
+  decode = len(first) > 0 and isinstance(first[0], unicode)
+  runs = []
+  try:
+    runs.append(_write_run(_sort_in_memory(first, key, reverse, unique)))
+    del first
+    lines = itertools.chain(rest, lines)
+    while True:
+      run = list(itertools.islice(lines, kExternalSortLines))
+      if not run:
+        break
+      runs.append(_write_run(_sort_in_memory(run, key, reverse, unique)))
+      del run
+    return _merge_runs(runs, key, reverse, unique, decode)
+  finally:
+    for run in runs:
+      run.close()
+
+######################################################################
+# Benchmark
+
+def _make_fixture(line_count):
+  """Generate lines of mixed case words, numbers and fields, with some
+  repeated lines"""
+
+  import random
+  rand = random.Random(0)
+  words = ['alpha', 'Beta', 'gamma', 'Delta', 'epsilon', 'Zeta', 'eta']
+  lines = []
+  for i in range(line_count):
+    if i > 0 and rand.random() < 0.1:
+      lines.append(lines[rand.randrange(len(lines))])
+      continue
+    lines.append('%s%i %s %i' % (rand.choice(words), rand.randint(0, 5000),
+                                 rand.choice(words), rand.randint(0, 100000)))
+  return lines
+
+def _benchmark(line_count):
+  import time
+  global kExternalSortLines
+
+  lines = _make_fixture(line_count)
+  cases = [
+    ('plain', {}, {}),
+    ('nocase', {'mode': 'nocase'}, {}),
+    ('natural', {'mode': 'natural'}, {}),
+    ('field 3', {'field': 3, 'mode': 'natural'}, {}),
+    ('column 4', {'column': 4}, {}),
+    ('unique', {}, {'unique': True}),
+    ('reverse', {'mode': 'nocase'}, {'reverse': True}),
+  ]
+  external_lines = max(1, line_count // 8)
+  saved_lines = kExternalSortLines
+  for external in (False, True):
+    if external:
+      kExternalSortLines = external_lines
+    try:
+      for name, key_args, sort_args in cases:
+        if external:
+          name += ' (external)'
+        key = make_key(**key_args)
+        start = time.time()
+        count = len(sort_lines(lines, key, **sort_args))
+        elapsed = max(time.time() - start, 1e-6)
+        print('%-20s %8i lines %8i sorted %6.2fs %10i lines/sec' % (
+          name, len(lines), count, elapsed, len(lines) / elapsed))
+    finally:
+      kExternalSortLines = saved_lines
+
+if __name__ == '__main__':
+  import sys
+  if len(sys.argv) > 1:
+    _benchmark(int(sys.argv[1]))
+  else:
+    _benchmark(1000000)
@@ -0,0 +1,916 @@
+"""Support code for the templating script.
+
+This is not a Wing IDE script.  It is imported by templating.py and does
+not define any commands itself.  It can also be run directly to benchmark
+template expansion:
+
+  python templatesupport.py [size]
+
+which compiles generated templates of about the given size in bytes (32768
+by default) and prints how quickly they are expanded.
+
+Copyright (c) 2005-2008, Wingware All rights reserved.
+
+See templating.py for the license terms.
+"""
+
+# Not a script: Wing should not try to find commands in this module
+_ignore_scripts = 1
+
+import os
+import re
+import time
+import bisect
+import zlib
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+######################################################################
+# Template compilation
+
+# Matches an argument spec such as %(name|string(40)|default)s but not
+# the escaped form %%(name)s
+kArgExpr = re.compile(r"(?<!%)%\((.*?)\)s")
+
+def parse_argspec(spec):
+  """Parse an argument spec of the form %(name|type|default)s.  Returns
+  (argname, argtype, size, default, flags) where argtype is one of
+  'string', 'filename', or 'date', size is the field width for 'string'
+  arguments, and flags may contain 'always-show' for names starting with !
+  and 'wrap-lines' for names starting with @."""
+
+  parts = spec[2:-2].split('|')
+  if len(parts) > 3:
+    parts = (parts[0], parts[1], '|'.join(parts[2:]))
+  argname = parts[0].strip().lower()
+  argtype = 'string'
+  default = None
+  if len(parts) > 1:
+    argtype = parts[1].strip().lower()
+    if argtype == '':
+      argtype = 'string'
+  if len(parts) > 2:
+    default = parts[2]
+
+  size = None
+  if argtype.startswith('string'):
+    if argtype.find('(') > 0:
+      size = int(argtype[argtype.find('(')+1:-1])
+    else:
+      size = 80
+    argtype = 'string'
+  elif argtype == 'filename':
+    pass
+  elif argtype.startswith('date'):
+    if argtype == 'date':
+      default = '$(__DATE_NOW__)'
+    else:
+      default = '$(__DATE_TIME_NOW__)'
+    argtype = 'date'
+  else:
+    raise NotImplementedError("Invalid argument type '%s'" % argtype)
+
+  flags = {}
+  while len(argname) > 0 and argname[0] in '!@':
+    if argname.startswith('!'):
+      argname = argname[1:]
+      flags['always-show'] = 1
+    if argname.startswith('@'):
+      argname = argname[1:]
+      flags['wrap-lines'] = 1
+
+  return argname, argtype, size, default, flags
+
+def find_wrap_prefix(txt):
+  """Find prefix to use in wrapping long lines for a value placed on
+  the last line of the given text.  Returns (prefix, prefix_line) where
+  prefix_line is the text on that line before the value."""
+
+  lines = txt.splitlines()
+  if len(lines) == 0:
+    return '', ''
+
+  line = lines[-1]
+  prefix_len = len(line) - len(line.lstrip(' \t#'))
+  return line[:prefix_len], line
+
+class CTemplate:
+  """A template compiled into literal text alternating with argument
+  slots.  The literals have the %% escapes already resolved and the wrap
+  prefix for arguments marked with @ is computed when compiling whenever
+  it doesn't depend on the value of the previous argument, so expanding
+  the template is a single pass over the slots and one join."""
+
+  # Wrap modes for slots
+  kNoWrap = 0
+  kFixedWrap = 1
+  kDynamicWrap = 2
+
+  def __init__(self, literals, slots):
+    # literals has one more item than slots: the text before each slot
+    # and then the text after the last one
+    self.fLiterals = literals
+    self.fSlots = slots
+    self.fSize = sum([len(literal) for literal in literals])
+
+    # (mode, prefix, prefix_line_len) for each slot.  The prefix of a
+    # slot whose preceding literal is on a single line depends on the
+    # text before it, which includes the previous argument's value.
+    self.fWraps = []
+    for i in range(len(slots)):
+      flags = slots[i][4]
+      literal = literals[i]
+      if not flags.get('wrap-lines', 0):
+        self.fWraps.append((self.kNoWrap, '', 0))
+      elif i == 0 or len(literal.splitlines()) > 1:
+        prefix, prefix_line = find_wrap_prefix(literal)
+        self.fWraps.append((self.kFixedWrap, prefix, len(prefix_line)))
+      else:
+        self.fWraps.append((self.kDynamicWrap, '', 0))
+    self.fHasWraps = len([w for w in self.fWraps if w[0] != self.kNoWrap]) > 0
+
+  def __getstate__(self):
+    return self.fLiterals, self.fSlots
+
+  def __setstate__(self, state):
+    self.__init__(*state)
+
+  def GetSlots(self):
+    """Get the (argname, argtype, size, default, flags) for each argument
+    slot, in the order they occur in the template"""
+
+    return self.fSlots
+
+  def GetPositions(self):
+    """Get the position of each argument slot in the template text with
+    all the arguments empty"""
+
+    positions = []
+    pos = 0
+    for literal in self.fLiterals[:-1]:
+      pos += len(literal)
+      positions.append(pos)
+    return positions
+
+  def HasWrappedArgs(self):
+    return self.fHasWraps
+
+  def Expand(self, values, wrap_column=None, wrap_cb=None):
+    """Expand the template with the given value for each slot, where None
+    is treated as an empty value.  Values for slots marked with @ are
+    passed through wrap_cb(value, width, prefix) if it is given.  Returns
+    (txt, tab_sequence) where tab_sequence contains the (end, start)
+    position of each value in the text."""
+
+    literals = self.fLiterals
+    wraps = self.fWraps
+    parts = [None] * (2 * len(values) + 1)
+    tab_sequence = []
+    pos = 0
+    value = ''
+    for i in range(len(values)):
+      literal = literals[i]
+      prev_value = value
+      value = values[i]
+      if value is None:
+        value = ''
+      mode, prefix, prefix_len = wraps[i]
+      if mode != self.kNoWrap and wrap_cb is not None:
+        if mode == self.kDynamicWrap:
+          prefix, prefix_line = find_wrap_prefix(literals[i-1] + prev_value + literal)
+          prefix_len = len(prefix_line)
+        value = wrap_cb(value, wrap_column - prefix_len, prefix)
+      parts[2*i] = literal
+      parts[2*i+1] = value
+      pos += len(literal) + len(value)
+      tab_sequence.append((pos, pos - len(value)))
+    parts[-1] = literals[-1]
+    return ''.join(parts), tab_sequence
+
+def compile_template(txt):
+  """Compile the given template text.  Raises NotImplementedError if an
+  argument spec has an invalid type."""
+
+  literals = []
+  slots = []
+  txtpos = 0
+  for match in kArgExpr.finditer(txt):
+    literals.append(txt[txtpos:match.start()].replace('%%', '%'))
+    slots.append(parse_argspec(match.group()))
+    txtpos = match.end()
+  literals.append(txt[txtpos:].replace('%%', '%'))
+  return CTemplate(literals, slots)
+
+######################################################################
+# Persistent caches
+
+# First byte of data saved in compressed form
+kCompressedMarker = 'z'.encode('ascii')
+
+def load_data(filename, version):
+  """Load data saved with save_data(), or return None if the file is
+  missing, unreadable, or written with a different version"""
+
+  try:
+    f = open(filename, 'rb')
+    try:
+      data = f.read()
+    finally:
+      f.close()
+    if data[:1] == kCompressedMarker:
+      data = zlib.decompress(data[1:])
+    saved_version, value = pickle.loads(data)
+  except Exception:
+    return None
+  if saved_version != version:
+    return None
+  return value
+
+def save_data(filename, version, value, compress=False):
+  """Write the given value to the given file, replacing the file only once
+  it has been written completely.  Errors are ignored, since the data
+  saved this way is only an optimization."""
+
+  tmpname = '%s.%i.tmp' % (filename, os.getpid())
+  try:
+    data = pickle.dumps((version, value), 2)
+    if compress:
+      data = kCompressedMarker + zlib.compress(data)
+    f = open(tmpname, 'wb')
+    try:
+      f.write(data)
+    finally:
+      f.close()
+    if os.name == 'nt' and os.path.exists(filename):
+      os.remove(filename)
+    os.rename(tmpname, filename)
+  except (IOError, OSError, pickle.PicklingError):
+    try:
+      os.remove(tmpname)
+    except OSError:
+      pass
+
+class CTemplateCache:
+  """On-disk cache of compiled templates, so templates are parsed only
+  when they change and not again in every session.  Entries are keyed by
+  the template's filename and are valid only as long as its modification
+  time and size are unchanged."""
+
+  # Increment when CTemplate or the cache layout changes
+  kVersion = 1
+
+  def __init__(self, filename):
+    self.fFileName = filename
+    self.fEntries = None
+    self.fDirty = False
+
+  def __Load(self):
+    self.fEntries = load_data(self.fFileName, self.kVersion) or {}
+
+  def Get(self, filename, st):
+    """Get the compiled template for the given file, given the result of
+    os.stat() on it, or None if it isn't in the cache or has changed"""
+
+    if self.fEntries is None:
+      self.__Load()
+    entry = self.fEntries.get(filename)
+    if entry is None or entry[:2] != (st.st_mtime, st.st_size):
+      return None
+    return entry[2]
+
+  def Set(self, filename, st, template):
+    if self.fEntries is None:
+      self.__Load()
+    self.fEntries[filename] = (st.st_mtime, st.st_size, template)
+    self.fDirty = True
+
+  def Remove(self, filename):
+    if self.fEntries is None:
+      self.__Load()
+    if self.fEntries.pop(filename, None) is not None:
+      self.fDirty = True
+
+  def Save(self):
+    """Write the cache to disk if it changed"""
+
+    if not self.fDirty:
+      return
+    self.fDirty = False
+    save_data(self.fFileName, self.kVersion, self.fEntries)
+
+######################################################################
+# Snippet index
+
+# Mime types for the language directories in the snippets tree.  Other
+# directories are indexed under their own name.
+kSnippetMimeTypes = {
+  'py': 'text/x-python',
+  'html': 'text/html',
+  'django': 'text/x-django',
+  'c': 'text/x-csrc',
+  'cpp': 'text/x-c++src',
+  'h': 'text/x-chdr',
+  'js': 'text/javascript',
+  'css': 'text/css',
+  'xml': 'text/xml',
+  'sh': 'text/x-sh',
+}
+
+# Suffix of the directories that hold the snippets for one context
+kContextSuffix = '.ctx'
+
+# Maximum length of the description shown for a snippet
+kMaxDescription = 60
+
+# Lines without any of these are skipped in descriptions, such as dividers
+kDescriptionExpr = re.compile('[A-Za-z0-9]')
+
+def snippet_description(txt):
+  """Get a short description of a snippet: its first line with some text,
+  with argument specs replaced by their names and any indent marker
+  removed"""
+
+  for line in txt.splitlines():
+    line = kArgExpr.sub(lambda m: m.group(1).split('|')[0].lstrip('!@ '), line)
+    line = line.replace('|!|', '').replace('%%', '%')
+    if line.startswith('|'):
+      bpos = line.find('|', 1)
+      if bpos > 0:
+        line = line[bpos+1:]
+    line = line.strip()
+    if kDescriptionExpr.search(line):
+      return line[:kMaxDescription]
+  return ''
+
+class CSnippetIndex:
+  """Index of the snippets trees, which contain a directory for each
+  language with the snippets that apply in any context and a *.ctx
+  directory for each syntactic context, for example py/class.ctx.
+
+  Snippets are looked up by (mime type, context, name prefix).  The index
+  is saved to a single file and is brought up to date by listing only the
+  directories whose modification time changed, and reading only the
+  snippets whose modification time or size changed, so snippet files are
+  normally not touched at all."""
+
+  # Increment when the saved layout changes
+  kVersion = 1
+
+  def __init__(self, snippet_dirs, filename):
+    self.fSnippetDirs = snippet_dirs
+    self.fFileName = filename
+    # dirname -> (mtime, subdirs, {name: (filename, mtime, size, description)})
+    self.fDirs = None
+    # (mime_type, context) -> (sorted names, [(name, filename, description)])
+    self.fKeys = None
+    # mime_type -> [(name, aliases, description)] for completion
+    self.fItems = {}
+
+  def __Load(self):
+    dirs = load_data(self.fFileName, self.kVersion)
+    if dirs is None:
+      dirs = {}
+    self.fDirs = dirs
+
+  def Update(self):
+    """Bring the index up to date with the snippets on disk, and save it if
+    it changed.  Returns whether anything changed."""
+
+    if self.fDirs is None:
+      self.__Load()
+      self.fKeys = None
+
+    seen = {}
+    changed = False
+    for root in self.fSnippetDirs:
+      if self.__UpdateDir(root, seen):
+        changed = True
+      for lang in self.fDirs[root][1]:
+        langdir = os.path.join(root, lang)
+        if self.__UpdateDir(langdir, seen):
+          changed = True
+        for ctx in self.fDirs[langdir][1]:
+          if ctx.endswith(kContextSuffix):
+            if self.__UpdateDir(os.path.join(langdir, ctx), seen):
+              changed = True
+
+    # Drop directories that are no longer part of any tree
+    for dirname in self.fDirs.keys():
+      if dirname not in seen:
+        del self.fDirs[dirname]
+        changed = True
+
+    if changed:
+      self.fKeys = None
+      save_data(self.fFileName, self.kVersion, self.fDirs, compress=True)
+    return changed
+
+  def __UpdateDir(self, dirname, seen):
+    """List the given directory again if it changed, reusing the entries
+    of unchanged snippets.  Returns whether its entry changed."""
+
+    seen[dirname] = 1
+    try:
+      mtime = os.stat(dirname).st_mtime
+    except OSError:
+      mtime = None
+    old = self.fDirs.get(dirname)
+    if old is not None and old[0] == mtime:
+      return False
+
+    subdirs = []
+    entries = {}
+    if mtime is not None:
+      try:
+        fnames = os.listdir(dirname)
+      except OSError:
+        fnames = []
+      fnames.sort()
+      old_entries = {}
+      if old is not None:
+        old_entries = old[2]
+      for fname in fnames:
+        if fname.startswith('.') or fname.endswith('~'):
+          continue
+        filename = os.path.join(dirname, fname)
+        try:
+          st = os.stat(filename)
+        except OSError:
+          continue
+        if os.path.isdir(filename):
+          subdirs.append(fname)
+          continue
+        name = os.path.splitext(fname)[0]
+        if name in entries:
+          continue
+        entry = old_entries.get(name)
+        if entry is None or entry[:3] != (filename, st.st_mtime, st.st_size):
+          entry = (filename, st.st_mtime, st.st_size, self.__ReadDescription(filename))
+        entries[name] = entry
+    self.fDirs[dirname] = (mtime, subdirs, entries)
+    return True
+
+  def __ReadDescription(self, filename):
+    try:
+      f = open(filename)
+      try:
+        txt = f.read()
+      finally:
+        f.close()
+    except (IOError, OSError):
+      return ''
+    return snippet_description(txt)
+
+  def Invalidate(self, filename):
+    """Note that the given snippet file changed.  Snippets are otherwise
+    only read again when the directory that contains them changes."""
+
+    if self.fDirs is None:
+      return
+    dirname = os.path.dirname(filename)
+    entry = self.fDirs.get(dirname)
+    if entry is not None:
+      self.fDirs[dirname] = (None,) + entry[1:]
+
+  def __GetKeys(self):
+    if self.fKeys is not None:
+      return self.fKeys
+    if self.fDirs is None:
+      self.Update()
+
+    # Later trees override earlier ones
+    merged = {}
+    for root in self.fSnippetDirs:
+      for lang in self.fDirs.get(root, (None, []))[1]:
+        mime_type = kSnippetMimeTypes.get(lang, lang)
+        langdir = os.path.join(root, lang)
+        mtime, subdirs, entries = self.fDirs.get(langdir, (None, [], {}))
+        merged.setdefault((mime_type, None), {}).update(entries)
+        for ctx in subdirs:
+          if ctx.endswith(kContextSuffix):
+            key = (mime_type, ctx[:-len(kContextSuffix)])
+            ctxdir = os.path.join(langdir, ctx)
+            merged.setdefault(key, {}).update(self.fDirs.get(ctxdir, (None, [], {}))[2])
+
+    self.fItems = {}
+    keys = {}
+    for key, entries in merged.items():
+      names = entries.keys()
+      names.sort()
+      keys[key] = (names, [(name, entries[name][0], entries[name][3]) for name in names])
+    self.fKeys = keys
+    return keys
+
+  def GetContexts(self, mime_type):
+    """Get the sorted names of the contexts that have snippets for the
+    given mime type"""
+
+    contexts = [ctx for mtype, ctx in self.__GetKeys().keys()
+                if mtype == mime_type and ctx is not None]
+    contexts.sort()
+    return contexts
+
+  def Find(self, mime_type, context=None, prefix=''):
+    """Find the snippets for the given mime type whose name starts with
+    the given prefix.  The snippets for the given context are included
+    along with those that apply in any context, which they override; use
+    None to get only the latter.  Returns a list of (name, filename,
+    description) sorted by name, which must not be modified."""
+
+    keys = self.__GetKeys()
+    results = self.__FindPrefix(keys.get((mime_type, None)), prefix)
+    if context is None:
+      return results
+    specific = self.__FindPrefix(keys.get((mime_type, context)), prefix)
+    if not results:
+      return specific
+    if not specific:
+      return results
+    merged = dict([(r[0], r) for r in results])
+    merged.update(dict([(r[0], r) for r in specific]))
+    names = merged.keys()
+    names.sort()
+    return [merged[name] for name in names]
+
+  def __FindPrefix(self, key_entry, prefix):
+    if key_entry is None:
+      return []
+    names, entries = key_entry
+    if not prefix:
+      return entries
+    start = bisect.bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+      end += 1
+    return entries[start:end]
+
+  def GetCompletionItems(self, mime_type):
+    """Get (name, aliases, description) for each snippet name for the given
+    mime type in any context, for use with CCompleter.  The same list is
+    returned until the index changes."""
+
+    keys = self.__GetKeys()
+    items = self.fItems.get(mime_type)
+    if items is None:
+      descriptions = {}
+      for ctx in [None] + self.GetContexts(mime_type):
+        for name, filename, description in keys.get((mime_type, ctx), ((), ()))[1]:
+          descriptions.setdefault(name, description)
+      names = descriptions.keys()
+      names.sort()
+      items = self.fItems[mime_type] = [(name, (), descriptions[name]) for name in names]
+    return items
+
+  def Lookup(self, mime_type, name, context=None):
+    """Get the filename of the given snippet, or None if there is none.  If
+    no context is given, snippets in any context are considered, with
+    those that apply in any context first."""
+
+    for snippet_name, filename, description in self.Find(mime_type, context, name):
+      if snippet_name == name:
+        return filename
+    if context is None:
+      for ctx in self.GetContexts(mime_type):
+        filename = self.Lookup(mime_type, name, ctx)
+        if filename is not None:
+          return filename
+    return None
+
+######################################################################
+# Completion
+
+# Usage counts lose half their weight over this many seconds
+kUsageHalfLife = 14 * 24 * 60 * 60
+
+class CUsageStats:
+  """Counts how often each template or snippet is used, with older uses
+  counting for less.  Uses mark the counts changed and Save() writes them
+  to disk, so callers can save once after several uses."""
+
+  # Increment when the saved layout changes
+  kVersion = 1
+
+  def __init__(self, filename, half_life=kUsageHalfLife):
+    self.fFileName = filename
+    self.fHalfLife = float(half_life)
+    # key -> (score, time of last use)
+    self.fCounts = None
+    # Incremented on each use, so rankings can be cached
+    self.fGeneration = 0
+    self.fDirty = False
+
+  def __Load(self):
+    self.fCounts = load_data(self.fFileName, self.kVersion) or {}
+
+  def GetScore(self, key, now=None):
+    """Get the usage score of the given key, decayed to the given time"""
+
+    if self.fCounts is None:
+      self.__Load()
+    count = self.fCounts.get(key)
+    if count is None:
+      return 0.0
+    if now is None:
+      now = time.time()
+    score, last_used = count
+    return score * 0.5 ** (max(now - last_used, 0) / self.fHalfLife)
+
+  def Record(self, key, now=None):
+    """Record a use of the given key"""
+
+    if now is None:
+      now = time.time()
+    score = self.GetScore(key, now)
+    self.fCounts[key] = (score + 1.0, now)
+    self.fGeneration += 1
+    self.fDirty = True
+
+  def GetGeneration(self):
+    return self.fGeneration
+
+  def Save(self):
+    """Write the counts to disk if they changed"""
+
+    if not self.fDirty:
+      return
+    self.fDirty = False
+    save_data(self.fFileName, self.kVersion, self.fCounts)
+
+# Splits names into words, such as python-def into python and def
+kWordSplitExpr = re.compile(r'[^A-Za-z0-9]+')
+
+class CCompleter:
+  """Completes template or snippet names, using a trie over the names, their
+  aliases, the words in the names, and the words in their descriptions.
+  Queries match a prefix of any of these, or the names and aliases as a
+  subsequence (so that 'pd' matches 'python-def').  Subsequence matches
+  are found with one regular expression over all the names and aliases,
+  which is much faster than walking the whole trie.  Matches are ranked by
+  how good the match is and then by usage, with recent uses counting more."""
+
+  # Ranking of the kinds of matches, best first
+  kExactMatch = 0
+  kNameMatch = 1
+  kAliasMatch = 2
+  kWordMatch = 3
+  kDescriptionMatch = 4
+  kFuzzyMatch = 5
+
+  def __init__(self, usage, key_prefix=''):
+    self.fUsage = usage
+    self.fKeyPrefix = key_prefix
+    self.fItems = None
+    self.fNames = []
+    # Each node maps a character to a child node and '' to a list of
+    # (item index, match kind) for the keys that end at the node
+    self.fTrie = {}
+    # Lower case names and aliases, one per line, and the item index for
+    # the start of each line
+    self.fFuzzyText = ''
+    self.fFuzzyStarts = []
+    self.fFuzzyIndexes = []
+    # (usage generation, ranked names) for the empty query
+    self.fRanked = None
+
+  def SetItems(self, items):
+    """Set the (name, aliases, description) of the items to complete.  The
+    trie is rebuilt only if items isn't the same list as last time."""
+
+    if items is self.fItems:
+      return
+    self.fItems = items
+    self.fNames = [item[0] for item in items]
+    self.fRanked = None
+    self.fTrie = {}
+    lines = []
+    self.fFuzzyStarts = []
+    self.fFuzzyIndexes = []
+    pos = 0
+    for i in range(len(items)):
+      name, aliases, description = items[i]
+      for key in [name] + list(aliases):
+        key = key.lower().replace('\n', ' ')
+        lines.append(key)
+        self.fFuzzyStarts.append(pos)
+        self.fFuzzyIndexes.append(i)
+        pos += len(key) + 1
+      self.__Add(name.lower(), i, self.kNameMatch)
+      for alias in aliases:
+        self.__Add(alias.lower(), i, self.kAliasMatch)
+      for word in kWordSplitExpr.split(name.lower())[1:]:
+        self.__Add(word, i, self.kWordMatch)
+      for word in kWordSplitExpr.split(description.lower()):
+        self.__Add(word, i, self.kDescriptionMatch)
+    self.fFuzzyText = '\n'.join(lines)
+
+  def __Add(self, key, index, kind):
+    if not key:
+      return
+    node = self.fTrie
+    for c in key:
+      child = node.get(c)
+      if child is None:
+        child = node[c] = {}
+      node = child
+    node.setdefault('', []).append((index, kind))
+
+  def __CollectSubtree(self, node, matches, kind=None):
+    """Add the items for all keys in the given subtree to matches, as
+    index -> best match kind.  If kind is given, only names and aliases are
+    added, with that kind."""
+
+    stack = [node]
+    while stack:
+      node = stack.pop()
+      for c, child in node.items():
+        if c:
+          stack.append(child)
+          continue
+        for index, key_kind in child:
+          if kind is not None:
+            if key_kind > self.kAliasMatch:
+              continue
+            key_kind = kind
+          if key_kind < matches.get(index, self.kFuzzyMatch + 1):
+            matches[index] = key_kind
+
+  def __FuzzyMatch(self, query, matches):
+    """Add the items whose name or an alias contains the query as a
+    subsequence"""
+
+    expr = re.compile('[^\n]*?'.join([re.escape(c) for c in query]))
+    starts = self.fFuzzyStarts
+    indexes = self.fFuzzyIndexes
+    text = self.fFuzzyText
+    pos = 0
+    while True:
+      m = expr.search(text, pos)
+      if m is None:
+        break
+      line = bisect.bisect_right(starts, m.start()) - 1
+      index = indexes[line]
+      if index not in matches:
+        matches[index] = self.kFuzzyMatch
+      # Continue with the next line
+      pos = text.find('\n', m.end())
+      if pos < 0:
+        break
+      pos += 1
+
+  def Complete(self, query='', fuzzy=True, limit=None):
+    """Get the names of the items matching the given query, best first"""
+
+    usage = self.fUsage
+    now = time.time()
+    prefix = self.fKeyPrefix
+    names = self.fNames
+
+    if not query:
+      generation = usage.GetGeneration()
+      if self.fRanked is None or self.fRanked[0] != generation:
+        ranked = [(-usage.GetScore(prefix + name, now), name) for name in names]
+        ranked.sort()
+        self.fRanked = (generation, [name for score, name in ranked])
+      return self.fRanked[1][:limit]
+
+    query = query.lower()
+    matches = {}
+    node = self.fTrie
+    for c in query:
+      node = node.get(c)
+      if node is None:
+        break
+    else:
+      self.__CollectSubtree(node, matches)
+      for index, kind in node.get('', ()):
+        if kind == self.kNameMatch:
+          matches[index] = self.kExactMatch
+    if fuzzy:
+      self.__FuzzyMatch(query, matches)
+
+    ranked = [(kind, -usage.GetScore(prefix + names[index], now), names[index])
+              for index, kind in matches.items()]
+    ranked.sort()
+    return [name for kind, score, name in ranked[:limit]]
+
+  def Resolve(self, query):
+    """Get the name of the item the given query stands for: the item with
+    that name or alias, ignoring case, or else the only item with a name
+    or alias that starts with the query.  Returns None if there is no
+    such item or more than one.  Word and fuzzy matches are only offered
+    by Complete(), so that a mistyped name isn't taken to mean some other
+    item."""
+
+    if not query:
+      return None
+    if query in self.fNames:
+      return query
+    node = self.fTrie
+    for c in query.lower():
+      node = node.get(c)
+      if node is None:
+        return None
+    for kind in (self.kNameMatch, self.kAliasMatch):
+      indexes = set([index for index, key_kind in node.get('', ()) if key_kind == kind])
+      if len(indexes) == 1:
+        return self.fNames[indexes.pop()]
+      if indexes:
+        return None
+    matches = {}
+    self.__CollectSubtree(node, matches, self.kNameMatch)
+    if len(matches) != 1:
+      return None
+    return self.fNames[matches.keys()[0]]
+
+  def Record(self, name):
+    """Record that the given item was used"""
+
+    self.fUsage.Record(self.fKeyPrefix + name)
+
+######################################################################
+# Benchmark
+
+def _make_fixture(size):
+  """Generate a file skeleton template of about the given size, with an
+  argument every few lines and some wrapped arguments"""
+
+  lines = ['# %(@description|string(60))s', '# Author: %(author)s',
+           '# Created: %(created|date)s', '']
+  total = 0
+  i = 0
+  while total < size:
+    if i % 5 == 0:
+      line = '\tdef method%i(self, %%(arg%i)s):' % (i, i % 20)
+    elif i % 5 == 1:
+      line = '\t\t"""%%(@doc%i)s"""' % (i % 7)
+    elif i % 5 == 2:
+      line = '\t\tvalue = "%%%%s" %% self.%%(name)s'
+    else:
+      line = '\t\treturn %%(name)s.compute(value, %i)' % i
+    lines.append(line)
+    total += len(line) + 1
+    i += 1
+  return '\n'.join(lines)
+
+def _wrap(value, width, prefix):
+  import textwrap
+  return ('\n' + prefix).join(textwrap.wrap(value, max(width, 10))) or value
+
+def _benchmark(size):
+  import time
+  txt = _make_fixture(size)
+
+  count = 200
+  start = time.time()
+  for i in range(count):
+    template = compile_template(txt)
+  compile_time = max(time.time() - start, 1e-6) / count
+
+  slots = template.GetSlots()
+  values = ['value %i of the template that is long enough to need wrapping '
+            'when it is placed on a line with a prefix' % i for i in range(len(slots))]
+  print('template %8i bytes %6i args  compile %8.3f ms' % (len(txt), len(slots),
+                                                           compile_time * 1000))
+  for label, wrap_cb in (('expand', None), ('wrapped', _wrap)):
+    count = 1000
+    start = time.time()
+    for i in range(count):
+      expanded, tab_sequence = template.Expand(values, 78, wrap_cb)
+    expand_time = max(time.time() - start, 1e-6) / count
+    print('%-8s %8i bytes %6i/sec  %8.1f MB/sec' % (label, len(expanded), 1 / expand_time,
+                                                    len(expanded) / expand_time / 1e6))
+
+  # Completion over a few thousand shared snippets
+  import random
+  rand = random.Random(0)
+  words = ['python', 'django', 'class', 'def', 'test', 'html', 'table', 'form',
+           'view', 'model', 'loop', 'if', 'try', 'file', 'header', 'license']
+  items = []
+  for i in range(5000):
+    name = '-'.join(rand.sample(words, 3)) + str(i)
+    items.append((name, (), ' '.join(rand.sample(words, 4))))
+  usage = CUsageStats(os.devnull)
+  usage.fCounts = {}
+  completer = CCompleter(usage)
+  start = time.time()
+  completer.SetItems(items)
+  build_time = time.time() - start
+  for query, fuzzy in (('dj', False), ('django-te', False), ('pdt', True), ('', False)):
+    count = 20
+    start = time.time()
+    for i in range(count):
+      matches = completer.Complete(query, fuzzy)
+    query_time = max(time.time() - start, 1e-6) / count
+    print('complete %-10r %6i items %6i matches %8.3f ms' % (query, len(items), len(matches),
+                                                             query_time * 1000))
+  print('trie built in %.1f ms' % (build_time * 1000))
+
+if __name__ == '__main__':
+  import sys
+  if len(sys.argv) > 1:
+    _benchmark(int(sys.argv[1]))
+  else:
+    _benchmark(32768)
@@ -57,10 +57,9 @@ for other improvements.
 _ignore_scripts = True
 
 import os
+import sys
 import stat
 import time
-import re
-import glob
 from sets import Set
 
 import wingapi
@@ -82,6 +81,12 @@ from guiutils import formbuilder
 from wingutils import datatype
 from wingutils import textutils
 
+# Support code lives next to this script but is not a script itself
+_kScriptDir = os.path.dirname(os.path.abspath(__file__))
+if _kScriptDir not in sys.path:
+  sys.path.append(_kScriptDir)
+import templatesupport
+
 # Set this to True to collect arguments before pasting the snippet 
 # rather than pasting snippet and collecting args inline
 _kOldStyleArgCollection = False
@@ -94,6 +99,11 @@ gTemplateDirs = [
   (_("User-specific"), os.path.join(wingapi.gApplication.GetUserSettingsDir(), 'templates'))
 ]
 
+gSnippetDirs = [
+  (_("System-wide"), os.path.join(wingapi.gApplication.GetWingHome(), 'snippets')),
+  (_("User-specific"), os.path.join(wingapi.gApplication.GetUserSettingsDir(), 'snippets'))
+]
+
 def _get_environment(env, default=None):
   """Get value for given environment variable, either as defined in 
   Project Properties or in the inherited environment if present.
@@ -134,90 +144,59 @@ def _get_datetime_string():
 
 gTemplates = {}
 
-_parse_regex = re.compile(r"(?<!%)%\((.*?)\)s")
-
-def _parse_argspec(spec):
-  """Parse argument spec to determine argname, arginfo to use for
-  collecting the value from user if necessary, and specification
-  for default value."""
+def _make_arginfo(argname, argtype, size):
+  """Create the _AI() spec used to collect the value of an argument of
+  the given type from the user"""
   
-  spec = spec[2:-2]
-  
-  parts = spec.split('|')
-  if len(parts) > 3:
-    parts = (parts[0], parts[1], '|'.join(parts[2:]))
-  name = parts[0].strip().lower()
-  type = 'string'
-  default = None
-  if len(parts) > 1:
-    type = parts[1].strip().lower()
-    if type == '':
-      type = 'string'
-  if len(parts) > 2:
-    default = parts[2]
-
-  if type.startswith('string'):
-    if type.find('(') > 0:
-      slen = int(type[type.find('(')+1:-1])
-    else:
-      slen = 80
-    arginfo = _AI(name.replace('_', ' ').title(), 
-                  datatype.CType(''), formbuilder.CSmallTextGui(slen))
-  elif type == 'filename':
-    arginfo = _AI(name.replace('_', ' ').title(), 
-                  datatype.CType(''), formbuilder.CFileSelectorGui())
-  elif type.startswith('date'):
-    arginfo = _AI(name.replace('_', ' ').title(), 
-                  datatype.CType(''), formbuilder.CSmallTextGui())
-    if type == 'date':
-      default = '$(__DATE_NOW__)'
-    else:
-      default = '$(__DATE_TIME_NOW__)'
+  label = argname.replace('_', ' ').title()
+  if argtype == 'string':
+    return _AI(label, datatype.CType(''), formbuilder.CSmallTextGui(size))
+  elif argtype == 'filename':
+    return _AI(label, datatype.CType(''), formbuilder.CFileSelectorGui())
   else:
-    raise NotImplementedError, "Invalid argument type '%s'" % type
-
-  return name, arginfo, default
-
-def _parse_template(txt):
-  """Parse template text to extract information about the arguments to 
-  collect from user and where to insert them in the template.  Returns
-  (ptxt, info) where ptxt is the text with argument specs removed and
-  info is a list of (argname, arginfo, default, pos, flags) that defines the
-  argument name, _AI() spec for data collection, default spec (which
-  isn't interpreted until the template is actually used), and the
-  position in ptxt where that argument should be placed."""
+    return _AI(label, datatype.CType(''), formbuilder.CSmallTextGui())
+
+def _get_arginfos(template):
+  """Determine the arguments to collect from the user for the given
+  compiled template.  Returns a list of (argname, arginfo, default, pos,
+  flags) that defines the argument name, _AI() spec for data collection,
+  default spec (which isn't interpreted until the template is actually
+  used), and the position of the argument in the template text."""
   
-  ret_txt = '' 
-  c_ret_txt = ''
-  ret_info = []
-  txtpos = 0 
-  matches = _parse_regex.finditer(txt)
-  for match in matches:
-
-    segment = txt[txtpos:match.start()]   
-    ret_txt += segment
-    c_ret_txt += segment.replace("%%","%")
-    txtpos = match.end()
-
-    argspec = txt[match.start():match.end()]
-    argname, arginfo, default = _parse_argspec(argspec)
-    flags = {}
-    while len(argname) > 0 and argname[0] in '!@':
-      if argname.startswith('!'):
-        argname = argname[1:]
-        flags['always-show'] = 1
-      if argname.startswith('@'):
-        argname = argname[1:]
-        flags['wrap-lines'] = 1
-    
-    # Position of the arg in new text is just at the end of the shortened text 
-    ret_info.append((argname, arginfo, default, len(c_ret_txt), flags))
+  info = []
+  positions = template.GetPositions()
+  for i, (argname, argtype, size, default, flags) in enumerate(template.GetSlots()):
+    info.append((argname, _make_arginfo(argname, argtype, size), default,
+                 positions[i], flags))
+  return info
+
+# Compiled templates are cached across sessions
+gTemplateCache = templatesupport.CTemplateCache(
+  os.path.join(wingapi.gApplication.GetUserSettingsDir(), 'template-cache'))
+
+# Seconds to wait after the template cache or the usage counts change
+# before saving them, so that changes made close together are written at once
+kSaveDelay = 2.0
+gSaveId = None
+
+def _save_data_later():
+  """Save the template cache and usage counts shortly, so that changes
+  made close together are written at once"""
+  
+  global gSaveId
+  if gSaveId is None:
+    gSaveId = wingapi.gApplication.InstallTimeout(int(kSaveDelay * 1000), _save_data)
 
-  c_ret_txt += txt[txtpos:].replace("%%","%") #segment after last variable   
-  return c_ret_txt, ret_info
+def _save_data():
+  global gSaveId
+  gSaveId = None
+  gTemplateCache.Save()
+  gUsage.Save()
+  return False
 
 def _process_template(tdir, fname):
-  """Read in a single template and add it to the registry"""
+  """Load a single template, from the cache if it hasn't changed since it
+  was last parsed, and add it to the loaded templates"""
 
   templates = gTemplates.setdefault(tdir, {})
   
@@ -225,50 +204,312 @@ def _process_template(tdir, fname):
   filename = os.path.join(tdir, fname)
   if not os.path.exists(filename) or os.path.isdir(filename):
     if templates.has_key(name):
-      filename, ptxt, arginfos, modinfo = templates[name]
+      filename, template, arginfos, modinfo = templates[name]
       if os.path.samefile(os.path.abspath(os.path.expanduser(os.path.dirname(filename))), 
                           os.path.abspath(os.path.expanduser(tdir))):
         del templates[name]
+    gTemplateCache.Remove(filename)
+    _save_data_later()
     return
   
-  f = open(filename)
-  txt = f.read()
-  f.close()
-
-  ptxt, arginfos = _parse_template(txt)
+  st = os.stat(filename)
+  template = gTemplateCache.Get(filename, st)
+  if template is None:
+    f = open(filename)
+    txt = f.read()
+    f.close()
+    template = templatesupport.compile_template(txt)
+    gTemplateCache.Set(filename, st, template)
+    _save_data_later()
+
+  templates[name] = (filename, template, _get_arginfos(template),
+                     (st.st_mtime, tdir, fname))
+  
+######################################################################
+# Template registry
+
+# Seconds between checks of the template directories and files for changes,
+# when they aren't being watched
+kTemplateCheckInterval = 1.0
+
+# Set this to False to check template directories periodically even if
+# they can be watched for changes with pyinotify
+kWatchTemplateDirs = True
+
+class _CTemplateRegistry:
+  """Index of the template files in the template directories.  A directory
+  is listed again only when its modification time has changed, and a
+  merged view in which later directories override earlier ones is kept
+  so that lookups and name completion don't need to touch the disk.  Files
+  and directories are checked for changes at most once per check interval,
+  or not at all when pyinotify is available to watch them."""
+  
+  def __init__(self, template_dirs):
+    self.fTemplateDirs = [tdir for label, tdir in template_dirs]
+    # tdir -> (mtime, {name: filename}) as of the last listing
+    self.fListings = {}
+    # tdir -> {name: filename} for new templates not yet saved
+    self.fPending = {}
+    # name -> (tdir, filename) across all directories, and sorted names
+    self.fMerged = None
+    self.fNames = []
+    # filename -> mtime, valid until the next check
+    self.fModTimes = {}
+    self.fLastCheck = 0
+    self.fWatcher = None
+    self.fWatchStarted = False
+    
+  def Check(self, force=False):
+    """Bring the index up to date with any changes on disk"""
+    
+    if not self.fWatchStarted:
+      self.fWatchStarted = True
+      if kWatchTemplateDirs:
+        self.fWatcher = _create_template_watcher(self, self.fTemplateDirs)
+    
+    now = time.time()
+    if not force and now < self.fLastCheck + kTemplateCheckInterval:
+      return
+    self.fLastCheck = now
+    
+    changed = False
+    for tdir in self.fTemplateDirs:
+      if not force and self.fWatcher is not None and self.fWatcher.IsWatched(tdir):
+        continue
+      if self.__UpdateListing(tdir):
+        changed = True
+    if self.fWatcher is None or force:
+      self.fModTimes = {}
+    else:
+      for filename in self.fModTimes.keys():
+        if not self.fWatcher.IsWatched(os.path.dirname(filename)):
+          del self.fModTimes[filename]
+    if changed:
+      self.fMerged = None
+    
+  def __UpdateListing(self, tdir):
+    """List the given directory again if it changed.  Returns whether its
+    listing changed."""
+    
+    try:
+      mtime = os.stat(tdir).st_mtime
+    except OSError:
+      mtime = None
+    old_mtime, entries = self.fListings.get(tdir, (-1, None))
+    if mtime == old_mtime:
+      return False
+    
+    entries = {}
+    if mtime is not None:
+      try:
+        fnames = os.listdir(tdir)
+      except OSError:
+        fnames = []
+      fnames.sort()
+      for fname in fnames:
+        name, ext = os.path.splitext(fname)
+        if name in entries:
+          continue
+        filename = os.path.join(tdir, fname)
+        if not os.path.isdir(filename):
+          entries[name] = filename
+    self.fListings[tdir] = (mtime, entries)
+    return True
+    
+  def Invalidate(self, tdir, filename=None):
+    """Note that the given directory, or the given file in it, changed"""
+    
+    self.fListings.pop(tdir, None)
+    self.fMerged = None
+    if filename is not None:
+      self.fModTimes.pop(filename, None)
+    self.fLastCheck = 0
+    
+  def __GetEntries(self, tdir):
+    entries = self.fListings.get(tdir, (None, {}))[1]
+    pending = self.fPending.get(tdir)
+    if pending:
+      entries = dict(entries)
+      entries.update(pending)
+    return entries
+    
+  def __GetMerged(self):
+    if self.fMerged is None:
+      for tdir in self.fTemplateDirs:
+        if tdir not in self.fListings:
+          self.__UpdateListing(tdir)
+      merged = {}
+      for tdir in self.fTemplateDirs:
+        for name, filename in self.__GetEntries(tdir).items():
+          merged[name] = (tdir, filename)
+      self.fMerged = merged
+      self.fNames = merged.keys()
+      self.fNames.sort()
+    return self.fMerged
+    
+  def Lookup(self, template_name, tdir=None):
+    """Get (tdir, filename) for the given template, optionally only looking
+    in the given directory.  Returns (None, None) if it isn't found."""
+    
+    if tdir is None:
+      return self.__GetMerged().get(template_name, (None, None))
+    if tdir not in self.fListings:
+      self.__UpdateListing(tdir)
+    filename = self.__GetEntries(tdir).get(template_name)
+    if filename is None:
+      return None, None
+    return tdir, filename
+    
+  def GetNames(self):
+    """Get the sorted names of all templates.  The list must not be
+    modified."""
+    
+    self.__GetMerged()
+    return self.fNames
+    
+  def GetDirNames(self, tdir):
+    """Get the sorted names of the templates in the given directory"""
+    
+    if tdir not in self.fListings:
+      self.__UpdateListing(tdir)
+    names = self.__GetEntries(tdir).keys()
+    names.sort()
+    return names
+    
+  def GetModTime(self, filename):
+    """Get the modification time of the given template file as of the
+    last check, or None if it doesn't exist"""
+    
+    try:
+      return self.fModTimes[filename]
+    except KeyError:
+      pass
+    try:
+      mtime = os.stat(filename).st_mtime
+    except OSError:
+      mtime = None
+    self.fModTimes[filename] = mtime
+    return mtime
+    
+  def AddPending(self, tdir, template_name, filename):
+    """Add a new template whose file hasn't been saved yet"""
+    
+    self.fPending.setdefault(tdir, {})[template_name] = filename
+    self.fMerged = None
+    
+  def RemovePending(self, tdir, template_name):
+    self.fPending.get(tdir, {}).pop(template_name, None)
+    self.fMerged = None
 
-  modtime = os.stat(filename).st_mtime
-  templates[name] = (filename, ptxt, arginfos, (modtime, tdir, fname))
+class _CTemplateWatcher:
+  """Watches template directories with pyinotify and invalidates the
+  registry when files in them change"""
   
+  def __init__(self, registry, tdirs):
+    import pyinotify
+    self.fRegistry = registry
+    self.fManager = pyinotify.WatchManager()
+    self.fNotifier = pyinotify.Notifier(self.fManager, self.__CB_Event, timeout=0)
+    self.fWatched = Set()
+    mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM |
+            pyinotify.IN_MOVED_TO | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_ATTRIB)
+    for tdir in tdirs:
+      if os.path.isdir(tdir):
+        result = self.fManager.add_watch(tdir, mask)
+        if result.get(tdir, -1) >= 0:
+          self.fWatched.add(tdir)
+    wingapi.gApplication.InstallTimeout(250, self.__CB_Poll)
+    
+  def IsWatched(self, tdir):
+    return tdir in self.fWatched
+  
+  def __CB_Event(self, event):
+    self.fRegistry.Invalidate(event.path, event.pathname)
+    
+  def __CB_Poll(self):
+    if self.fNotifier.check_events(0):
+      self.fNotifier.read_events()
+      self.fNotifier.process_events()
+    return True
+  
+def _create_template_watcher(registry, tdirs):
+  """Create a watcher for the given template directories, or return None
+  if they can't be watched"""
+  
+  try:
+    return _CTemplateWatcher(registry, tdirs)
+  except (ImportError, OSError, EnvironmentError):
+    return None
+  
+gRegistry = _CTemplateRegistry(gTemplateDirs)
+
 def _scan_for_templates():
-  """Scan templates directories and load templates found in them"""
+  """Index the template directories by name.  Only the directories are
+  listed; each template is loaded when it is first used."""
   
   if _ignore_scripts:
     return
   
-  app = wingapi.gApplication
-
-  for label, tdir in gTemplateDirs:
-    if not os.path.exists(tdir):
-      try:
-        os.mkdir(tdir)
-      except:
-        pass
-    try:
-      files = os.listdir(tdir)
-    except:
-      files = []
-    for fname in files:
-      try:
-        _process_template(tdir, fname)
-      except:
-        print "Warning: Failed to process template %s:" % fname
-        from wingutils import reflect
-        exc = reflect.GetCurrentException()
-        print "  " + "\n  ".join(exc)
+  gRegistry.Check(force=True)
 
 _scan_for_templates()
 
+######################################################################
+# Snippets
+
+# Index of the snippets trees, by mime type and context.  The snippets
+# use the same format as templates.
+gSnippetIndex = templatesupport.CSnippetIndex(
+  [tdir for label, tdir in gSnippetDirs],
+  os.path.join(wingapi.gApplication.GetUserSettingsDir(), 'snippet-index'))
+gSnippetIndexChecked = 0
+
+# Loaded snippets: filename -> (modtime, template, arginfos)
+gSnippets = {}
+
+def _get_snippet_index():
+  """Get the snippet index, brought up to date at most once per template
+  check interval"""
+  
+  global gSnippetIndexChecked
+  now = time.time()
+  if now >= gSnippetIndexChecked + kTemplateCheckInterval:
+    gSnippetIndexChecked = now
+    gSnippetIndex.Update()
+  return gSnippetIndex
+
+def _get_snippet(snippet_name, mime_type, context=None):
+  """Get the given snippet for the given mime type, optionally constrained
+  to the given context.  Returns (filename, template, arginfos)."""
+  
+  filename = _get_snippet_index().Lookup(mime_type, snippet_name, context)
+  if filename is None:
+    print "Unknown snippet name %s" % snippet_name
+    return None, None, None
+  
+  try:
+    st = os.stat(filename)
+  except OSError:
+    gSnippetIndex.Invalidate(filename)
+    print "Unknown snippet name %s" % snippet_name
+    return None, None, None
+  
+  entry = gSnippets.get(filename)
+  if entry is None or entry[0] != st.st_mtime:
+    template = gTemplateCache.Get(filename, st)
+    if template is None:
+      f = open(filename)
+      txt = f.read()
+      f.close()
+      template = templatesupport.compile_template(txt)
+      gTemplateCache.Set(filename, st, template)
+      _save_data_later()
+      gSnippetIndex.Invalidate(filename)
+    entry = gSnippets[filename] = (st.st_mtime, template, _get_arginfos(template))
+  
+  modtime, template, arginfos = entry
+  return filename, template, arginfos
+
 def _fill_in_defaults(arginfos, value_dict):
   """Fill in any missing default values from the given value dict."""
 
@@ -281,26 +522,13 @@ def _fill_in_defaults(arginfos, value_dict):
 
   return new_arginfos
 
-def _find_wrap_prefix(txt):
-  """Find prefix to use in wrapping long lines for a value placed on
-  the last line of the given text"""
-  
-  lines = txt.splitlines()
-  if len(lines) == 0:
-    return '', ''
-  
-  line = lines[-1]
-  prefix = ''
-  while len(line) > 0 and line[0] in ' \t#':
-    prefix += line[0]
-    line = line[1:]
-
-  return prefix, prefix + line
-
-def _template_to_text(ttxt, arginfos, completion, use_window=False):
-  """Turn given template into text by resolving defaults, prompting user for
-  values, and inserting them into the template.  The completion routine
-  is called with the final text when ready."""
+def _wrap_value(value, width, prefix):
+  return textutils.WrapParagraph(value, width, '', prefix)
+
+def _template_to_text(template, arginfos, completion, use_window=False):
+  """Turn given compiled template into text by resolving defaults, prompting
+  user for values, and inserting them into the template.  The completion
+  routine is called with the final text when ready."""
   
   app = wingapi.gApplication
 
@@ -308,8 +536,6 @@ def _template_to_text(ttxt, arginfos, completion, use_window=False):
   # any from the user
   missing = []
   value_list = []
-  value_positions = []
-  value_flags = []
   known_values = {}
   for argname, arginfo, default, insert_pos, flags in arginfos:
     if default is not None:
@@ -318,33 +544,15 @@ def _template_to_text(ttxt, arginfos, completion, use_window=False):
     if default is None:
       missing.append((argname, arginfo, insert_pos))
     value_list.append(default)
-    value_positions.append(insert_pos)
-    value_flags.append(flags)
+
+  wrap_column = None
+  if template.HasWrappedArgs():
+    from edit import prefs
+    wrap_column = app.GetPreference(prefs.kTextWrapColumn)
 
   # Insert default values into text and prepare for inline argument entry
   if not _kOldStyleArgCollection:
-    txt = []
-    ttxtpos = 0
-    txtpos = 0
-    tab_sequence = []
-    for i, value in enumerate(value_list):
-      pos = value_positions[i]
-      if value is None:
-        value = ''
-      if value_flags[i].get('wrap-lines', 0):
-        prefix_line = ttxt[ttxtpos:pos]
-        if len(txt) > 0:
-          prefix_line = txt[-1] + prefix_line
-        prefix, prefix_line = _find_wrap_prefix(prefix_line)
-        from edit import prefs
-        wrap_col = app.GetPreference(prefs.kTextWrapColumn) - len(prefix_line)
-        value = textutils.WrapParagraph(value, wrap_col, '', prefix)
-      txt.append(ttxt[ttxtpos:pos] + value)
-      txtpos += pos - ttxtpos + len(value)
-      ttxtpos = pos
-      tab_sequence.append((txtpos, txtpos - len(value)))
-    txt.append(ttxt[ttxtpos:])
-    txt = ''.join(txt)
+    txt, tab_sequence = template.Expand(value_list, wrap_column, _wrap_value)
     completion(txt, tab_sequence)
 
   # Old style arg collection through command manager
@@ -352,22 +560,7 @@ def _template_to_text(ttxt, arginfos, completion, use_window=False):
 
     # No missing args -- build text and pass to completion routine
     if len(missing) == 0:
-      txt = []
-      ttxtpos = 0
-      for i, value in enumerate(value_list):
-        pos = value_positions[i]
-        if value_flags[i].get('wrap-lines', 0):
-          prefix_line = ttxt[ttxtpos:pos]
-          if len(txt) > 0:
-            prefix_line = txt[-1] + prefix_line
-          prefix, prefix_line = _find_wrap_prefix(prefix_line)
-          from edit import prefs
-          wrap_col = app.GetPreference(prefs.kTextWrapColumn) - len(prefix_line)
-          value = textutils.WrapParagraph(value, wrap_col, '', prefix)
-        txt.append(ttxt[ttxtpos:pos] + value)
-        ttxtpos = pos
-      txt.append(ttxt[ttxtpos:])
-      txt = ''.join(txt)
+      txt, tab_sequence = template.Expand(value_list, wrap_column, _wrap_value)
       completion(txt)
       
     # Collect any missing args by building a command on the fly with 
@@ -385,7 +578,7 @@ def _template_to_text(ttxt, arginfos, completion, use_window=False):
           arginfos[i] = argname, arginfo, known_values[argname], insert_pos, flags
   
       def do_cmd(**args):
-        _template_to_text(ttxt, _fill_in_defaults(arginfos, args), completion,
+        _template_to_text(template, _fill_in_defaults(arginfos, args), completion,
                           use_window)      
       def no_dup(L):
         return list(Set(L))
@@ -514,64 +707,88 @@ def _insert_template(txt, tab_sequence):
 def _get_template(template_name, tdir=None):
   """Get given template by name, optionally constraining search to given
   directory. This also loads new templates on demands and reloads the template
-  if it has changed on disk. Returns (filename, template_text, arginfos)."""
-
-  # Compute which template dirs are acceptible
-  if tdir is not None:
-    allowed_tdirs = [tdir]
-  else:
-    allowed_tdirs = [t for l, t in gTemplateDirs]
-    
-  # Run through template directories backwards (so that user-defined templates
-  # can override system-defined ones)
-  for i in range(len(gTemplateDirs)-1, -1, -1):
-    
-    # Look for existing template entry
-    label, tdir = gTemplateDirs[i]
-    if tdir not in allowed_tdirs:
-      continue
-    templates = gTemplates.setdefault(tdir, {})    
-    filename, ttxt, arginfos, modinfo = templates.get(template_name, (None, None, None, None))
-    
-    # If not found, try to load it:  There may be a newly added template file
-    if ttxt is None:
-      candidates = glob.glob(os.path.join(tdir, template_name + '.*'))
-      for candidate in candidates:
-        _process_template(tdir, os.path.basename(candidate))
-        if templates.has_key(template_name):
-          filename, ttxt, arginfos, modinfo = templates.get(template_name, (None, None, None, None))
-          break
-      if templates.has_key(template_name):
-        break
+  if it has changed on disk. Returns (filename, template, arginfos) where
+  template is the compiled template."""
+
+  gRegistry.Check()
+  tdir, filename = gRegistry.Lookup(template_name, tdir)
+  if filename is None:
+    print "Unknown template name %s" % template_name
+    return None, None, None
   
-    # If found and changed on disk, then reload it if needed
-    else:
-      old_modtime, tdir, fname = modinfo
-      try:
-        modtime = os.stat(filename).st_mtime
-      except:
-        modtime = old_modtime + 1
-      if old_modtime < modtime:
-        _process_template(tdir, fname)
-        filename, ttxt, arginfos, modinfo = templates.get(template_name, (None, None, None, None))
-
-    # Return if anything found
-    if ttxt is not None:
-      return filename, ttxt, arginfos
-
-  # Nothing found
-  print "Unknown template name %s" % template_name
-  return None, None, None
+  # Load the template if it's new or has changed on disk
+  templates = gTemplates.setdefault(tdir, {})
+  entry = templates.get(template_name)
+  modtime = gRegistry.GetModTime(filename)
+  if entry is None or entry[0] != filename or modtime is None or entry[3][0] < modtime:
+    fname = os.path.basename(filename)
+    try:
+      _process_template(tdir, fname)
+    except:
+      print "Warning: Failed to process template %s:" % fname
+      from wingutils import reflect
+      exc = reflect.GetCurrentException()
+      print "  " + "\n  ".join(exc)
+    entry = templates.get(template_name)
+  
+  if entry is None or entry[1] is None:
+    print "Unknown template name %s" % template_name
+    return None, None, None
+  filename, template, arginfos, modinfo = entry
+  return filename, template, arginfos
   
 def _all_template_names():
-  names = {}
-  for label, tdir in gTemplateDirs:
-    names.update(gTemplates.setdefault(tdir, {}))
-  return names.keys()
+  gRegistry.Check()
+  return gRegistry.GetNames()
+
+######################################################################
+# Completion
+
+# How often each template and snippet is used, for ranking completions
+gUsage = templatesupport.CUsageStats(
+  os.path.join(wingapi.gApplication.GetUserSettingsDir(), 'template-usage'))
+
+gTemplateCompleter = templatesupport.CCompleter(gUsage, 'template:')
+gTemplateItems = (None, [])
+
+# mime type -> completer for its snippets
+gSnippetCompleters = {}
+
+def _get_template_completer():
+  """Get the completer for template names, updated for any changes in the
+  template directories"""
+  
+  global gTemplateItems
+  names = _all_template_names()
+  if names is not gTemplateItems[0]:
+    gTemplateItems = (names, [(name, (), '') for name in names])
+  gTemplateCompleter.SetItems(gTemplateItems[1])
+  return gTemplateCompleter
+  
+def _get_snippet_completer(mime_type):
+  """Get the completer for the names of the snippets for the given mime
+  type, updated for any changes in the snippets trees"""
+  
+  completer = gSnippetCompleters.get(mime_type)
+  if completer is None:
+    completer = templatesupport.CCompleter(gUsage, 'snippet:%s:' % mime_type)
+    gSnippetCompleters[mime_type] = completer
+  completer.SetItems(_get_snippet_index().GetCompletionItems(mime_type))
+  return completer
 
 def _template_name_arginfo():
+  choices = _get_template_completer().Complete()
   return _AI(_("Template Name"), datatype.CType(''), 
-             formbuilder.CSmallTextGui(choices=_all_template_names()))
+             formbuilder.CSmallTextGui(choices=choices))
+
+def _snippet_name_arginfo():
+  choices = []
+  editor = wingapi.gApplication.GetActiveEditor()
+  if editor is not None:
+    mime_type = editor.GetDocument().GetMimeType()
+    choices = _get_snippet_completer(mime_type).Complete()
+  return _AI(_("Snippet Name"), datatype.CType(''), 
+             formbuilder.CSmallTextGui(choices=choices))
 
 ######################################################################
 # Commands
@@ -579,17 +796,24 @@ def _template_name_arginfo():
 def template(template_name, tdir=None, use_window=0):
   """Insert given template into current editor. When a template directory is
   used, the template is drawn from there. Otherwise, the template path is
-  traversed to find the template. When use_window is True, argument collection
-  occurs in a dialog box instead of at the bottom of the current document
-  window."""
+  traversed to find the template. The name can be abbreviated to a prefix
+  that matches only one template. When use_window is True, argument
+  collection occurs in a dialog box instead of at the bottom of the
+  current document window."""
 
   # Find template
-  filename, ttxt, arginfos = _get_template(template_name, tdir)
-  if ttxt is None:
+  name = _get_template_completer().Resolve(template_name)
+  if name is None:
+    print "Unknown template name %s" % template_name
+    return
+  filename, template, arginfos = _get_template(name, tdir)
+  if template is None:
     return
+  gTemplateCompleter.Record(name)
+  _save_data_later()
 
   # Convert template into text and insert into current editor
-  _template_to_text(ttxt, arginfos, _insert_template, use_window)
+  _template_to_text(template, arginfos, _insert_template, use_window)
 
 # This defines how arguments are collected from the user if the command
 # is executed with missing arguments
@@ -602,23 +826,63 @@ template.arginfo = {
 def template_file(template_name, tdir=None, use_window=0):
   """Create a new file containing the given template. When a template directory is
   used, the template is drawn from there. Otherwise, the template path is
-  traversed to find the template. When use_window is True, argument collection
-  occurs in a dialog box instead of at the bottom of the current document
-  window."""
+  traversed to find the template. The name can be abbreviated as for the
+  template command. When use_window is True, argument collection occurs in
+  a dialog box instead of at the bottom of the current document window."""
 
   # Find template
-  filename, ttxt, arginfos = _get_template(template_name, tdir)
-  if ttxt is None:
+  name = _get_template_completer().Resolve(template_name)
+  if name is None:
+    print "Unknown template name %s" % template_name
     return
+  filename, template, arginfos = _get_template(name, tdir)
+  if template is None:
+    return
+  gTemplateCompleter.Record(name)
+  _save_data_later()
   name, ext = os.path.splitext(filename)
   
   # Convert template into text and build new file with it
   def doit(rtxt, tab_sequence):
     _new_file_template(ext, rtxt, tab_sequence)
-  _template_to_text(ttxt, arginfos, doit, use_window)
+  _template_to_text(template, arginfos, doit, use_window)
 
 template_file.arginfo = template.arginfo
 
+def snippet(snippet_name, context=None, use_window=0):
+  """Insert given snippet for the current editor's file type into the
+  editor.  When a context is given, such as 'class' for Python files, the
+  snippets for that context are used along with those that apply in any
+  context.  The name can be abbreviated as for the template command.  When
+  use_window is True, argument collection occurs in a dialog box instead of
+  at the bottom of the current document window."""
+
+  editor = wingapi.gApplication.GetActiveEditor()
+  if editor is None:
+    return
+  mime_type = editor.GetDocument().GetMimeType()
+  
+  # Find snippet
+  completer = _get_snippet_completer(mime_type)
+  name = completer.Resolve(snippet_name)
+  if name is None:
+    print "Unknown snippet name %s" % snippet_name
+    return
+  filename, template, arginfos = _get_snippet(name, mime_type, context)
+  if template is None:
+    return
+  completer.Record(name)
+  _save_data_later()
+
+  # Convert snippet into text and insert into current editor
+  _template_to_text(template, arginfos, _insert_template, use_window)
+
+snippet.arginfo = {
+  'snippet_name': _snippet_name_arginfo,
+  'context': _AI('', datatype.CNoneOr(datatype.CType('')), formbuilder.CHiddenGui()),
+  'use_window': _AI('', datatype.CBoolean(), formbuilder.CHiddenGui()),
+}
+
 ######################################################################
 # Simple template management tool
 
@@ -698,8 +962,7 @@ class _CTemplateViewCommands(commandmgr.CClassCommandMap):
     """Edit the selected template"""
 
     tdir, template_name = self.__fView._GetSelectedTemplate()
-    templates = gTemplates[tdir]
-    filename, ptxt, arginfos, modinfo = templates[template_name]
+    tdir, filename = gRegistry.Lookup(template_name, tdir)
     wingapi.gApplication.OpenEditor(filename)
     
   def _IsAvailable_template_selected_edit(self):
@@ -774,6 +1037,7 @@ class _CTemplateViewCommands(commandmgr.CClassCommandMap):
     the template panel display to update when templates are added or
     removed from outside of Wing."""
     
+    gRegistry.Check(force=True)
     self.__fView._UpdateGui()
     
 class _CTemplateView(wingview.CViewController):
@@ -887,10 +1151,10 @@ class _CTemplateView(wingview.CViewController):
     self._SetGtkWidget(notebook)
     
   def _UpdateGui(self):
+    gRegistry.Check()
     for label, tdir in gTemplateDirs:
       tree, sview = self.fTrees[tdir]
-      template_names = gTemplates.setdefault(tdir, {}).keys()
-      template_names.sort()
+      template_names = gRegistry.GetDirNames(tdir)
       tree.set_contents([((name, self._LookupKeyBinding(name)),) for name in template_names])
 
   def _LookupKeyBinding(self, template_name):
@@ -945,11 +1209,11 @@ class _CTemplateView(wingview.CViewController):
       
     pos = self.__fNotebook.get_current_page()
     label, tdir = gTemplateDirs[pos]
-    templates = gTemplates.setdefault(tdir, {})
     
     # Check if template already exists and offer to open it
-    if templates.has_key(new_template_name):      
-      filename, ptxt, arginfos, modinfo = templates[new_template_name]
+    gRegistry.Check(force=True)
+    tdir, filename = gRegistry.Lookup(new_template_name, tdir)
+    if filename is not None:
       title = _("Template already exists")
       text = _("The template '%s' already exists in %s.  Do you want to open "
                "the existing file?") % (new_template_name, filename)
@@ -963,12 +1227,17 @@ class _CTemplateView(wingview.CViewController):
       dlg.RunAsModal()
       return
 
-    # Add dummy entry so it gets loaded when saved and inserted into panel
+    # Add pending entry so it is shown in the panel until saved
+    label, tdir = gTemplateDirs[pos]
     filename = os.path.join(tdir, new_template_name + '.' + file_extension)
-    ptxt = None
-    arginfos = []
-    modinfo = (0, tdir, filename)
-    templates[new_template_name] = (filename, ptxt, arginfos, modinfo)
+    gRegistry.AddPending(tdir, new_template_name, filename)
+    
+    # Template directories are only created when they are first used
+    if not os.path.isdir(tdir):
+      try:
+        os.makedirs(tdir)
+      except OSError:
+        pass
 
     # Update panel
     self._UpdateGui()
@@ -983,24 +1252,24 @@ class _CTemplateView(wingview.CViewController):
     # if the file doesn't exist on disk because it was never saved
     doc = editor.GetDocument()
     def destroy_cb(obj):
-      if not os.path.exists(filename):
-        del templates[new_template_name]
-        self._UpdateGui()
+      gRegistry.RemovePending(tdir, new_template_name)
+      gRegistry.Invalidate(tdir, filename)
+      self._UpdateGui()
     doc.connect_while_alive('destroy', destroy_cb, self)
 
   def _RemoveTemplate(self):
     """Add currently selected template from template directory"""
 
     tdir, template_name = self._GetSelectedTemplate()
-    templates = gTemplates[tdir]
-    filename, ptxt, arginfos, modinfo = templates[template_name]
+    tdir, filename = gRegistry.Lookup(template_name, tdir)
     
     title = _("Remove Disk File?")
     text = _("Really remove the template '%s' in %s?  This will permanently "
              "erase the file from disk.") % (template_name, filename)
     def remove_cb(*args):
       os.unlink(filename)
-      del templates[template_name]
+      gTemplates.get(tdir, {}).pop(template_name, None)
+      gRegistry.Invalidate(tdir, filename)
       self._UpdateGui()
     buttons = [
       dialogs.CButtonSpec(_("Remove File"), remove_cb, wgtk.STOCK_YES),
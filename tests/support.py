@@ -0,0 +1,79 @@
+"""Support for the tests of the scripts' support code.
+
+The tests run outside of Wing IDE with Python 2:
+
+  python -m unittest discover tests
+
+Support modules such as lintsupport.py are imported directly.  Scripts,
+which import Wing's modules, are loaded with load_script(), which puts
+placeholders for those modules in sys.modules first.  Only code that
+doesn't call into Wing can be tested this way.
+"""
+
+import os
+import sys
+import imp
+import types
+
+kScriptDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'scripts')
+if kScriptDir not in sys.path:
+  sys.path.insert(0, kScriptDir)
+
+# Wing modules imported by the scripts when they are loaded
+kWingModules = ['wingapi', 'wingutils', 'wingutils.datatype', 'wingutils.location',
+                'guiutils', 'guiutils.wgtk', 'guiutils.dockview', 'guiutils.wingview',
+                'guiutils.winmgr', 'guimgr', 'guimgr.keyboard', 'guimgr.menus',
+                'command', 'command.commandmgr', 'config']
+
+class _CPlaceholder(object):
+  """Stands for any object from a Wing module.  Attributes and calls
+  give more placeholders, and iterating gives nothing."""
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return _CPlaceholder()
+
+  def __call__(self, *args, **kwargs):
+    return _CPlaceholder()
+
+  def __iter__(self):
+    return iter(())
+
+class _CPlaceholderModule(types.ModuleType):
+  """Stands for a Wing module.  Capitalized names such as CPanelDefn
+  give classes, so that scripts can subclass them, and other names
+  give objects."""
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    if name[:1].isupper() and not name.isupper():
+      value = type(name, (_CPlaceholder,), {})
+    else:
+      value = _CPlaceholder()
+    setattr(self, name, value)
+    return value
+
+def _install_wing_modules():
+  for name in kWingModules:
+    if name in sys.modules:
+      continue
+    module = sys.modules[name] = _CPlaceholderModule(name)
+    if '.' in name:
+      parent, child = name.rsplit('.', 1)
+      setattr(sys.modules[parent], child, module)
+
+def load_script(filename, name):
+  """Load the given script from the scripts directory as a module with
+  the given name"""
+
+  _install_wing_modules()
+  module = sys.modules.get(name)
+  if module is None:
+    module = imp.load_source(name, os.path.join(kScriptDir, filename))
+  return module
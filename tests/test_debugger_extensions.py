@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+debugger_extensions = support.load_script('debugger-extensions.py', 'debugger_extensions')
+
+
+class FindMarkersTests(unittest.TestCase):
+
+  def test_find_markers(self):
+    txt = 'a = 1\nb = 2  # %BP%\nc = 3  # %BP%: a > 1 \n'
+    self.assertEqual(debugger_extensions._find_markers(txt), [(2, None), (3, 'a > 1')])
+    self.assertEqual(debugger_extensions._find_markers('x = 1\n'), [])
+
+
+class _CRunState:
+  """Records the breakpoints set and cleared"""
+
+  def __init__(self):
+    self.fCalls = []
+
+  def SetBreak(self, filename, lineno, cond=None):
+    self.fCalls.append(('set', filename, lineno, cond))
+
+  def ClearBreak(self, filename, lineno):
+    self.fCalls.append(('clear', filename, lineno))
+
+
+class MarkerIndexTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.indexfile = os.path.join(self.dirname, 'index')
+    self.index = debugger_extensions._CMarkerIndex(self.indexfile)
+    self.runstate = _CRunState()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirname)
+
+  def test_sync(self):
+    index = self.index
+    index.Sync(self.runstate, '/a.py', [(2, None), (5, 'x')])
+    self.assertEqual(self.runstate.fCalls, [('set', '/a.py', 2, None),
+                                            ('set', '/a.py', 5, 'x')])
+    self.assert_(index.IsSynced('/a.py'))
+    self.assert_(index.fDirty)
+
+    # Unchanged markers don't touch the breakpoints
+    index.fDirty = False
+    del self.runstate.fCalls[:]
+    index.Sync(self.runstate, '/a.py', [(2, None), (5, 'x')])
+    self.assertEqual(self.runstate.fCalls, [])
+    self.failIf(index.fDirty)
+
+    index.Sync(self.runstate, '/a.py', [(3, None)])
+    self.assertEqual(self.runstate.fCalls, [('clear', '/a.py', 2), ('clear', '/a.py', 5),
+                                            ('set', '/a.py', 3, None)])
+    del self.runstate.fCalls[:]
+    index.Sync(self.runstate, '/a.py', [])
+    self.assertEqual(self.runstate.fCalls, [('clear', '/a.py', 3)])
+    self.failIf(index.IsSynced('/a.py'))
+
+  def test_move_lines(self):
+    index = self.index
+    index.Sync(self.runstate, '/a.py', [(2, None), (5, 'x'), (9, None)])
+    del self.runstate.fCalls[:]
+
+    # Two lines inserted after line 3 (0-based line 2)
+    index.MoveLines('/a.py', 2, 2)
+    self.assertEqual(index.fSynced['/a.py'], [(2, None), (7, 'x'), (11, None)])
+
+    # Lines 7 and 8 removed, which forgets the breakpoint on line 7
+    index.MoveLines('/a.py', 5, -2)
+    self.assertEqual(index.fSynced['/a.py'], [(2, None), (9, None)])
+
+    # The breakpoints are cleared from their new lines
+    index.Sync(self.runstate, '/a.py', [])
+    self.assertEqual(self.runstate.fCalls, [('clear', '/a.py', 2), ('clear', '/a.py', 9)])
+
+  def test_move_lines_in_other_file(self):
+    self.index.MoveLines('/b.py', 0, 5)
+    self.assertEqual(self.index.fSynced, {})
+    self.failIf(self.index.fDirty)
+
+  def test_update_and_save(self):
+    filename = os.path.join(self.dirname, 'a.py')
+    f = open(filename, 'w')
+    f.write('x = 1  # %BP%\n')
+    f.close()
+    index = self.index
+    index.Update([filename, os.path.join(self.dirname, 'missing.py')])
+    self.assertEqual(index.GetMarkers(filename), [(1, None)])
+    self.assertEqual(index.GetFilenames(), set([filename]))
+    index.Sync(self.runstate, filename, index.GetMarkers(filename))
+    index.Save()
+    self.failIf(index.fDirty)
+
+    index = debugger_extensions._CMarkerIndex(self.indexfile)
+    self.assertEqual(index.GetMarkers(filename), [(1, None)])
+    self.assert_(index.IsSynced(filename))
+    index.Update([filename])
+    self.failIf(index.fDirty)
+    os.remove(filename)
+    index.Update([filename])
+    self.assertEqual(index.GetMarkers(filename), [])
+    # Its breakpoints are still known so they can be cleared
+    self.assertEqual(index.GetFilenames(), set([filename]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,324 @@
+import os
+import shutil
+import tempfile
+import tokenize
+import unittest
+
+import support
+
+editor_extensions = support.load_script('editor-extensions.py', 'editor_extensions')
+
+
+def _apply_edits(txt, edits):
+  for start, end, new in reversed(edits):
+    txt = txt[:start] + new + txt[end:]
+  return txt
+
+
+kSource = '''import os
+
+class A:
+    @property
+    def x(self):
+        return 1
+
+    def y(self):
+        pass
+
+def f():
+    return 2
+
+@decorator
+def g(): pass
+'''
+
+
+class ParseOutlineTests(unittest.TestCase):
+
+  def test_parse(self):
+    entries, toplevel = editor_extensions._parse_outline(kSource)
+    self.assertEqual(entries, [
+      (2, 2, 8, 'class', False),
+      (3, 4, 5, 'def', True),
+      (7, 7, 8, 'def', True),
+      (10, 10, 11, 'def', False),
+      (13, 14, 14, 'def', False),
+    ])
+    self.assertEqual(toplevel, [0, 2, 10, 13])
+
+  def test_first_line(self):
+    entries, toplevel = editor_extensions._parse_outline('def f():\n  pass\n', 10)
+    self.assertEqual(entries, [(10, 10, 11, 'def', False)])
+    self.assertEqual(toplevel, [10])
+
+  def test_incomplete(self):
+    parse = editor_extensions._parse_outline
+    self.assertRaises(tokenize.TokenError, parse, 'def f(a,\n')
+    self.assertRaises(IndentationError, parse, 'def f():\n    pass\n  pass\n')
+    self.assertEqual(parse('@decorator\n')[0], [])
+    self.assertRaises(tokenize.TokenError, parse, '@decorator\n', partial=True)
+
+  def test_outline_from_indents(self):
+    txt = 'class A:\n  def f(self,\n  def g(self):\n    pass\n\nx = 1\n'
+    self.assertEqual(editor_extensions._outline_from_indents(txt), [
+      (0, 0, 3, 'class', False),
+      (1, 1, 1, 'def', True),
+      (2, 2, 3, 'def', True),
+    ])
+
+
+class _CDoc:
+  """A Wing document with the calls used by the outline, which sends the
+  modified signal for each change"""
+
+  def __init__(self, txt):
+    self.fText = txt
+    self.fModifiedCallbacks = []
+
+  def Connect(self, signal, cb):
+    if signal == 'modified':
+      self.fModifiedCallbacks.append(cb)
+
+  def Insert(self, pos, txt):
+    self.fText = self.fText[:pos] + txt + self.fText[pos:]
+    for cb in self.fModifiedCallbacks:
+      cb(True, pos, len(txt), txt, txt.count('\n'))
+
+  def Delete(self, start, end):
+    txt = self.fText[start:end]
+    self.fText = self.fText[:start] + self.fText[end:]
+    for cb in self.fModifiedCallbacks:
+      cb(False, start, len(txt), txt, txt.count('\n'))
+
+  def GetText(self):
+    return self.fText
+
+  def GetLength(self):
+    return len(self.fText)
+
+  def GetCharRange(self, start, end):
+    return self.fText[start:end]
+
+  def GetLineCount(self):
+    return self.fText.count('\n') + 1
+
+  def GetLineNumberFromPosition(self, pos):
+    return self.fText.count('\n', 0, pos)
+
+  def GetLineStart(self, line):
+    pos = 0
+    for i in range(line):
+      pos = self.fText.index('\n', pos) + 1
+    return pos
+
+  def GetLineEnd(self, line):
+    end = self.fText.find('\n', self.GetLineStart(line))
+    if end < 0:
+      return len(self.fText)
+    return end
+
+
+class PythonOutlineTests(unittest.TestCase):
+
+  def setUp(self):
+    self.doc = _CDoc(kSource)
+    self.outline = editor_extensions._CPythonOutline(self.doc)
+    self.outline.GetEntries()
+
+  def update(self):
+    """Bring the outline up to date incrementally and check that it
+    matches the outline of the whole document"""
+
+    self.assert_(self.outline.fEdits)
+    self.assert_(self.outline._CPythonOutline__Update())
+    entries, toplevel = editor_extensions._parse_outline(self.doc.GetText())
+    self.assertEqual(self.outline.fEntries, entries)
+    self.assertEqual(self.outline.fTopLevel, toplevel)
+    self.assertEqual(self.outline.GetEntries(), entries)
+
+  def pos(self, txt):
+    return self.doc.GetText().index(txt)
+
+  def test_insert_in_body(self):
+    self.doc.Insert(self.pos('        return 1'), '        a = 1\n        b = 2\n')
+    self.update()
+
+  def test_insert_def(self):
+    self.doc.Insert(self.pos('def f'), 'def h(x):\n    return x\n\n')
+    self.update()
+    self.assertEqual(self.outline.fEntries[3], (10, 10, 11, 'def', False))
+
+  def test_insert_method(self):
+    self.doc.Insert(self.pos('\ndef f'), '    def z(self):\n        pass\n')
+    self.update()
+
+  def test_delete_lines(self):
+    self.doc.Delete(self.pos('    def y'), self.pos('def f'))
+    self.update()
+    self.assertEqual(self.outline.fEntries[0], (2, 2, 5, 'class', False))
+
+  def test_several_edits(self):
+    self.doc.Insert(0, '"""Doc"""\n')
+    self.doc.Insert(self.pos('@decorator'), '@other\n')
+    self.doc.Delete(self.pos('import os\n'), self.pos('\nclass A'))
+    self.update()
+
+  def test_incomplete_edit(self):
+    self.doc.Insert(self.pos('def f():'), 'def h(a,\n')
+    entries = self.outline.GetEntries()
+    self.assertEqual(self.outline.fEntries, None)
+    self.assertEqual(entries, editor_extensions._outline_from_indents(self.doc.GetText()))
+
+    # The outline is found again once the code is complete
+    self.doc.Insert(self.pos('def f():'), '):\n    pass\n')
+    self.assertEqual(self.outline.GetEntries(),
+                     editor_extensions._parse_outline(self.doc.GetText())[0])
+
+  def test_many_edits(self):
+    for i in range(editor_extensions.kMaxOutlineEdits + 1):
+      self.doc.Insert(0, '\n')
+    self.assertEqual(self.outline.fEntries, None)
+    self.assertEqual(self.outline.GetEntries()[0], (53, 53, 59, 'class', False))
+
+
+class FindLineEndsTests(unittest.TestCase):
+
+  def setUp(self):
+    self.saved = (editor_extensions.kConvertChunkSize,
+                  editor_extensions.kConvertMergeGap)
+
+  def tearDown(self):
+    (editor_extensions.kConvertChunkSize,
+     editor_extensions.kConvertMergeGap) = self.saved
+
+  def convert(self, txt, eol):
+    counts, ranges = editor_extensions._find_line_ends_to_convert(_CDoc(txt), eol)
+    edits = []
+    for start, end in ranges:
+      part = txt[start:end]
+      edits.append((start, end, editor_extensions._kLineEndExpr.sub(eol, part)))
+    return counts, ranges, _apply_edits(txt, edits)
+
+  def test_counts(self):
+    counts, ranges, txt = self.convert('a\r\nb\nc\rd\r\n', '\r\n')
+    self.assertEqual(counts, {'\r\n': 2, '\n': 1, '\r': 1})
+
+  def test_nothing_to_convert(self):
+    counts, ranges, txt = self.convert('a\nb\n', '\n')
+    self.assertEqual(ranges, [])
+    counts, ranges, txt = self.convert('', '\n')
+    self.assertEqual((counts, ranges), ({'\r\n': 0, '\n': 0, '\r': 0}, []))
+
+  def test_convert(self):
+    for eol in ('\n', '\r\n', '\r'):
+      counts, ranges, txt = self.convert('a\r\nb\nc\rd\r\n\r\n', eol)
+      self.assertEqual(txt, 'a%sb%sc%sd%s%s' % ((eol,) * 5))
+
+  def test_small_chunks(self):
+    editor_extensions.kConvertChunkSize = 4
+    editor_extensions.kConvertMergeGap = 2
+    source = 'ab\r\ncd\r\r\nef\n\ngh\r\r\r\n' * 5
+    for eol in ('\n', '\r\n', '\r'):
+      counts, ranges, txt = self.convert(source, eol)
+      self.assertEqual(counts, {'\r\n': 15, '\n': 10, '\r': 15})
+      self.assertEqual(txt, source.replace('\r\n', '\n').replace('\r', '\n')
+                       .replace('\n', eol))
+      for start, end in ranges:
+        self.assert_(end - start <= 5)
+
+  def test_merged_ranges(self):
+    counts, ranges, txt = self.convert('a\nb\nc\n', '\r\n')
+    self.assertEqual(ranges, [(1, 6)])
+
+
+
+class ConvertFileTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dirname, 'a.txt')
+    self.saved = editor_extensions.kConvertChunkSize
+    editor_extensions.kConvertChunkSize = 3
+
+  def tearDown(self):
+    editor_extensions.kConvertChunkSize = self.saved
+    shutil.rmtree(self.dirname)
+
+  def write(self, txt):
+    f = open(self.filename, 'wb')
+    f.write(txt)
+    f.close()
+
+  def read(self):
+    f = open(self.filename, 'rb')
+    try:
+      return f.read()
+    finally:
+      f.close()
+
+  def test_convert(self):
+    # CR + LF split between chunks is kept as one line ending
+    source = 'ab\r\nc\n\rd\r\n\r'
+    for eol in ('\n', '\r\n', '\r'):
+      self.write(source)
+      counts = {'\r\n': 0, '\r': 0, '\n': 0}
+      self.assert_(editor_extensions._convert_file_line_ends(self.filename, eol, counts))
+      self.assertEqual(counts, {'\r\n': 2, '\r': 2, '\n': 1})
+      self.assertEqual(self.read(), 'ab%sc%s%sd%s%s' % ((eol,) * 5))
+
+  def test_binary_file_left_alone(self):
+    self.write('a\0b\r\n')
+    counts = {'\r\n': 0, '\r': 0, '\n': 0}
+    self.failIf(editor_extensions._convert_file_line_ends(self.filename, '\n', counts))
+    self.assertEqual(self.read(), 'a\0b\r\n')
+    self.assertEqual(os.listdir(self.dirname), ['a.txt'])
+
+
+
+class FindEditsTests(unittest.TestCase):
+
+  def check(self, old, new):
+    edits = editor_extensions._find_edits(old, new)
+    self.assertEqual(_apply_edits(old, edits), new)
+    starts = [start for start, end, txt in edits]
+    self.assertEqual(starts, sorted(starts))
+    return edits
+
+  def test_unchanged(self):
+    self.assertEqual(self.check('a\nb\n', 'a\nb\n'), [])
+
+  def test_changed_line_is_trimmed(self):
+    self.assertEqual(self.check('x = 1\ny = foo(a,b)\n', 'x = 1\ny = foo(a, b)\n'),
+                     [(16, 16, ' ')])
+
+  def test_separate_lines(self):
+    edits = self.check('a = 1\nb = 2\nc = 3\n', 'a = 10\nb = 2\nc = 30\n')
+    self.assertEqual(edits, [(5, 5, '0'), (17, 17, '0')])
+
+  def test_inserted_and_removed_lines(self):
+    old = ''.join(['line %i\n' % i for i in range(20)])
+    lines = old.splitlines(True)
+    new = ''.join(lines[:3] + ['new\n'] + lines[3:10] + lines[12:])
+    edits = self.check(old, new)
+    # Only the inserted and removed lines are touched
+    self.assertEqual(len(edits), 2)
+    self.assertEqual(sum([len(txt) for start, end, txt in edits]), len('new\n'))
+
+  def test_many_changed_lines(self):
+    saved = editor_extensions.kMaxDiffLines
+    editor_extensions.kMaxDiffLines = 4
+    try:
+      old = ''.join(['%i\n' % i for i in range(10)])
+      new = 'start\n' + old.replace('5', 'five').replace('8', 'eight') + 'end'
+      self.check(old, new)
+    finally:
+      editor_extensions.kMaxDiffLines = saved
+
+  def test_no_final_newline(self):
+    self.check('a\nb', 'a\nb\nc')
+    self.check('a\nb\nc', 'a\nb')
+    self.check('', 'a\n')
+    self.check('a\n', '')
+
+if __name__ == '__main__':
+  unittest.main()
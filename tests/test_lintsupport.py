@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import lintsupport
+
+
+def _messages(store, category):
+  return [(store.GetPath(row), store.GetLine(row), store.GetColumn(row),
+           store.GetMsgId(row), store.GetDescr(row))
+          for row in store.GetCategoryRows(category)]
+
+
+class MessageStoreTests(unittest.TestCase):
+
+  def setUp(self):
+    self.store = lintsupport.CMessageStore(2)
+
+  def test_add(self):
+    store = self.store
+    row = store.Add(1, '/a.py', 3, 4, 'W0611', 'Unused import', 7)
+    store.Add(0, '/a.py', 5, 0, 'E1101', 'No member')
+    store.Add(1, '/b.py', 1, 0, 'W0611', 'Unused import', 7)
+    self.assertEqual(len(store), 3)
+    self.assertEqual(store.GetCount(0), 1)
+    self.assertEqual(store.GetCount(1), 2)
+    self.assertEqual(store.GetCategory(row), 1)
+    self.assertEqual(_messages(store, 1), [('/a.py', 3, 4, 'W0611', 'Unused import'),
+                                          ('/b.py', 1, 0, 'W0611', 'Unused import')])
+    # Repeated values are stored once
+    self.assertEqual(store.fPaths, ['/a.py', '/b.py'])
+    self.assertEqual(store.fDescrs, ['Unused import', 'No member'])
+
+  def test_find_rows(self):
+    store = self.store
+    row = store.Add(1, '/a.py', 3, 0, 'W0611', 'Unused', 7)
+    self.assertEqual(store.FindRows('/a.py', 'W0611', 7), [row])
+    self.assertEqual(store.FindRows('/a.py', 'W0611', 8), [])
+    self.assertEqual(store.FindRows('/b.py', 'W0611', 7), [])
+
+  def test_set(self):
+    store = self.store
+    row = store.Add(0, '/a.py', 3, 0, 'E1101', 'No member')
+    store.SetLine(row, 10)
+    store.SetColumn(row, 2)
+    store.SetDescr(row, 'No member b')
+    self.assertEqual(_messages(store, 0), [('/a.py', 10, 2, 'E1101', 'No member b')])
+
+  def test_remove(self):
+    store = self.store
+    rows = [store.Add(i % 2, '/a.py', i, 0, 'C%i' % i, 'x', i) for i in range(6)]
+    store.Remove([rows[1], rows[2]])
+    self.assertEqual(list(store.GetCategoryRows(0)), [rows[0], rows[4]])
+    self.assertEqual(list(store.GetCategoryRows(1)), [rows[3], rows[5]])
+    self.assertEqual(store.FindRows('/a.py', 'C1', 1), [])
+    self.assertEqual(store.GetPosition(rows[4]), 1)
+    self.assertEqual(store.GetPosition(rows[2]), None)
+
+  def test_remove_with_callback(self):
+    store = self.store
+    rows = [store.Add(0, '/a.py', i, 0, 'C0111', 'x', i) for i in range(5)]
+    deleted = []
+    store.Remove([rows[1], rows[3]], lambda category, pos: deleted.append((category, pos)))
+    self.assertEqual(deleted, [(0, 3), (0, 1)])
+    self.assertEqual(list(store.GetCategoryRows(0)), [rows[0], rows[2], rows[4]])
+
+  def test_remove_keeps_row_array(self):
+    store = self.store
+    rows = [store.Add(0, '/a.py', i, 0, 'C0111', 'x', i) for i in range(3)]
+    category_rows = store.GetCategoryRows(0)
+    store.Remove([rows[0]])
+    self.assert_(store.GetCategoryRows(0) is category_rows)
+    self.assertEqual(list(category_rows), rows[1:])
+
+  def test_compact(self):
+    store = self.store
+    rows = [store.Add(i % 2, '/a.py', i, 0, 'C%i' % i, 'x', i) for i in range(20001)]
+    self.failIf(store.NeedsCompacting())
+    store.Remove(rows[:15000])
+    self.assert_(store.NeedsCompacting())
+    store.Compact()
+    self.failIf(store.NeedsCompacting())
+    self.assertEqual(len(store), 5001)
+    self.assertEqual(store.GetLine(store.GetCategoryRows(0)[0]), 15000)
+    self.assertEqual(store.FindRows('/a.py', 'C20000', 20000), [5000])
+
+  def test_clear(self):
+    store = self.store
+    store.Add(0, '/a.py', 1, 0, 'E1', 'x')
+    store.Clear()
+    self.assertEqual(len(store), 0)
+    self.assertEqual(store.GetCount(0), 0)
+    self.assertEqual(store.FindRows('/a.py', 'E1', 0), [])
+    self.assertEqual(store.GetPathRows('/a.py'), [])
+    self.assertEqual(store.GetMsgIdCounts(), ({}, {}))
+
+  def test_path_rows(self):
+    store = self.store
+    a1 = store.Add(1, '/a.py', 1, 0, 'W1', 'x')
+    b1 = store.Add(0, '/b.py', 1, 0, 'E1', 'y')
+    a2 = store.Add(0, '/a.py', 2, 0, 'E1', 'y')
+    self.assertEqual(store.GetPathRows('/a.py'), [a1, a2])
+    self.assertEqual(store.GetPathRows('/b.py'), [b1])
+    self.assertEqual(store.GetPathRows('/c.py'), [])
+    store.Remove([a1])
+    self.assertEqual(store.GetPathRows('/a.py'), [a2])
+    store.Remove([b1])
+    self.assertEqual(store.GetPathRows('/b.py'), [])
+
+  def test_msgid_counts(self):
+    store = self.store
+    w1 = store.Add(1, '/a.py', 1, 0, 'W1', 'first')
+    store.Add(1, '/a.py', 2, 0, 'W1', 'second')
+    e1 = store.Add(0, '/b.py', 1, 0, 'E1', 'error')
+    self.assertEqual(store.GetMsgIdCounts(), ({'W1': 2, 'E1': 1},
+                                              {'W1': 'first', 'E1': 'error'}))
+    store.Remove([w1, e1])
+    self.assertEqual(store.GetMsgIdCounts(), ({'W1': 1}, {'W1': 'first'}))
+    store.Add(0, '/b.py', 1, 0, 'E1', 'other error')
+    self.assertEqual(store.GetMsgIdCounts(), ({'W1': 1, 'E1': 1},
+                                              {'W1': 'first', 'E1': 'other error'}))
+
+  def test_indexes_after_compact(self):
+    store = self.store
+    rows = [store.Add(0, '/%i.py' % (i % 3), i, 0, 'E%i' % (i % 2), 'x') for i in range(20001)]
+    store.Remove(rows[:15000])
+    store.Compact()
+    self.assertEqual(store.GetPathRows('/0.py'), range(0, 5001, 3))
+    self.assertEqual(store.GetMsgIdCounts()[0], {'E0': 2501, 'E1': 2500})
+
+
+class MessageDiffTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.store = lintsupport.CMessageStore(2)
+
+  def tearDown(self):
+    shutil.rmtree(self.dirname)
+
+  def write(self, name, lines):
+    path = os.path.join(self.dirname, name)
+    f = open(path, 'w')
+    try:
+      f.write('\n'.join(lines) + '\n')
+    finally:
+      f.close()
+    return path
+
+  def test_first_run(self):
+    a = self.write('a.py', ['import os', 'x = 1'])
+    diff = lintsupport.CMessageDiff(self.store)
+    row, new = diff.Add(1, a, 1, 0, 'W0611', 'Unused import os')
+    self.assert_(new)
+    self.assertEqual(diff.GetUnchangedCount(), 0)
+    self.assertEqual(diff.fNewCounts, [0, 1])
+    self.assertEqual(diff.GetResolvedRows(), [])
+
+  def test_moved_and_resolved(self):
+    a = self.write('a.py', ['import os', 'import sys', 'x = 1'])
+    diff = lintsupport.CMessageDiff(self.store)
+    os_row = diff.Add(1, a, 1, 0, 'W0611', 'Unused import os')[0]
+    sys_row = diff.Add(1, a, 2, 0, 'W0611', 'Unused import sys')[0]
+
+    # A line is inserted above the imports and sys is now used
+    self.write('a.py', ['"""Doc"""', 'import os', 'import sys', 'x = sys'])
+    diff = lintsupport.CMessageDiff(self.store)
+    row, new = diff.Add(1, a, 2, 4, 'W0611', 'Unused import os (really)')
+    self.assertEqual((row, new), (os_row, False))
+    self.assertEqual(diff.PopChangedRows(), [os_row])
+    self.assertEqual(diff.PopChangedRows(), [])
+    self.assertEqual(_messages(self.store, 1)[0],
+                     (a, 2, 4, 'W0611', 'Unused import os (really)'))
+    self.assertEqual(diff.GetUnchangedCount(), 1)
+    self.assertEqual(diff.GetResolvedRows(), [sys_row])
+    self.assertEqual(diff.GetResolvedCount(), 1)
+
+  def test_unchanged(self):
+    a = self.write('a.py', ['import os'])
+    lintsupport.CMessageDiff(self.store).Add(1, a, 1, 0, 'W0611', 'Unused')
+    diff = lintsupport.CMessageDiff(self.store)
+    diff.Add(1, a, 1, 0, 'W0611', 'Unused')
+    self.assertEqual(diff.PopChangedRows(), [])
+    self.assertEqual(diff.GetResolvedRows(), [])
+
+  def test_duplicate_messages(self):
+    a = self.write('a.py', ['x = y', 'x = y'])
+    diff = lintsupport.CMessageDiff(self.store)
+    first = diff.Add(0, a, 1, 4, 'E0602', 'Undefined y')[0]
+    second = diff.Add(0, a, 2, 4, 'E0602', 'Undefined y')[0]
+    diff = lintsupport.CMessageDiff(self.store)
+    self.assertEqual(diff.Add(0, a, 1, 4, 'E0602', 'Undefined y'), (first, False))
+    self.assertEqual(diff.Add(0, a, 2, 4, 'E0602', 'Undefined y'), (second, False))
+    self.assertEqual(diff.Add(0, a, 2, 4, 'E0602', 'Undefined y')[1], True)
+
+  def test_resolved_only_for_linted_paths(self):
+    a = self.write('a.py', ['import os'])
+    os.mkdir(os.path.join(self.dirname, 'pkg'))
+    b = self.write(os.path.join('pkg', 'b.py'), ['import os'])
+    c = self.write('c.py', ['import os'])
+    diff = lintsupport.CMessageDiff(self.store)
+    rows = [diff.Add(1, path, 1, 0, 'W0611', 'Unused')[0] for path in (a, b, c)]
+
+    diff = lintsupport.CMessageDiff(self.store, [a])
+    self.assertEqual(diff.GetResolvedRows(), [rows[0]])
+    diff = lintsupport.CMessageDiff(self.store, [os.path.join(self.dirname, 'pkg')])
+    self.assertEqual(diff.GetResolvedRows(), [rows[1]])
+    diff = lintsupport.CMessageDiff(self.store)
+    self.assertEqual(diff.GetResolvedRows(), rows)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+pep8panel = support.load_script('pep8panel.py', 'pep8panel')
+
+
+class _CProject:
+  def __init__(self, filename):
+    self.fFilename = filename
+  def GetFilename(self):
+    return self.fFilename
+
+class _CApplication:
+  def __init__(self, project):
+    self.fProject = project
+  def GetProject(self):
+    return self.fProject
+
+
+class Pep8ConfigTests(unittest.TestCase):
+
+  def test_equal_configs(self):
+    a = pep8panel._CPep8Config(['--repeat', '--statistics'], None)
+    b = pep8panel._CPep8Config(('--repeat', '--statistics'), None)
+    self.assertEqual(a.GetArgs(), ('--repeat', '--statistics'))
+    self.assertEqual(a, b)
+    self.failIf(a != b)
+    self.assertEqual(hash(a), hash(b))
+    self.assertEqual(a.GetDigest(), b.GetDigest())
+
+  def test_different_configs(self):
+    a = pep8panel._CPep8Config(['--repeat'], None)
+    self.assertNotEqual(a, pep8panel._CPep8Config(['--statistics'], None))
+    self.assertNotEqual(a, pep8panel._CPep8Config(['--repeat'], ('setup.cfg', 1, 2)))
+    self.assertNotEqual(a, '--repeat')
+
+
+class GetPep8ConfigTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.saved = (pep8panel.wingapi.gApplication, pep8panel.PEP8_ARGS,
+                  pep8panel.PEP8_FILETYPE_ARGS)
+    project = _CProject(os.path.join(self.dirname, 'test.wpr'))
+    pep8panel.wingapi.gApplication = _CApplication(project)
+    pep8panel.PEP8_ARGS = ['--repeat', '--statistics']
+    pep8panel.PEP8_FILETYPE_ARGS = {'.pyw': ['--max-line-length=100']}
+
+  def tearDown(self):
+    (pep8panel.wingapi.gApplication, pep8panel.PEP8_ARGS,
+     pep8panel.PEP8_FILETYPE_ARGS) = self.saved
+    shutil.rmtree(self.dirname)
+
+  def write(self, name, txt):
+    path = os.path.join(self.dirname, name)
+    f = open(path, 'w')
+    f.write(txt)
+    f.close()
+    return path
+
+  def test_args(self):
+    config = pep8panel._get_pep8_config()
+    self.assertEqual(config.GetArgs(), ('--repeat', '--statistics'))
+    self.assert_(pep8panel._get_pep8_config() is config)
+    self.assertEqual(pep8panel._get_pep8_config(is_dir=True).GetArgs(),
+                     ('--repeat', '--statistics', '--filename=*.py'))
+    self.assertEqual(pep8panel._get_pep8_config('/src/a.PYW').GetArgs(),
+                     ('--repeat', '--statistics', '--max-line-length=100'))
+    self.assert_(pep8panel._get_pep8_config('/src/a.py') is config)
+
+  def test_args_not_changed(self):
+    pep8panel._get_pep8_config(is_dir=True)
+    pep8panel._get_pep8_config('/src/a.pyw')
+    self.assertEqual(pep8panel.PEP8_ARGS, ['--repeat', '--statistics'])
+
+  def test_project_config(self):
+    self.write('setup.cfg', '[metadata]\nname = x\n')
+    self.assertEqual(pep8panel._get_pep8_config().GetArgs(), ('--repeat', '--statistics'))
+    path = self.write('tox.ini', '[tox]\n\n[pep8]\nmax-line-length = 100\n')
+    config = pep8panel._get_pep8_config()
+    self.assertEqual(config.GetArgs(), ('--repeat', '--statistics', '--config=%s' % path))
+
+    # A changed config file gives a new digest for the same args
+    self.write('tox.ini', '[pycodestyle]\nmax-line-length = 120\n')
+    changed = pep8panel._get_pep8_config()
+    self.assertEqual(changed.GetArgs(), config.GetArgs())
+    self.assertNotEqual(changed.GetDigest(), config.GetDigest())
+
+  def test_unsaved_project(self):
+    pep8panel.wingapi.gApplication = _CApplication(_CProject(None))
+    self.assertEqual(pep8panel._find_project_config(), (None, None))
+    pep8panel.wingapi.gApplication = _CApplication(None)
+    self.assertEqual(pep8panel._find_project_config(), (None, None))
+
+  def test_cache(self):
+    cache = {}
+    config = pep8panel._get_pep8_config('/src/a.py', cache=cache)
+    self.write('.pep8', '[pep8]\nignore = E501\n')
+    self.assert_(pep8panel._get_pep8_config('/src/b.py', cache=cache) is config)
+    self.assertNotEqual(pep8panel._get_pep8_config('/src/c.pyw', cache=cache), config)
+    self.assertEqual(sorted(cache), [('.py', False), ('.pyw', False)])
+
+
+if __name__ == '__main__':
+  unittest.main()
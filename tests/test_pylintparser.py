@@ -0,0 +1,118 @@
+import os
+import json
+import unittest
+
+import support
+import pylintparser
+
+
+class MessageExprTests(unittest.TestCase):
+
+  def test_parseable(self):
+    m = pylintparser.kMessageExpr.match(
+      'pkg/mod.py:12: [C0111(missing-docstring), func] Missing docstring')
+    self.assertEqual(m.group('ppath', 'pline', 'ptype', 'pdescr'),
+                     ('pkg/mod.py', '12', 'C0111(missing-docstring), func',
+                      'Missing docstring'))
+
+  def test_text(self):
+    m = pylintparser.kMessageExpr.match('pkg/mod.py:12:4: W0611: Unused import os')
+    self.assertEqual(m.group('tpath', 'tline', 'tcol', 'ttype', 'tdescr'),
+                     ('pkg/mod.py', '12', '4', 'W0611', 'Unused import os'))
+
+  def test_windows_path(self):
+    m = pylintparser.kMessageExpr.match(r'C:\src\mod.py:3:0: E1101: No member')
+    self.assertEqual(m.group('tpath', 'tline'), (r'C:\src\mod.py', '3'))
+
+  def test_old_text(self):
+    m = pylintparser.kMessageExpr.match('C0111: 12,4: Missing docstring')
+    self.assertEqual(m.group('type', 'line', 'col', 'descr'),
+                     ('C0111', '12', '4', 'Missing docstring'))
+    m = pylintparser.kMessageExpr.match('C: 12: Missing docstring')
+    self.assertEqual(m.group('type', 'line', 'col', 'descr'),
+                     ('C', '12', None, 'Missing docstring'))
+
+  def test_other_lines(self):
+    for line in ('************* Module pkg.mod', '', 'Your code has been rated'):
+      self.assertEqual(pylintparser.kMessageExpr.match(line), None)
+
+
+class TextParserTests(unittest.TestCase):
+
+  def setUp(self):
+    self.parser = pylintparser.CTextParser('/src', '/src/pkg/mod.py')
+
+  def test_parse_formats(self):
+    messages = self.parser.ParseLines([
+      '************* Module pkg.mod',
+      'pkg/mod.py:12: [C0111(missing-docstring), func] Missing docstring',
+      'pkg/mod.py:3:8: E1101: Instance has no member ',
+      'W0611: 1,0: Unused import os',
+    ])
+    self.assertEqual(messages, [
+      (2, '/src/pkg/mod.py', 12, 0, 'C0111(missing-docstring)',
+       'func: Missing docstring'),
+      (0, '/src/pkg/mod.py', 3, 8, 'E1101', 'Instance has no member'),
+      (1, '/src/pkg/mod.py', 1, 0, 'W0611', 'Unused import os'),
+    ])
+
+  def test_parseable_without_object(self):
+    messages = self.parser.ParseLines(['pkg/mod.py:1: [F0401(import-error), ] Unable'])
+    self.assertEqual(messages, [(0, '/src/pkg/mod.py', 1, 0, 'F0401(import-error)',
+                                 'Unable')])
+
+  def test_paths_resolved_against_rundir(self):
+    messages = self.parser.ParseLines(['a.py:1:0: C0111: x', 'b/c.py:2:0: C0111: y',
+                                       'a.py:5:0: C0111: z'])
+    self.assertEqual([msg[1] for msg in messages],
+                     [os.path.join('/src', 'a.py'), os.path.join('/src', 'b/c.py'),
+                      os.path.join('/src', 'a.py')])
+    self.assertEqual(self.parser.Finish(), [])
+
+
+class JSONParserTests(unittest.TestCase):
+
+  def test_parse(self):
+    parser = pylintparser.CJSONParser('/src', '/src/mod.py')
+    items = [
+      {'type': 'convention', 'obj': 'func', 'line': 4, 'column': 2,
+       'path': 'pkg/a.py', 'symbol': 'missing-docstring',
+       'message': 'Missing docstring', 'message-id': 'C0111'},
+      {'type': 'error', 'obj': '', 'line': 7, 'column': None, 'path': '',
+       'message': 'Syntax error'},
+    ]
+    lines = ['No config file found'] + json.dumps(items, indent=2).split('\n')
+    self.assertEqual(parser.ParseLines(lines[:3]), [])
+    self.assertEqual(parser.ParseLines(lines[3:]), [])
+    self.assertEqual(parser.Finish(), [
+      (2, os.path.join('/src', 'pkg/a.py'), 4, 2, 'C0111(missing-docstring)',
+       'func: Missing docstring'),
+      (0, '/src/mod.py', 7, 0, 'E', 'Syntax error'),
+    ])
+
+  def test_incomplete_output(self):
+    parser = pylintparser.CJSONParser('/src', '/src/mod.py')
+    parser.ParseLines(['[', '  {"line": 1'])
+    self.assertEqual(parser.Finish(), [])
+    parser.ParseLines(['nothing to see'])
+    self.assertEqual(parser.Finish(), [])
+
+
+class CreateParserTests(unittest.TestCase):
+
+  def test_create_parser(self):
+    self.assert_(isinstance(pylintparser.create_parser(True, '/src', None),
+                            pylintparser.CJSONParser))
+    self.assert_(isinstance(pylintparser.create_parser(False, '/src', None),
+                            pylintparser.CTextParser))
+
+  def test_supports_json(self):
+    self.assert_(pylintparser.supports_json('1.7.0'))
+    self.assert_(pylintparser.supports_json('2.4'))
+    self.failIf(pylintparser.supports_json('1.6.5'))
+    self.failIf(pylintparser.supports_json('1.0b1'))
+    self.failIf(pylintparser.supports_json(None))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import unittest
+from StringIO import StringIO
+
+import support
+import pylintworker
+
+
+# A stand-in for pylint, enough for the worker to run it
+kFakePylint = {
+  'pylint/__init__.py': "__version__ = '9.8.7'\n",
+  'pylint/lint.py': '''import os
+import sys
+class Run:
+  def __init__(self, args, exit=True):
+    sys.stdout.write('%s:1:0: C0111: %s\\n' % (os.getcwd(), ' '.join(args)))
+    sys.stdout.write('partial')
+    if args and args[0] == 'fail':
+      raise SystemExit(4)
+''',
+  'astroid/__init__.py': '''class _CManager:
+  astroid_cache = {}
+MANAGER = _CManager()
+''',
+}
+
+
+class WorkerProtocolTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self.dirname, 'pylint'))
+    os.mkdir(os.path.join(self.dirname, 'astroid'))
+    for name, txt in kFakePylint.items():
+      f = open(os.path.join(self.dirname, name), 'w')
+      f.write(txt)
+      f.close()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = self.dirname
+    self.process = subprocess.Popen(
+      [sys.executable, '-u', os.path.join(support.kScriptDir, 'pylintworker.py')],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+
+  def tearDown(self):
+    self.process.stdin.close()
+    self.process.wait()
+    shutil.rmtree(self.dirname)
+
+  def request(self, lines):
+    self.process.stdin.write('RUN %i\n' % len(lines) + ''.join([line + '\n' for line in lines]))
+    self.process.stdin.flush()
+    output = []
+    while True:
+      line = self.process.stdout.readline()
+      self.assert_(line, 'worker exited')
+      output.append(line)
+      if line.startswith(pylintworker.kMarker + 'DONE '):
+        return output
+
+  def test_protocol(self):
+    self.assertEqual(self.process.stdout.readline(), '\0VERSION 9.8.7\n')
+    rundir = os.path.realpath(self.dirname)
+    self.assertEqual(self.request([rundir, 'a.py', 'b.py']),
+                     ['%s:1:0: C0111: a.py b.py\n' % rundir, 'partial\n', '\0DONE 0\n'])
+    self.assertEqual(self.request([rundir, 'fail']),
+                     ['%s:1:0: C0111: fail\n' % rundir, 'partial\n', '\0DONE 4\n'])
+
+  def test_bad_requests(self):
+    self.process.stdout.readline()
+    self.process.stdin.write('HELLO\n')
+    self.process.stdin.flush()
+    self.assertEqual(self.process.stdout.readline(), '\0DONE 1\n')
+    output = self.request([os.path.join(self.dirname, 'missing'), 'a.py'])
+    self.assertEqual(output[-1], '\0DONE 1\n')
+    self.assert_([line for line in output if 'OSError' in line])
+
+
+class ReadRequestTests(unittest.TestCase):
+
+  def test_read_request(self):
+    stdin = StringIO('RUN 2\n/src\r\n--rcfile=x\nRUN\n')
+    self.assertEqual(pylintworker._read_request(stdin), ['/src', '--rcfile=x'])
+    self.assertEqual(pylintworker._read_request(stdin), [])
+    self.assertEqual(pylintworker._read_request(stdin), None)
+
+
+class LineWriterTests(unittest.TestCase):
+
+  def test_complete_lines(self):
+    out = StringIO()
+    writer = pylintworker._CLineWriter(out)
+    writer.write('a')
+    self.assertEqual(out.getvalue(), '')
+    writer.write('b\nc\nd')
+    self.assertEqual(out.getvalue(), 'ab\nc\n')
+    writer.flush()
+    self.assertEqual(out.getvalue(), 'ab\nc\nd\n')
+    writer.flush()
+    self.assertEqual(out.getvalue(), 'ab\nc\nd\n')
+
+
+class _CModule:
+  def __init__(self, filename):
+    self.file = filename
+
+class _CManager:
+  def __init__(self):
+    self.astroid_cache = {}
+
+class CacheValidatorTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.manager = _CManager()
+    self.validator = pylintworker._CCacheValidator(self.manager)
+
+  def tearDown(self):
+    shutil.rmtree(self.dirname)
+
+  def write(self, name, txt, mtime):
+    filename = os.path.join(self.dirname, name)
+    f = open(filename, 'w')
+    f.write(txt)
+    f.close()
+    os.utime(filename, (mtime, mtime))
+    return filename
+
+  def test_unchanged_modules_kept(self):
+    now = time.time()
+    a = self.write('a.py', 'x = 1\n', now - 10)
+    cache = self.manager.astroid_cache
+    cache['a'] = _CModule(a)
+    cache['sys'] = _CModule(None)
+    self.validator.Record(now)
+    self.assertEqual(self.validator.Validate(), 0)
+    self.assertEqual(sorted(cache), ['a', 'sys'])
+
+  def test_changed_modules_dropped(self):
+    now = time.time()
+    a = self.write('a.py', 'x = 1\n', now - 10)
+    b = self.write('b.py', 'x = 1\n', now - 10)
+    cache = self.manager.astroid_cache
+    cache['a'] = _CModule(a)
+    cache['b'] = _CModule(b)
+    self.validator.Record(now)
+    # Same modification time but a different size, as after a save in
+    # the same second on file systems with one second resolution
+    self.write('a.py', 'x = 10\n', now - 10)
+    self.write('b.py', 'x = 2\n', now - 5)
+    self.assertEqual(self.validator.Validate(), 2)
+    self.assertEqual(cache, {})
+
+  def test_modules_changed_near_run_start_not_recorded(self):
+    now = time.time()
+    a = self.write('a.py', 'x = 1\n', int(now))
+    b = self.write('b.py', 'x = 1\n', now + 5)
+    cache = self.manager.astroid_cache
+    cache['a'] = _CModule(a)
+    cache['b'] = _CModule(b)
+    self.validator.Record(now)
+    self.assertEqual(cache, {})
+    self.assertEqual(self.validator.Validate(), 0)
+
+  def test_unrecorded_modules_dropped(self):
+    a = self.write('a.py', 'x = 1\n', time.time() - 10)
+    self.manager.astroid_cache['a'] = _CModule(a)
+    self.assertEqual(self.validator.Validate(), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
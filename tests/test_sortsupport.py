@@ -0,0 +1,104 @@
+import unittest
+
+import support
+import sortsupport
+
+
+class MakeKeyTests(unittest.TestCase):
+
+  def test_plain(self):
+    self.assertEqual(sortsupport.make_key(), None)
+    self.assertEqual(sortsupport.make_key('plain', column=2)('abcd'), 'cd')
+
+  def test_unknown_mode(self):
+    self.assertRaises(ValueError, sortsupport.make_key, 'numeric')
+
+  def test_field(self):
+    key = sortsupport.make_key(field=2)
+    self.assertEqual(key('a  b c'), 'b')
+    self.assertEqual(key('a'), '')
+    key = sortsupport.make_key(field=2, separator=',', column=1)
+    self.assertEqual(key('a,xyz,c'), 'yz')
+
+  def test_natural(self):
+    key = sortsupport.make_key('natural')
+    self.assert_(key('a2') < key('a10') < key('a0011'))
+    self.assert_(key('a9999999999') < key('a10000000000'))
+
+  def test_natural_sorts_like_plain_around_numbers(self):
+    # Numbers of any length sort after punctuation and before letters
+    key = sortsupport.make_key('natural')
+    for number in ('1', '1234567890', '9' * 300, '1' * 1200):
+      self.assert_(key('a!') < key('a' + number) < key('aB') < key('ab'))
+
+  def test_natural_long_numbers(self):
+    key = sortsupport.make_key('natural')
+    numbers = ['9' * 998, '1' * 999, '9' * 999, '1' * 1000, '1' * 5000]
+    self.assertEqual(sorted(numbers, key=key), numbers)
+
+  def test_natural_unicode(self):
+    key = sortsupport.make_key('natural')
+    self.assert_(key(u'\xe9' + u'9' * 100) < key(u'\xe9' + u'1' * 300))
+
+  def test_nocase(self):
+    key = sortsupport.make_key('nocase')
+    self.assertEqual(key('AbC'), key('aBc'))
+
+
+class SortLinesTests(unittest.TestCase):
+
+  def test_sort(self):
+    self.assertEqual(sortsupport.sort_lines(['b', 'a', 'c']), ['a', 'b', 'c'])
+
+  def test_natural(self):
+    key = sortsupport.make_key('natural')
+    self.assertEqual(sortsupport.sort_lines(['x10', 'x9', 'x1'], key),
+                     ['x1', 'x9', 'x10'])
+
+  def test_stable_reverse(self):
+    key = sortsupport.make_key('nocase')
+    lines = ['b', 'A', 'a', 'B']
+    self.assertEqual(sortsupport.sort_lines(lines, key), ['A', 'a', 'b', 'B'])
+    self.assertEqual(sortsupport.sort_lines(lines, key, reverse=True),
+                     ['b', 'B', 'A', 'a'])
+
+  def test_unique(self):
+    self.assertEqual(sortsupport.sort_lines(['b', 'a', 'b'], unique=True), ['a', 'b'])
+    key = sortsupport.make_key('nocase')
+    self.assertEqual(sortsupport.sort_lines(['b', 'A', 'a'], key, unique=True),
+                     ['A', 'b'])
+
+
+class ExternalSortTests(unittest.TestCase):
+  """Sorting more than kExternalSortLines lines through temporary files"""
+
+  def setUp(self):
+    self.saved_lines = sortsupport.kExternalSortLines
+    sortsupport.kExternalSortLines = 3
+
+  def tearDown(self):
+    sortsupport.kExternalSortLines = self.saved_lines
+
+  def test_plain(self):
+    lines = ['d', 'b', 'f', 'a', 'e', 'c', 'b']
+    self.assertEqual(sortsupport.sort_lines(lines), sorted(lines))
+    self.assertEqual(sortsupport.sort_lines(lines, unique=True),
+                     ['a', 'b', 'c', 'd', 'e', 'f'])
+
+  def test_key_reverse(self):
+    key = sortsupport.make_key('natural')
+    lines = ['x%i' % i for i in (5, 12, 1, 40, 3, 12, 7)]
+    self.assertEqual(sortsupport.sort_lines(lines, key, reverse=True),
+                     ['x40', 'x12', 'x12', 'x7', 'x5', 'x3', 'x1'])
+    self.assertEqual(sortsupport.sort_lines(lines, key, unique=True),
+                     ['x1', 'x3', 'x5', 'x7', 'x12', 'x40'])
+
+  def test_unicode(self):
+    lines = [u'\xe9', u'a', u'\xe8', u'z', u'b']
+    result = sortsupport.sort_lines(lines)
+    self.assertEqual(result, sorted(lines))
+    self.assert_(isinstance(result[0], unicode))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,292 @@
+import os
+import time
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import support
+import templatesupport
+
+
+class CompileTemplateTests(unittest.TestCase):
+
+  def test_no_arguments(self):
+    template = templatesupport.compile_template('plain 100%% text')
+    self.assertEqual(template.GetSlots(), [])
+    self.assertEqual(template.Expand([]), ('plain 100% text', []))
+
+  def test_slots(self):
+    template = templatesupport.compile_template(
+      'def %(name)s(%(args|string(20)|self)s):\n  %(!body|filename)s\n')
+    self.assertEqual(template.GetSlots(), [
+      ('name', 'string', 80, None, {}),
+      ('args', 'string', 20, 'self', {}),
+      ('body', 'filename', None, None, {'always-show': 1}),
+    ])
+    self.assertEqual(template.GetPositions(), [4, 5, 10])
+
+  def test_date(self):
+    template = templatesupport.compile_template('%(d|date)s %(t|datetime)s')
+    self.assertEqual([slot[3] for slot in template.GetSlots()],
+                     ['$(__DATE_NOW__)', '$(__DATE_TIME_NOW__)'])
+
+  def test_escapes(self):
+    template = templatesupport.compile_template('%%(x)s %(y)s %%d')
+    self.assertEqual([slot[0] for slot in template.GetSlots()], ['y'])
+    self.assertEqual(template.Expand(['1'])[0], '%(x)s 1 %d')
+
+  def test_invalid_type(self):
+    self.assertRaises(NotImplementedError, templatesupport.compile_template,
+                      '%(x|number)s')
+
+  def test_expand(self):
+    template = templatesupport.compile_template('class %(name)s(%(base)s):\n')
+    txt, tab_sequence = template.Expand(['Foo', None])
+    self.assertEqual(txt, 'class Foo():\n')
+    self.assertEqual(tab_sequence, [(9, 6), (10, 10)])
+
+  def test_wrap(self):
+    template = templatesupport.compile_template('# %(@descr)s\n# %(@more)s\n')
+    self.assert_(template.HasWrappedArgs())
+    calls = []
+    def wrap(value, width, prefix):
+      calls.append((value, width, prefix))
+      return value.upper()
+    txt, tab_sequence = template.Expand(['a', 'b'], 20, wrap)
+    self.assertEqual(txt, '# A\n# B\n')
+    self.assertEqual(calls, [('a', 18, '# '), ('b', 18, '# ')])
+
+  def test_pickle(self):
+    template = templatesupport.compile_template('x = %(@value|string(5)|1)s\n')
+    copy = pickle.loads(pickle.dumps(template, 2))
+    self.assertEqual(copy.GetSlots(), template.GetSlots())
+    self.assertEqual(copy.Expand(['2']), template.Expand(['2']))
+    self.assert_(copy.HasWrappedArgs())
+
+
+class SnippetDescriptionTests(unittest.TestCase):
+
+  def test_description(self):
+    self.assertEqual(templatesupport.snippet_description(
+      '# ----\n|!|for %(!item)s in %(@seq|string|x)s: # 100%%\n'),
+      'for item in seq: # 100%')
+    self.assertEqual(templatesupport.snippet_description('|2|  return %(value)s'),
+                     'return value')
+    self.assertEqual(templatesupport.snippet_description('x' * 100), 'x' * 60)
+    self.assertEqual(templatesupport.snippet_description('\n----\n'), '')
+
+
+class SnippetIndexTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.root = os.path.join(self.dirname, 'snippets')
+    self.user = os.path.join(self.dirname, 'user')
+    self.indexfile = os.path.join(self.dirname, 'index')
+    self.write(self.root, 'py', 'for.snippet', 'for %(x)s in y:')
+    self.write(self.root, 'py', 'def.snippet', 'def %(name)s():')
+    self.write(self.root, 'py/class.ctx', 'def.snippet', 'def %(name)s(self):')
+    self.write(self.root, 'py/class.ctx', 'init.snippet', 'def __init__(self):')
+    self.write(self.root, 'html', 'div.snippet', '<div>')
+    self.write(self.user, 'py', 'for.snippet', 'for my loop')
+    self.reads = []
+    self.saved_description = templatesupport.snippet_description
+    def description(txt):
+      self.reads.append(txt)
+      return self.saved_description(txt)
+    templatesupport.snippet_description = description
+
+  def tearDown(self):
+    templatesupport.snippet_description = self.saved_description
+    shutil.rmtree(self.dirname)
+
+  def write(self, root, subdir, name, txt):
+    dirname = os.path.join(root, subdir)
+    if not os.path.isdir(dirname):
+      os.makedirs(dirname)
+    filename = os.path.join(dirname, name)
+    f = open(filename, 'w')
+    f.write(txt)
+    f.close()
+    return filename
+
+  def touch(self, root, subdir):
+    # Directory times may not change within the same second
+    dirname = os.path.join(root, subdir)
+    mtime = time.time() + 10
+    os.utime(dirname, (mtime, mtime))
+
+  def index(self):
+    return templatesupport.CSnippetIndex([self.root, self.user], self.indexfile)
+
+  def test_find(self):
+    index = self.index()
+    join = os.path.join
+    self.assertEqual(index.Find('text/x-python'), [
+      ('def', join(self.root, 'py', 'def.snippet'), 'def name():'),
+      ('for', join(self.user, 'py', 'for.snippet'), 'for my loop'),
+    ])
+    self.assertEqual([r[0] for r in index.Find('text/x-python', 'class')],
+                     ['def', 'for', 'init'])
+    self.assertEqual(index.Find('text/x-python', 'class', 'd')[0][2], 'def name(self):')
+    self.assertEqual(index.Find('text/x-python', prefix='x'), [])
+    self.assertEqual(index.Find('text/html', 'class', 'd')[0][0], 'div')
+    self.assertEqual(index.Find('text/plain'), [])
+    self.assertEqual(index.GetContexts('text/x-python'), ['class'])
+
+  def test_lookup(self):
+    index = self.index()
+    join = os.path.join
+    self.assertEqual(index.Lookup('text/x-python', 'def'),
+                     join(self.root, 'py', 'def.snippet'))
+    self.assertEqual(index.Lookup('text/x-python', 'def', 'class'),
+                     join(self.root, 'py', 'class.ctx', 'def.snippet'))
+    self.assertEqual(index.Lookup('text/x-python', 'init'),
+                     join(self.root, 'py', 'class.ctx', 'init.snippet'))
+    self.assertEqual(index.Lookup('text/x-python', 'in'), None)
+
+  def test_saved_index(self):
+    self.assert_(self.index().Update())
+    self.assertEqual(len(self.reads), 6)
+    del self.reads[:]
+    index = self.index()
+    self.failIf(index.Update())
+    self.assertEqual(len(index.Find('text/x-python')), 2)
+    self.assertEqual(self.reads, [])
+
+  def test_changed_snippets(self):
+    index = self.index()
+    index.Update()
+    del self.reads[:]
+    self.write(self.root, 'py', 'while.snippet', 'while %(cond)s:')
+    self.touch(self.root, 'py')
+    self.assert_(index.Update())
+    self.assertEqual(self.reads, ['while %(cond)s:'])
+    self.assertEqual([r[0] for r in index.Find('text/x-python')], ['def', 'for', 'while'])
+
+    # Changing a snippet's contents doesn't change its directory
+    filename = self.write(self.root, 'py', 'def.snippet', 'def %(name)s(x):')
+    index.Invalidate(filename)
+    self.assert_(index.Update())
+    self.assertEqual(index.Find('text/x-python', prefix='d')[0][2], 'def name(x):')
+
+  def test_removed_tree(self):
+    index = self.index()
+    index.Update()
+    shutil.rmtree(self.user)
+    self.assert_(index.Update())
+    self.assertEqual(index.Find('text/x-python', prefix='f')[0][2], 'for x in y:')
+
+
+class UsageStatsTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dirname, 'usage')
+
+  def tearDown(self):
+    shutil.rmtree(self.dirname)
+
+  def test_scores(self):
+    usage = templatesupport.CUsageStats(self.filename, half_life=100)
+    self.assertEqual(usage.GetScore('a', 1000), 0.0)
+    usage.Record('a', 1000)
+    usage.Record('a', 1000)
+    self.assertEqual(usage.GetScore('a', 1000), 2.0)
+    self.assertEqual(usage.GetScore('a', 1100), 1.0)
+    usage.Record('a', 1100)
+    self.assertEqual(usage.GetScore('a', 1100), 2.0)
+    self.assertEqual(usage.GetGeneration(), 3)
+
+  def test_save(self):
+    usage = templatesupport.CUsageStats(self.filename)
+    usage.Record('a', 1000)
+    self.failIf(os.path.exists(self.filename))
+    usage.Save()
+    self.assertEqual(templatesupport.CUsageStats(self.filename).GetScore('a', 1000), 1.0)
+    os.remove(self.filename)
+    usage.Save()
+    self.failIf(os.path.exists(self.filename))
+
+
+class _CUsage:
+  def __init__(self, scores=None):
+    self.fScores = scores or {}
+    self.fRecorded = []
+  def GetScore(self, key, now=None):
+    return self.fScores.get(key, 0.0)
+  def GetGeneration(self):
+    return len(self.fRecorded)
+  def Record(self, key):
+    self.fRecorded.append(key)
+    self.fScores[key] = self.fScores.get(key, 0.0) + 1.0
+
+kItems = [
+  ('python-def', ('pd',), 'Function definition'),
+  ('python-class', (), 'Class definition'),
+  ('python-for', (), 'Loop over a sequence'),
+  ('html-div', (), 'Division'),
+  ('def', (), 'Bare def'),
+]
+
+class CompleterTests(unittest.TestCase):
+
+  def setUp(self):
+    self.usage = _CUsage()
+    self.completer = templatesupport.CCompleter(self.usage, 'template:')
+    self.completer.SetItems(kItems)
+
+  def test_empty_query(self):
+    self.usage.fScores['template:html-div'] = 1.0
+    self.assertEqual(self.completer.Complete(),
+                     ['html-div', 'def', 'python-class', 'python-def', 'python-for'])
+    self.assertEqual(self.completer.Complete(limit=2), ['html-div', 'def'])
+
+  def test_ranking(self):
+    # Exact name, name prefix, then a word in a name, then a description
+    self.assertEqual(self.completer.Complete('def', fuzzy=False),
+                     ['def', 'python-def', 'python-class'])
+    self.assertEqual(self.completer.Complete('pd'), ['python-def'])
+    self.assertEqual(self.completer.Complete('pyt'),
+                     ['python-class', 'python-def', 'python-for'])
+    self.assertEqual(self.completer.Complete('loop'), ['python-for'])
+
+  def test_fuzzy(self):
+    self.assertEqual(self.completer.Complete('pycl'), ['python-class'])
+    self.assertEqual(self.completer.Complete('pcls'), ['python-class'])
+    self.assertEqual(self.completer.Complete('pcls', fuzzy=False), [])
+    self.assertEqual(self.completer.Complete('hdv'), ['html-div'])
+
+  def test_usage_ranking(self):
+    self.completer.Record('python-for')
+    self.assertEqual(self.usage.fRecorded, ['template:python-for'])
+    self.assertEqual(self.completer.Complete('pyt')[0], 'python-for')
+    self.assertEqual(self.completer.Complete()[0], 'python-for')
+
+  def test_resolve(self):
+    resolve = self.completer.Resolve
+    self.assertEqual(resolve('def'), 'def')
+    self.assertEqual(resolve('Python-Def'), 'python-def')
+    self.assertEqual(resolve('pd'), 'python-def')
+    self.assertEqual(resolve('python-c'), 'python-class')
+    self.assertEqual(resolve('h'), 'html-div')
+
+  def test_resolve_rejects_guesses(self):
+    resolve = self.completer.Resolve
+    # Ambiguous prefixes, words, descriptions and fuzzy matches
+    self.assertEqual(resolve('python'), None)
+    self.assertEqual(resolve('div'), None)
+    self.assertEqual(resolve('loop'), None)
+    self.assertEqual(resolve('pcls'), None)
+    self.assertEqual(resolve('python-deff'), None)
+    self.assertEqual(resolve(''), None)
+
+  def test_set_items(self):
+    self.completer.SetItems([('x-ray', (), '')])
+    self.assertEqual(self.completer.Complete('x'), ['x-ray'])
+    self.assertEqual(self.completer.Resolve('pd'), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,462 @@
+import os
+import imp
+import sys
+import marshal
+import pstats
+import time
+import types
+import pickle
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import traceback
+import unittest
+
+import support
+
+# Loaded with debugging disabled, so the tests start it themselves
+kStubFile = os.path.join(os.path.dirname(support.kScriptDir), 'wingdbstub.py')
+os.environ['WINGDB_DISABLED'] = '1'
+try:
+  wingdbstub = imp.load_source('wingdbstub', kStubFile)
+finally:
+  del os.environ['WINGDB_DISABLED']
+
+
+class _CDebugger:
+  """Stands for wingdb's network server.  Connecting opens a socket to the
+  IDE's host and port, and takes a while so that overlapping attempts can
+  be seen."""
+
+  kConnectTime = 0.1
+
+  def __init__(self, host, port, attachport, err, **kwargs):
+    self.fHostPort = (host, port)
+    self.fSocket = None
+    self.fActive = 0
+    self.fConnecting = 0
+    self.fMaxConnecting = 0
+    self.fConnectCount = 0
+    self.fLock = threading.Lock()
+
+  def StartDebug(self, stophere=0, connect=1):
+    self.fActive = 1
+    if connect:
+      self.ConnectToClient()
+
+  def StopDebug(self):
+    self.fActive = 0
+
+  def DebugActive(self):
+    return self.fActive
+
+  def ChannelClosed(self):
+    return self.fSocket is None
+
+  def ConnectToClient(self):
+    self.fLock.acquire()
+    self.fConnecting += 1
+    self.fConnectCount += 1
+    self.fMaxConnecting = max(self.fMaxConnecting, self.fConnecting)
+    self.fLock.release()
+    try:
+      time.sleep(self.kConnectTime)
+      try:
+        self.fSocket = socket.create_connection(self.fHostPort, 1.0)
+      except socket.error:
+        pass
+    finally:
+      self.fLock.acquire()
+      self.fConnecting -= 1
+      self.fLock.release()
+
+def _fake_wingdb():
+  netserver = types.ModuleType('netserver')
+  netserver.CNetworkServer = _CDebugger
+  wingdb = types.ModuleType('wingdb')
+  wingdb.FindNetServerModule = lambda winghome, user_settings: netserver
+  wingdb.CreateErrStream = lambda netserver, logfile, very_verbose: None
+  return wingdb
+
+def _free_port():
+  s = socket.socket()
+  s.bind(('127.0.0.1', 0))
+  port = s.getsockname()[1]
+  s.close()
+  return port
+
+def _wait_for(func, timeout=10.0):
+  end = time.time() + timeout
+  while not func():
+    if time.time() > end:
+      return False
+    time.sleep(0.02)
+  return True
+
+
+class StubTestCase(unittest.TestCase):
+  """Runs the stub with a fake wingdb and restores the environment and the
+  stub's state afterwards"""
+
+  def setUp(self):
+    self.saved_environ = dict(os.environ)
+    self.saved_fork = getattr(os, 'fork', None)
+    self.saved_stub = dict(wingdbstub.__dict__)
+    wingdbstub._ImportWingdb = lambda winghome, user_settings=None: _fake_wingdb()
+    self.port = _free_port()
+    os.environ['WINGDB_HOSTPORT'] = '127.0.0.1:%i' % self.port
+    self.server = None
+
+  def tearDown(self):
+    debugger = wingdbstub.debugger
+    if debugger is not None:
+      debugger.StopDebug()
+      if debugger.fSocket is not None:
+        debugger.fSocket.close()
+    if self.server is not None:
+      self.server.close()
+    os.environ.clear()
+    os.environ.update(self.saved_environ)
+    if self.saved_fork is not None:
+      os.fork = self.saved_fork
+    wingdbstub.__dict__.clear()
+    wingdbstub.__dict__.update(self.saved_stub)
+
+  def listen(self):
+    self.server = socket.socket()
+    self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.server.bind(('127.0.0.1', self.port))
+    self.server.listen(5)
+
+
+class BackgroundConnectTests(StubTestCase):
+
+  def setUp(self):
+    StubTestCase.setUp(self)
+    os.environ['WINGDB_BACKGROUNDCONNECT'] = '1'
+
+  def test_connect_after_backoff(self):
+    start = time.time()
+    wingdbstub._StartDebugging()
+    # The program continues without waiting for the IDE
+    self.assert_(time.time() - start < _CDebugger.kConnectTime)
+    debugger = wingdbstub.debugger
+    self.assert_(debugger.DebugActive())
+    self.assert_(debugger.ChannelClosed())
+
+    self.assert_(_wait_for(lambda: debugger.fConnectCount >= 2))
+    self.assert_(debugger.ChannelClosed())
+    self.listen()
+    self.assert_(_wait_for(lambda: not debugger.ChannelClosed()))
+    self.server.accept()[0].close()
+
+  def test_ensure_waits_for_background_connect(self):
+    self.listen()
+    wingdbstub._StartDebugging()
+    debugger = wingdbstub.debugger
+    # The background thread is connecting, so this waits for it and
+    # doesn't connect again
+    wingdbstub.Ensure()
+    self.failIf(debugger.ChannelClosed())
+    self.assertEqual(debugger.fMaxConnecting, 1)
+    self.assertEqual(debugger.fConnectCount, 1)
+
+  def test_ensure_while_retrying(self):
+    wingdbstub._StartDebugging()
+    debugger = wingdbstub.debugger
+    for i in range(3):
+      self.assertRaises(ValueError, wingdbstub.Ensure)
+    self.assertEqual(debugger.fMaxConnecting, 1)
+    self.listen()
+    wingdbstub.Ensure()
+    self.failIf(debugger.ChannelClosed())
+    self.assertEqual(debugger.fMaxConnecting, 1)
+
+  def test_stop_retrying(self):
+    wingdbstub._StartDebugging()
+    debugger = wingdbstub.debugger
+    debugger.StopDebug()
+    self.assert_(_wait_for(lambda: not [t for t in threading.enumerate()
+                                        if t.getName() == 'wingdbstub-connect']))
+    self.assert_(debugger.ChannelClosed())
+
+
+class ForegroundConnectTests(StubTestCase):
+
+  def test_connect(self):
+    self.listen()
+    wingdbstub._StartDebugging()
+    self.failIf(wingdbstub.debugger.ChannelClosed())
+    self.assertEqual(wingdbstub._gConnectLock, None)
+
+  def test_not_connected(self):
+    wingdbstub._StartDebugging()
+    self.assertRaises(ValueError, wingdbstub.Ensure)
+    wingdbstub.Ensure(require_connection=0)
+
+
+
+class BootstrapTests(StubTestCase):
+
+  def setUp(self):
+    StubTestCase.setUp(self)
+    self.dirname = tempfile.mkdtemp()
+    self.bootdir = os.path.join(self.dirname, 'boot')
+    os.environ['WINGDB_BOOTSTRAPDIR'] = self.bootdir
+    os.environ.pop('WINGDB_STUBDIR', None)
+    os.environ['PYTHONPATH'] = '/lib'
+
+  def tearDown(self):
+    StubTestCase.tearDown(self)
+    shutil.rmtree(self.dirname)
+
+  def test_install(self):
+    wingdbstub._InstallBootstrap()
+    f = open(os.path.join(self.bootdir, 'sitecustomize.py'))
+    self.assertEqual(f.read(), wingdbstub._kBootstrapCode)
+    f.close()
+    self.assertEqual(os.environ['WINGDB_STUBDIR'], os.path.dirname(kStubFile))
+    self.assertEqual(os.environ['PYTHONPATH'], self.bootdir + os.pathsep + '/lib')
+    wingdbstub._InstallBootstrap()
+    self.assertEqual(os.environ['PYTHONPATH'], self.bootdir + os.pathsep + '/lib')
+
+  def test_already_installed(self):
+    # A child started by a debugged parent doesn't check the file again
+    os.environ['WINGDB_STUBDIR'] = os.path.dirname(kStubFile)
+    os.environ['PYTHONPATH'] = '/lib' + os.pathsep + self.bootdir
+    wingdbstub._InstallBootstrap()
+    self.failIf(os.path.exists(self.bootdir))
+
+
+def _on_signal(signum, frame):
+  _on_signal.calls.append(signum)
+_on_signal.calls = []
+
+class ForkedChildTests(StubTestCase):
+  """Forks a debugged process and checks that debugging starts in the
+  child only when asked to"""
+
+  def setUp(self):
+    StubTestCase.setUp(self)
+    self.dirname = tempfile.mkdtemp()
+    os.environ['WINGDB_BOOTSTRAPDIR'] = self.dirname
+    os.environ['WINGDB_ATTACHSIGNAL'] = 'SIGUSR1'
+    self.saved_handler = signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    self.listen()
+    wingdbstub._StartDebugging()
+    self.parent = wingdbstub.debugger
+    self.failIf(self.parent.ChannelClosed())
+    wingdbstub._InstallChildHooks()
+
+  def tearDown(self):
+    signal.signal(signal.SIGUSR1, self.saved_handler)
+    StubTestCase.tearDown(self)
+    shutil.rmtree(self.dirname)
+
+  def fork(self, func):
+    """Call func in a forked child.  Returns the child's exit status and
+    what func returned, or None if the child didn't finish."""
+
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      try:
+        os.close(r)
+        try:
+          result = func()
+        except BaseException:
+          result = traceback.format_exc()
+        os.write(w, pickle.dumps(result))
+      finally:
+        os._exit(0)
+    os.close(w)
+    data = []
+    while True:
+      chunk = os.read(r, 4096)
+      if not chunk:
+        break
+      data.append(chunk)
+    os.close(r)
+    status = os.waitpid(pid, 0)[1]
+    self.assert_(wingdbstub.debugger is self.parent)
+    if not data:
+      return status, None
+    return status, pickle.loads(''.join(data))
+
+  def child_state(self):
+    debugger = wingdbstub.debugger
+    return {
+      'pending': wingdbstub._gPendingChild,
+      'debugging': debugger is not None and debugger is not self.parent,
+      'connected': debugger is not None and not debugger.ChannelClosed(),
+      'inherited': self.parent in wingdbstub._gInheritedDebuggers,
+      'handler': signal.getsignal(signal.SIGUSR1),
+      'active': os.environ.get('WINGDB_ACTIVE') == str(os.getpid()),
+    }
+
+  def test_ensure(self):
+    def child():
+      before = self.child_state()
+      wingdbstub.Ensure()
+      return before, self.child_state()
+    status, result = self.fork(child)
+    self.assertEqual(status, 0)
+    before, after = result
+    self.assertEqual(before, {'pending': 1, 'debugging': False, 'connected': False,
+                              'inherited': True, 'handler': wingdbstub._OnAttachSignal,
+                              'active': False})
+    self.assertEqual(after, {'pending': 0, 'debugging': True, 'connected': True,
+                             'inherited': True, 'handler': signal.SIG_DFL,
+                             'active': True})
+
+  def test_attach_signal(self):
+    def child():
+      os.kill(os.getpid(), signal.SIGUSR1)
+      _wait_for(lambda: not wingdbstub._gPendingChild, 1.0)
+      return self.child_state()
+    status, state = self.fork(child)
+    self.assertEqual(status, 0)
+    self.assertEqual((state['pending'], state['debugging'], state['handler']),
+                     (0, True, signal.SIG_DFL))
+
+  def test_previous_handler_called(self):
+    signal.signal(signal.SIGUSR1, _on_signal)
+    def child():
+      os.kill(os.getpid(), signal.SIGUSR1)
+      _wait_for(lambda: _on_signal.calls, 1.0)
+      return _on_signal.calls, self.child_state()
+    status, result = self.fork(child)
+    calls, state = result
+    self.assertEqual(calls, [signal.SIGUSR1])
+    self.assertEqual((state['debugging'], state['handler']), (True, _on_signal))
+
+  def test_default_action_after_ensure_on_thread(self):
+    def child():
+      # The handler can only be put back from the main thread
+      thread = threading.Thread(target=wingdbstub.Ensure)
+      thread.start()
+      thread.join()
+      if signal.getsignal(signal.SIGUSR1) != wingdbstub._OnAttachSignal:
+        return 'handler put back'
+      os.kill(os.getpid(), signal.SIGUSR1)
+      time.sleep(1.0)
+      return 'not terminated'
+    status, result = self.fork(child)
+    self.assertEqual(result, None)
+    self.assert_(os.WIFSIGNALED(status))
+    self.assertEqual(os.WTERMSIG(status), signal.SIGUSR1)
+
+
+
+def _outer():
+  pass
+
+def _inner():
+  pass
+
+def _busy(seconds):
+  end = time.time() + seconds
+  while time.time() < end:
+    pass
+
+def _func(code):
+  return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _rounded(stats):
+  """Round the times in stats so they can be compared"""
+
+  result = {}
+  for func, (cc, nc, tt, ct, callers) in stats.items():
+    result[func] = (cc, nc, round(tt, 6), round(ct, 6),
+                    dict([(caller, (c[0], c[1], round(c[2], 6), round(c[3], 6)))
+                          for caller, c in callers.items()]))
+  return result
+
+class SamplingProfilerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.dirname = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirname)
+
+  def profiler(self, format, counts=None):
+    filename = os.path.join(self.dirname, 'profile.%s' % format)
+    profiler = wingdbstub.CSamplingProfiler(filename, format, 0.01, 0)
+    if counts is not None:
+      profiler.fCounts.update(counts)
+    return profiler
+
+  def test_stats(self):
+    outer = _outer.__code__
+    inner = _inner.__code__
+    module = compile('pass', 'mod.py', 'exec')
+    profiler = self.profiler('pstats')
+    stats = profiler._CSamplingProfiler__GetStats({
+      (inner, outer, module): 3,
+      (outer, module): 1,
+    })
+    self.assertEqual(_rounded(stats), {
+      _func(module): (4, 4, 0.0, 0.04, {}),
+      _func(outer): (4, 4, 0.01, 0.04, {_func(module): (4, 4, 0.01, 0.04)}),
+      _func(inner): (3, 3, 0.03, 0.03, {_func(outer): (3, 3, 0.03, 0.03)}),
+    })
+
+  def test_recursive_stats(self):
+    outer = _outer.__code__
+    profiler = self.profiler('pstats')
+    stats = profiler._CSamplingProfiler__GetStats({(outer, outer, outer): 2})
+    # Each sample counts once as a call, but each recursive call is a caller
+    self.assertEqual(_rounded(stats), {
+      _func(outer): (2, 2, 0.02, 0.02, {_func(outer): (4, 4, 0.02, 0.04)}),
+    })
+
+  def test_dump_collapsed(self):
+    outer = _outer.__code__
+    inner = _inner.__code__
+    module = compile('pass', 'a;b.py', 'exec')
+    profiler = self.profiler('collapsed', {(inner, outer, module): 3, (module,): 1})
+    profiler.Dump()
+    f = open(profiler.fFilename)
+    lines = sorted(f.read().splitlines())
+    f.close()
+    names = ['<module> (a,b.py:1)',
+             '_outer (%s:%i)' % (outer.co_filename, outer.co_firstlineno),
+             '_inner (%s:%i)' % (inner.co_filename, inner.co_firstlineno)]
+    self.assertEqual(lines, ['%s 1' % names[0], '%s 3' % ';'.join(names)])
+    self.assertEqual(os.listdir(self.dirname), ['profile.collapsed'])
+
+  def test_dump_pstats(self):
+    outer = _outer.__code__
+    inner = _inner.__code__
+    profiler = self.profiler('pstats', {(inner, outer): 5})
+    profiler.Dump()
+    f = open(profiler.fFilename, 'rb')
+    self.assertEqual(marshal.load(f), profiler._CSamplingProfiler__GetStats(profiler.fCounts))
+    f.close()
+    stats = pstats.Stats(profiler.fFilename)
+    self.assertEqual(stats.total_calls, 10)
+
+  def test_dump_error(self):
+    filename = os.path.join(self.dirname, 'missing', 'profile')
+    profiler = wingdbstub.CSamplingProfiler(filename, 'collapsed', 0.01, 0)
+    profiler.Dump()
+    self.assertEqual(os.listdir(self.dirname), [])
+
+  def test_sampling(self):
+    profiler = self.profiler('collapsed')
+    profiler.Start()
+    _busy(0.3)
+    profiler.Stop()
+    f = open(profiler.fFilename)
+    txt = f.read()
+    f.close()
+    self.assert_('_busy (' in txt)
+    # The sampling thread leaves itself out
+    self.failIf('__Run (' in txt)
+
+
+if __name__ == '__main__':
+  unittest.main()
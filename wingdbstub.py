@@ -44,8 +44,18 @@ the Wing IDE installation directory.
 
 import sys
 import os
-import imp
 
+# Checked before doing anything else, so importing this module costs next
+# to nothing when debugging is disabled or already active.  With
+# multi-process debugging, WINGDB_ACTIVE holds the pid of the process that
+# set it, so child processes can tell that they are not debugged yet.
+_kSkipDebug = 'WINGDB_DISABLED' in os.environ or 'WINGDB_ACTIVE' in os.environ
+_kChildProcess = 0
+if (_kSkipDebug and 'WINGDB_DISABLED' not in os.environ and 
+    os.environ.get('WINGDB_MULTIPROCESS', '0') not in ('', '0') and
+    os.environ['WINGDB_ACTIVE'] != str(os.getpid())):
+  _kSkipDebug = 0
+  _kChildProcess = 1
 
 #------------------------------------------------------------------------
 # Default configuration values:  Note that the named environment 
@@ -78,6 +88,54 @@ kAttachPort = '50015'
 # (WINGDB_LOGFILE environment variable)
 kLogFile = None
 
+# Set this to 1 to connect to the IDE from a background thread, so that
+# the program continues at once even if the IDE is not listening.  The
+# debugger listens for attach requests on the attach port right away, and
+# the connection is retried with increasing delays, at most kConnectRetryMax
+# seconds apart, until it succeeds.  Breakpoints become active as soon as
+# the IDE is connected.
+# (WINGDB_BACKGROUNDCONNECT environment variable)
+kBackgroundConnect = 0
+kConnectRetryMax = 60.0
+
+# Set this to 1 to also debug child processes started with os.fork(),
+# multiprocessing, or as Python subprocesses.  To avoid slowing down
+# processes that aren't being debugged, children don't start debugging
+# until they are sent kAttachSignal (e.g. "kill -USR1 <pid>") or call
+# wingdbstub.Ensure().  Each child then connects to the IDE on its own
+# and, if logging is enabled, logs to a file named after the process.
+# Python subprocesses are set up through a sitecustomize module written
+# to kBootstrapDir, which is added to PYTHONPATH.  A handler the child
+# already had for kAttachSignal is still called, and is put back once the
+# child starts debugging.  Set kAttachSignal to None to leave the signal
+# alone and start debugging only through wingdbstub.Ensure().
+# (WINGDB_MULTIPROCESS and WINGDB_ATTACHSIGNAL environment variables)
+kMultiProcess = 0
+kAttachSignal = 'SIGUSR1'
+kBootstrapDir = '~/.wingdbstub-boot'
+
+# Set this to 'profile' to run a sampling profiler instead of the debugger.
+# The profiler samples the stacks of all threads every kProfileInterval
+# seconds from a background thread, which costs far less than tracing
+# every line.  The samples are written to kProfileFile every
+# kProfileDumpInterval seconds (0 for never), when kProfileSignal is
+# received, and at exit.  kProfileFormat is 'collapsed' for the collapsed
+# stack format read by flame graph tools, or 'pstats' for a file that can
+# be loaded with pstats.Stats(), with times estimated from the samples.
+# kProfileFile may include %(pid)i and %(format)s.  Processes forked from
+# a profiled process are sampled separately, starting with no samples, and
+# write to a file named with their own pid.  A handler that was already
+# installed for kProfileSignal is still called after the dump is requested.
+# (WINGDB_MODE, WINGDB_PROFILEINTERVAL, WINGDB_PROFILEFILE,
+# WINGDB_PROFILEDUMPINTERVAL, WINGDB_PROFILESIGNAL and WINGDB_PROFILEFORMAT
+# environment variables)
+kMode = 'debug'
+kProfileInterval = 0.01
+kProfileFile = 'wingprofile-%(pid)i.%(format)s'
+kProfileDumpInterval = 60.0
+kProfileSignal = 'SIGUSR2'
+kProfileFormat = 'collapsed'
+
 # Set to get a tremendous amount of logging from the debugger internals
 # (WINGDB_LOGVERYVERBOSE)
 kLogVeryVerbose = 0
@@ -109,6 +167,12 @@ kPWFileName = 'wingdebugpw'
 # for whatever reason
 kExitOnFailure = 0
 
+# File used to remember where the debugger was found, so that later runs
+# can import it without searching the Wing installation and patches.  Set
+# to None or an empty string to always search.
+# (WINGDB_CACHEFILE environment variable)
+kCacheFile = '~/.wingdbstub-cache'
+
 #------------------------------------------------------------------------
 # Find Wing debugger installation location
 
@@ -128,7 +192,7 @@ else:
     return o.has_key(key)
     
 # Check environment:  Must have WINGHOME defined if still == None
-if WINGHOME == None:
+if WINGHOME == None and not _kSkipDebug and not kWingDebugDisabled:
   if has_key(os.environ, 'WINGHOME'):
     WINGHOME=os.environ['WINGHOME']
   else:
@@ -144,8 +208,8 @@ kUserSettingsDir = None
 if kUserSettingsDir is None:
   kUserSettingsDir = os.environ.get('WINGDB_USERSETTINGS')
   
-def _ImportWingdb(winghome, user_settings=None):
-  """ Find & import wingdb module. """
+def _FindWingdbDirs(winghome, user_settings):
+  """ Get the directories to search for wingdb, including any patches. """
   
   try:
     exec_dict = {}
@@ -155,26 +219,612 @@ def _ImportWingdb(winghome, user_settings=None):
   except Exception:
     dir_list = []
   dir_list.extend([os.path.join(WINGHOME, 'bin'), os.path.join(WINGHOME, 'src')])
-  for path in dir_list:
+  return dir_list
+
+def _LoadWingdb(path):
+  """ Import wingdb from the given directory or raise ImportError. """
+  
+  import imp
+  f, p, d = imp.find_module('wingdb', [path])
+  try:
+    return imp.load_module('wingdb', f, p, d)
+  finally:
+    if f is not None:
+      f.close()
+
+def _GetCacheKey(winghome, user_settings):
+  """ Get the key for the wingdb location in the cache file.  Installing
+  patches changes the patches directory and so the key. """
+  
+  patch_mtime = ''
+  if user_settings:
+    try:
+      patch_mtime = str(os.stat(os.path.join(user_settings, 'patches')).st_mtime)
+    except OSError:
+      pass
+  return '%x\t%s\t%s\t%s' % (sys.hexversion, winghome, user_settings or '', 
+                              patch_mtime)
+
+def _ReadCache(cache_file):
+  """ Read the cache file as a dict from key to wingdb directory. """
+  
+  entries = {}
+  try:
+    f = open(cache_file)
+    try:
+      for line in f:
+        parts = line.rstrip('\n').rsplit('\t', 1)
+        if len(parts) == 2:
+          entries[parts[0]] = parts[1]
+    finally:
+      f.close()
+  except (IOError, OSError):
+    pass
+  return entries
+
+def _WriteCache(cache_file, key, path):
+  """ Remember the wingdb directory for the given key.  Errors are ignored
+  since the cache is only an optimization. """
+  
+  entries = _ReadCache(cache_file)
+  entries[key] = path
+  tmpname = '%s.%i.tmp' % (cache_file, os.getpid())
+  try:
+    f = open(tmpname, 'w')
+    try:
+      for entry in entries.items():
+        f.write('%s\t%s\n' % entry)
+    finally:
+      f.close()
+    if sys.platform == 'win32' and os.path.exists(cache_file):
+      os.remove(cache_file)
+    os.rename(tmpname, cache_file)
+  except (IOError, OSError):
+    try:
+      os.remove(tmpname)
+    except OSError:
+      pass
+
+# Held while connecting to the IDE once connecting in the background
+# has started, so Ensure() doesn't try to connect at the same time
+_gConnectLock = None
+
+def _ConnectToClient(debugger):
+  """ Connect the debugger to the IDE if it isn't connected.  Waits for
+  any attempt in progress on the background thread, which may connect. """
+  
+  lock = _gConnectLock
+  if lock is None:
+    debugger.ConnectToClient()
+    return
+  lock.acquire()
+  try:
+    if debugger.ChannelClosed():
+      debugger.ConnectToClient()
+  finally:
+    lock.release()
+
+def _ConnectInBackground(debugger, max_delay):
+  """ Connect the debugger to the IDE from a daemon thread, retrying with
+  exponential backoff until connected, the IDE attaches, or debugging
+  stops. """
+  
+  global _gConnectLock
+  import threading
+  import time
+  
+  if _gConnectLock is None:
+    _gConnectLock = threading.Lock()
+  
+  def connect():
+    delay = 0.5
+    while debugger.DebugActive() and debugger.ChannelClosed():
+      try:
+        _ConnectToClient(debugger)
+      except Exception:
+        pass
+      if not debugger.ChannelClosed():
+        break
+      time.sleep(delay)
+      delay = min(delay * 2, max_delay)
+      
+  thread = threading.Thread(target=connect, name='wingdbstub-connect')
+  thread.setDaemon(True)
+  thread.start()
+  return thread
+
+def _AcceptsArg(func, name):
+  """ Check whether func takes the given keyword argument, without calling
+  it.  Returns 0 if that can't be determined. """
+  
+  import inspect
+  try:
+    if hasattr(inspect, 'signature'):
+      return name in inspect.signature(func).parameters
+    return name in inspect.getargspec(func)[0]
+  except (TypeError, ValueError):
+    return 0
+
+def _ImportWingdb(winghome, user_settings=None):
+  """ Find & import wingdb module.  The directory it is found in is
+  remembered in the cache file, so later runs don't need to search. """
+  
+  cache_file = os.environ.get('WINGDB_CACHEFILE', kCacheFile)
+  key = None
+  cached = None
+  if cache_file:
+    cache_file = os.path.expanduser(cache_file)
+    key = _GetCacheKey(winghome, user_settings)
+    cached = _ReadCache(cache_file).get(key)
+    if cached is not None:
+      try:
+        return _LoadWingdb(cached)
+      except ImportError:
+        pass
+    
+  for path in _FindWingdbDirs(winghome, user_settings):
     try:
-      f, p, d = imp.find_module('wingdb', [path])
+      wingdb = _LoadWingdb(path)
+    except ImportError:
+      continue
+    if key is not None and path != cached:
+      _WriteCache(cache_file, key, path)
+    return wingdb
+
+#------------------------------------------------------------------------
+# Debugging child processes
+
+_kBootstrapCode = """\
+# Written by wingdbstub.py to set up debugging in Python child processes
+import os
+import sys
+
+_stub_dir = os.environ.get('WINGDB_STUBDIR')
+if _stub_dir:
+  sys.path.insert(0, _stub_dir)
+  try:
+    try:
+      import wingdbstub
+    except Exception:
+      pass
+  finally:
+    sys.path.remove(_stub_dir)
+
+# Run the sitecustomize module that this one hides, if any
+_boot_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or '.') != _boot_dir]
+_this_module = sys.modules.pop('sitecustomize')
+try:
+  import sitecustomize
+except ImportError:
+  sys.modules['sitecustomize'] = _this_module
+"""
+
+_gChildHooksInstalled = 0
+_gPendingChild = 0
+_gAttachSignal = None
+_gPrevAttachHandler = None
+_gInheritedDebuggers = []
+
+def _GetProcessLabel():
+  """ Get the label used for this process in log file names. """
+  
+  if sys.argv and sys.argv[0]:
+    name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+  else:
+    name = 'python'
+  return '%s-%i' % (name, os.getpid())
+
+def _InstallBootstrap():
+  """ Write the sitecustomize module that imports this module in Python
+  child processes, and add its directory to PYTHONPATH.  Nothing is done
+  in a child whose environment already has both, as set up by its
+  parent. """
+  
+  boot_dir = os.path.expanduser(os.environ.get('WINGDB_BOOTSTRAPDIR', kBootstrapDir))
+  stub_dir = os.path.dirname(os.path.abspath(__file__))
+  path = os.environ.get('PYTHONPATH')
+  if (os.environ.get('WINGDB_STUBDIR') == stub_dir and path and
+      boot_dir in path.split(os.pathsep)):
+    return
+  
+  filename = os.path.join(boot_dir, 'sitecustomize.py')
+  try:
+    f = open(filename)
+    try:
+      current = f.read()
+    finally:
+      f.close()
+  except (IOError, OSError):
+    current = None
+  if current != _kBootstrapCode:
+    try:
+      if not os.path.isdir(boot_dir):
+        os.makedirs(boot_dir)
+      tmpname = '%s.%i.tmp' % (filename, os.getpid())
+      f = open(tmpname, 'w')
       try:
-        return imp.load_module('wingdb', f, p, d)
+        f.write(_kBootstrapCode)
       finally:
-        if f is not None:
+        f.close()
+      if sys.platform == 'win32' and os.path.exists(filename):
+        os.remove(filename)
+      os.rename(tmpname, filename)
+    except (IOError, OSError):
+      return
+    
+  os.environ['WINGDB_STUBDIR'] = stub_dir
+  if not path:
+    os.environ['PYTHONPATH'] = boot_dir
+  elif boot_dir not in path.split(os.pathsep):
+    os.environ['PYTHONPATH'] = boot_dir + os.pathsep + path
+
+def _RegisterAfterFork(func):
+  """ Arrange for func to be called in the child after os.fork(). """
+  
+  if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=func)
+  elif hasattr(os, 'fork'):
+    real_fork = os.fork
+    def fork():
+      pid = real_fork()
+      if pid == 0:
+        func()
+      return pid
+    os.fork = fork
+
+def _ForgetAtExit(obj):
+  """ Remove the exit handlers that are methods of obj or called with it. """
+  
+  import atexit
+  if hasattr(atexit, 'unregister'):
+    for name in dir(obj):
+      try:
+        method = getattr(obj, name)
+      except Exception:
+        continue
+      if callable(method):
+        atexit.unregister(method)
+  else:
+    atexit._exithandlers[:] = [
+      (func, args, kwargs) for func, args, kwargs in atexit._exithandlers
+      if getattr(func, 'im_self', None) is not obj and
+      not [arg for arg in args if arg is obj]]
+
+def _AfterFork():
+  """ Called in the child after os.fork().  The debugger and connection
+  inherited from the parent belong to the parent, so stop tracing and wait
+  to be asked to start debugging.
+  
+  The inherited debugger is not stopped, since stopping it would tell the
+  IDE over the connection it shares with the parent that the parent's
+  session has ended.  Its exit handlers would do the same when the child
+  exits, so they are removed.  With tracing off and no handlers left, it
+  is never called again.  It is kept until the child exits rather than
+  cleaned up when collected, and closing the child's copy of its socket
+  then doesn't affect the parent's connection. """
+  
+  global debugger
+  global _gConnectLock
+  # The lock may have been held by a thread that the fork didn't copy
+  _gConnectLock = None
+  if debugger is not None:
+    import threading
+    sys.settrace(None)
+    threading.settrace(None)
+    _ForgetAtExit(debugger)
+    _gInheritedDebuggers.append(debugger)
+    debugger = None
+  _PrepareChild()
+
+def _InstallChildHooks():
+  """ Arrange for child processes to be set up for debugging. """
+  
+  global _gChildHooksInstalled
+  if _gChildHooksInstalled:
+    return
+  _gChildHooksInstalled = 1
+  os.environ['WINGDB_MULTIPROCESS'] = '1'
+  _RegisterAfterFork(_AfterFork)
+
+  # Children that are new Python processes, including multiprocessing
+  # workers that aren't forked, import this module at startup
+  _InstallBootstrap()
+  
+def _StartChildDebugging():
+  """ Start debugging in a child process, and put back the handler that
+  the attach signal had before. """
+  
+  global _gPendingChild
+  if not _gPendingChild:
+    return
+  _gPendingChild = 0
+  _StartDebugging(child=1)
+  if _gAttachSignal is not None:
+    import signal
+    try:
+      if signal.getsignal(_gAttachSignal) == _OnAttachSignal:
+        signal.signal(_gAttachSignal, _gPrevAttachHandler)
+    except ValueError:
+      # Not the main thread, so the handler stays and only chains
+      pass
+
+def _OnAttachSignal(signum, frame):
+  """ Handler for the attach signal, which also calls the handler that was
+  installed before it, if any.  Once debugging has started, the signal is
+  no longer an attach request, so the handler that was there before is put
+  back and the signal is handled as it would have been without this
+  module, which for the default action usually terminates the process. """
+  
+  import signal
+  prev_handler = _gPrevAttachHandler
+  if _gPendingChild:
+    _StartChildDebugging()
+    if callable(prev_handler):
+      prev_handler(signum, frame)
+    return
+  
+  # Debugging was started by Ensure() on a thread that couldn't put back
+  # the previous handler.  Handlers not set from Python can't be put back.
+  if prev_handler is None:
+    return
+  signal.signal(signum, prev_handler)
+  if callable(prev_handler):
+    prev_handler(signum, frame)
+  elif prev_handler == signal.SIG_DFL:
+    os.kill(os.getpid(), signum)
+
+def _PrepareChild():
+  """ Get ready to start debugging in a child process when asked to. """
+  
+  global _gPendingChild
+  global _gAttachSignal
+  global _gPrevAttachHandler
+  _gPendingChild = 1
+  _InstallChildHooks()
+  signame = os.environ.get('WINGDB_ATTACHSIGNAL', kAttachSignal)
+  if signame:
+    import signal
+    signum = getattr(signal, signame, None)
+    if signum is not None:
+      try:
+        if signal.getsignal(signum) != _OnAttachSignal:
+          prev_handler = signal.signal(signum, _OnAttachSignal)
+          _gAttachSignal = signum
+          _gPrevAttachHandler = prev_handler
+      except ValueError:
+        # Not the main thread
+        pass
+
+#------------------------------------------------------------------------
+# Sampling profiler
+
+class CSamplingProfiler:
+  """ Samples the stacks of all threads from a background thread and
+  writes the number of samples of each stack to a file.  Only the sampling
+  thread changes the samples, so dumps requested from signal handlers are
+  done on the next sample. """
+  
+  def __init__(self, filename, format, interval, dump_interval):
+    self.fFilename = filename
+    self.fFormat = format
+    self.fInterval = interval
+    self.fDumpInterval = dump_interval
+    self.fCounts = {}
+    self.fNames = {}
+    self.fDumpRequested = 0
+    self.fStopped = 0
+    self.fThread = None
+    
+  def Start(self):
+    """ Start sampling. """
+    
+    import threading
+    self.fThread = threading.Thread(target=self.__Run, name='wingdbstub-profiler')
+    self.fThread.setDaemon(True)
+    self.fThread.start()
+    
+  def Stop(self):
+    """ Stop sampling and write the samples collected. """
+    
+    if self.fThread is None or self.fStopped:
+      return
+    self.fStopped = 1
+    self.fThread.join(self.fInterval + 1.0)
+    self.Dump()
+    
+  def RequestDump(self, *args):
+    """ Write the samples on the next sample.  Also used as the handler
+    for the dump signal. """
+    
+    self.fDumpRequested = 1
+    
+  def Dump(self):
+    """ Write the samples collected so far, replacing the file only once
+    it has been written completely. """
+    
+    counts = self.fCounts.copy()
+    tmpname = '%s.%i.tmp' % (self.fFilename, os.getpid())
+    try:
+      if self.fFormat == 'pstats':
+        import marshal
+        f = open(tmpname, 'wb')
+        try:
+          marshal.dump(self.__GetStats(counts), f)
+        finally:
           f.close()
-      break
-    except ImportError:
+      else:
+        f = open(tmpname, 'w')
+        try:
+          for stack, count in counts.items():
+            names = [self.__GetName(code) for code in reversed(stack)]
+            f.write('%s %i\n' % (';'.join(names), count))
+        finally:
+          f.close()
+      if sys.platform == 'win32' and os.path.exists(self.fFilename):
+        os.remove(self.fFilename)
+      os.rename(tmpname, self.fFilename)
+    except (IOError, OSError):
+      try:
+        os.remove(tmpname)
+      except OSError:
+        pass
+      
+  def __Run(self):
+    import threading
+    import time
+    
+    get_frames = sys._current_frames
+    my_ident = threading.currentThread().ident
+    counts = self.fCounts
+    next_dump = time.time() + self.fDumpInterval
+    while not self.fStopped:
+      time.sleep(self.fInterval)
+      for ident, frame in get_frames().items():
+        if ident == my_ident:
+          continue
+        # Stacks are kept as tuples of code objects, innermost first,
+        # and only turned into names when written
+        stack = []
+        while frame is not None:
+          stack.append(frame.f_code)
+          frame = frame.f_back
+        stack = tuple(stack)
+        counts[stack] = counts.get(stack, 0) + 1
+      frame = None
+      if self.fDumpRequested or (self.fDumpInterval > 0 and time.time() >= next_dump):
+        self.fDumpRequested = 0
+        next_dump = time.time() + self.fDumpInterval
+        self.Dump()
+        
+  def __GetName(self, code):
+    name = self.fNames.get(code)
+    if name is None:
+      name = '%s (%s:%i)' % (code.co_name, code.co_filename, code.co_firstlineno)
+      name = self.fNames[code] = name.replace(';', ',')
+    return name
+  
+  def __GetStats(self, counts):
+    """ Convert the samples to the dict saved by the profile module, from
+    (filename, lineno, funcname) to (primitive calls, calls, total time,
+    cumulative time, callers).  Calls are the number of samples that a
+    function was seen in and times are estimated from the sampling
+    interval. """
+    
+    stats = {}
+    for stack, count in counts.items():
+      elapsed = count * self.fInterval
+      funcs = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+      seen = {}
+      for i, func in enumerate(funcs):
+        entry = stats.get(func)
+        if entry is None:
+          entry = stats[func] = [0, 0, 0.0, 0.0, {}]
+        if i == 0:
+          entry[2] += elapsed
+        # Count recursive functions once per sample
+        if func not in seen:
+          seen[func] = 1
+          entry[0] += count
+          entry[1] += count
+          entry[3] += elapsed
+        if i + 1 < len(funcs):
+          callers = entry[4]
+          caller = callers.get(funcs[i+1], (0, 0, 0.0, 0.0))
+          callers[funcs[i+1]] = (caller[0] + count, caller[1] + count,
+                                 caller[2] + (i == 0 and elapsed or 0.0),
+                                 caller[3] + elapsed)
+    for func, entry in stats.items():
+      stats[func] = tuple(entry)
+    return stats
+
+_gPrevProfileHandler = None
+
+def _StopProfiling():
+  """ Stop the profiler of this process and write its samples.  Called at
+  exit, so a forked child never writes the samples inherited from its
+  parent to the parent's file. """
+  
+  if profiler is not None:
+    profiler.Stop()
+
+def _OnProfileSignal(signum, frame):
+  """ Handler for the dump signal, which also calls the handler that was
+  installed before it, if any. """
+  
+  if profiler is not None:
+    profiler.RequestDump()
+  if callable(_gPrevProfileHandler):
+    _gPrevProfileHandler(signum, frame)
+
+def _AfterForkProfiling():
+  """ Called in the child after os.fork().  The sampling thread doesn't
+  survive the fork and the samples so far are the parent's, so sample the
+  child with a new profiler. """
+  
+  global profiler
+  if profiler is not None:
+    # Never leave the parent's profiler to be stopped at exit, even if
+    # starting a new one fails
+    profiler = None
+    _StartProfiling(child=1)
+
+def _StartProfiling(child=0):
+  """ Start the sampling profiler with the configured settings.  In a
+  forked child, the exit and signal handlers are inherited from the
+  parent.  Errors are ignored unless configured to exit on failure. """
+  
+  global profiler
+  global _gPrevProfileHandler
+  exit_on_fail = 0
+  
+  try:
+    exit_on_fail = os.environ.get('WINGDB_EXITONFAILURE', kExitOnFailure)
+    
+    format = os.environ.get('WINGDB_PROFILEFORMAT', kProfileFormat)
+    if format not in ('collapsed', 'pstats'):
+      raise ValueError('Unknown profile format %r' % format)
+    filename = os.environ.get('WINGDB_PROFILEFILE', kProfileFile)
+    filename = os.path.abspath(filename % {'pid': os.getpid(), 'format': format})
+    interval = float(os.environ.get('WINGDB_PROFILEINTERVAL', kProfileInterval))
+    dump_interval = float(os.environ.get('WINGDB_PROFILEDUMPINTERVAL', kProfileDumpInterval))
+    
+    profiler = CSamplingProfiler(filename, format, interval, dump_interval)
+    profiler.Start()
+    os.environ['WINGDB_ACTIVE'] = str(os.getpid())
+    if child:
+      return
+    
+    import atexit
+    atexit.register(_StopProfiling)
+    _RegisterAfterFork(_AfterForkProfiling)
+    signame = os.environ.get('WINGDB_PROFILESIGNAL', kProfileSignal)
+    if signame:
+      import signal
+      signum = getattr(signal, signame, None)
+      if signum is not None:
+        try:
+          prev_handler = signal.signal(signum, _OnProfileSignal)
+        except ValueError:
+          # Not the main thread
+          pass
+        else:
+          _gPrevProfileHandler = prev_handler
+    
+  except:
+    if exit_on_fail:
+      raise
+    else:
       pass
 
 #------------------------------------------------------------------------
-# Start debugging if not disabled and this module has never been imported
-# before
-if not has_key(os.environ, 'WINGDB_ACTIVE'):
-  debugger = None
-if not kWingDebugDisabled and not has_key(os.environ, 'WINGDB_DISABLED') and \
-   not has_key(os.environ, 'WINGDB_ACTIVE'):
+# Start debugging
 
+def _StartDebugging(child=0):
+  """ Start the debugger with the configured settings.  Errors are
+  ignored unless configured to exit on failure. """
+  
+  global debugger
   exit_on_fail = 0
   
   try:
@@ -185,6 +835,8 @@ if not kWingDebugDisabled and not has_key(os.environ, 'WINGDB_DISABLED') and \
     logfile = os.environ.get('WINGDB_LOGFILE', kLogFile)
     if logfile == '-' or logfile == None or len(logfile.strip()) == 0:
       logfile = None
+    elif child and logfile not in ('<stderr>', '<stdout>'):
+      logfile = '%s.%s' % (logfile, _GetProcessLabel())
 
     very_verbose_log = os.environ.get('WINGDB_LOGVERYVERBOSE', kLogVeryVerbose)
     if type(very_verbose_log) == type('') and very_verbose_log.strip() == '':
@@ -202,6 +854,9 @@ if not kWingDebugDisabled and not has_key(os.environ, 'WINGDB_DISABLED') and \
     # Check if running embedded script
     embedded = int(os.environ.get('WINGDB_EMBEDDED', kEmbedded))
   
+    # Check whether to connect in the background
+    background = int(os.environ.get('WINGDB_BACKGROUNDCONNECT', kBackgroundConnect))
+  
     # Obtain debug password file search path
     if has_key(os.environ, 'WINGDB_PWFILEPATH'):
       pwfile_path = os.environ['WINGDB_PWFILEPATH'].split(os.pathsep)
@@ -231,10 +886,22 @@ if not kWingDebugDisabled and not has_key(os.environ, 'WINGDB_DISABLED') and \
                                         pwfile_path=pwfile_path,
                                         pwfile_name=pwfile_name,
                                         autoquit=not embedded)
-    debugger.StartDebug(stophere=0)
-    os.environ['WINGDB_ACTIVE'] = "1"
-    if debugger.ChannelClosed():
-      raise ValueError('Not connected')
+    if background:
+      # Start tracing and listening for attach requests without waiting
+      # for a connection to the IDE.  Older debuggers always connect when
+      # starting.
+      if _AcceptsArg(debugger.StartDebug, 'connect'):
+        debugger.StartDebug(stophere=0, connect=0)
+      else:
+        debugger.StartDebug(stophere=0)
+      os.environ['WINGDB_ACTIVE'] = str(os.getpid())
+      if debugger.ChannelClosed():
+        _ConnectInBackground(debugger, kConnectRetryMax)
+    else:
+      debugger.StartDebug(stophere=0)
+      os.environ['WINGDB_ACTIVE'] = str(os.getpid())
+      if debugger.ChannelClosed():
+        raise ValueError('Not connected')
     
   except:
     if exit_on_fail:
@@ -242,14 +909,34 @@ if not kWingDebugDisabled and not has_key(os.environ, 'WINGDB_DISABLED') and \
     else:
       pass
 
+# Start debugging if not disabled and this module has never been imported
+# before
+if not has_key(os.environ, 'WINGDB_ACTIVE') or _kChildProcess:
+  debugger = None
+  profiler = None
+if not _kSkipDebug and not kWingDebugDisabled:
+  if os.environ.get('WINGDB_MODE', kMode) == 'profile':
+    _StartProfiling()
+  elif _kChildProcess:
+    _PrepareChild()
+  else:
+    _StartDebugging()
+    if os.environ.get('WINGDB_MULTIPROCESS', str(kMultiProcess)) not in ('', '0'):
+      _InstallChildHooks()
+
 def Ensure(require_connection=1, require_debugger=1):
   """ Ensure the debugger is started and attempt to connect to the IDE if
   not already connected.  Will raise a ValueError if:
   
   * the require_connection arg is true and the debugger is unable to connect
   * the require_debugger arg is true and the debugger cannot be loaded
+  
+  In a child process of a multi-process debug session, this starts
+  debugging in the child.
   """
   
+  if debugger is None:
+    _StartChildDebugging()
   if debugger is None:
     if require_debugger:
       raise ValueError("No debugger")
@@ -258,7 +945,7 @@ def Ensure(require_connection=1, require_debugger=1):
   if not debugger.DebugActive():
     debugger.StartDebug()
   elif debugger.ChannelClosed():
-    debugger.ConnectToClient()
+    _ConnectToClient(debugger)
     
   if require_connection and debugger.ChannelClosed():
     raise ValueError('Not connected')